@@ -0,0 +1,156 @@
+# -*- coding: UTF-8 -*-
+""" 异常告警：按错误指纹去重，突发的重复错误合并为定期摘要，在后台线程中限流发送
+"""
+import re
+import time
+import hashlib
+import logging
+import threading
+from .dingtalk import Dingtalk
+from .http import TokenBucket
+from .wxwork import WXWork
+
+
+def fingerprint(source: str, err: BaseException) -> str:
+    """错误指纹：来源 + 异常类型 + 去除数字和引号内容后的异常信息
+
+    Args:
+        source: 错误来源，如handle_submit
+        err: 异常
+
+    Returns:
+        sha1摘要的前12位
+    """
+    message = re.sub(r"\d+", "#", re.sub(r"([\"']).*?\1", "?", str(err)))
+    key = f"{source}|{type(err).__name__}|{message}"
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+class Alerter:
+    """告警汇总器
+
+    1. 新出现（或超过cooldown秒未发送过）的错误立即发送
+    2. 重复的错误在window秒内合并，附带次数和相关用户发送摘要
+    3. 钉钉、企业微信分别限流，发送在后台线程中进行，不阻塞任务处理
+    """
+
+    _dingtalk: Dingtalk = None
+    _wxwork: WXWork = None
+    _window = 60
+    _cooldown = 300
+    _to_stdout = False
+
+    def __init__(
+        self,
+        dingtalk: Dingtalk,
+        wxwork: WXWork,
+        window: float = 60,
+        cooldown: float = 300,
+        rate: float = 2,
+        burst: int = 5,
+        to_stdout: bool = False,
+    ):
+        """
+        Args:
+            dingtalk: 钉钉客户端（发送至调试通知群）
+            wxwork: 企业微信客户端（发送至管理员）
+            window: 摘要间隔（秒）
+            cooldown: 同一错误立即发送的最小间隔（秒）
+            rate: 每个通道每分钟最多发送的告警数
+            burst: 每个通道允许连续发送的告警数
+            to_stdout: 是否将告警重定向到stdout
+        """
+        self._dingtalk = dingtalk
+        self._wxwork = wxwork
+        self._window = window
+        self._cooldown = cooldown
+        self._to_stdout = to_stdout
+        self._buckets = {
+            "dingtalk": TokenBucket(rate / 60, burst),
+            "wxwork": TokenBucket(rate / 60, burst),
+        }
+        self._lock = threading.Lock()
+        self._pending: dict[str, dict] = {}
+        self._sent: dict[str, float] = {}
+        self._wakeup = threading.Event()
+        threading.Thread(target=self._run, name="alert", daemon=True).start()
+
+    def report(self, source: str, err: BaseException, user_id: str = ""):
+        """记录一个错误（立即返回）
+
+        Args:
+            source: 错误来源，如handle_submit
+            err: 异常
+            user_id: 相关用户
+        """
+        key = fingerprint(source, err)
+        with self._lock:
+            item = self._pending.get(key)
+            if item:
+                item["count"] += 1
+                item["message"] = str(err)
+            else:
+                item = self._pending[key] = {
+                    "source": source,
+                    "message": str(err),
+                    "count": 1,
+                    "users": [],
+                }
+            if user_id and user_id not in item["users"]:
+                item["users"].append(user_id)
+            urgent = time.monotonic() - self._sent.get(key, -self._cooldown) >= self._cooldown
+        if urgent:
+            self._wakeup.set()
+
+    def flush(self):
+        """立即发送所有待发送的告警"""
+        logger = logging.getLogger(__name__)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            now = time.monotonic()
+            for key in pending:
+                self._sent[key] = now
+            # 清理过期的发送记录
+            self._sent = {
+                key: sent
+                for key, sent in self._sent.items()
+                if now - sent < self._cooldown
+            }
+        if not pending:
+            return
+        lines = []
+        for item in pending.values():
+            lines.append(
+                "({}) {}{}".format(
+                    ",".join(item["users"]) or "unknown",
+                    item["message"],
+                    f" [{item['source']} x{item['count']}]" if item["count"] > 1 else "",
+                )
+            )
+        content = "\n\n".join(lines)
+        logger.debug("alert: %s", content)
+        for channel, send in [
+            (
+                "dingtalk",
+                lambda: self._dingtalk.send_markdown(
+                    "[RM] 处理异常", content, to_debug=True, to_stdout=self._to_stdout
+                ),
+            ),
+            (
+                "wxwork",
+                lambda: self._wxwork.send_text(
+                    content, [], to_debug=True, to_stdout=self._to_stdout
+                ),
+            ),
+        ]:
+            try:
+                self._buckets[channel].acquire()
+                send()
+            except Exception:
+                logger.error("%s alert failed", channel, exc_info=True)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._window)
+            self._wakeup.clear()
+            self.flush()
@@ -76,12 +76,13 @@ class Archive:
             self._password = password
             logger.info('Archive password set.')
 
-    def archive(self, src: str, archive_path: str) -> bool:
+    def archive(self, src: str, archive_path: str, volume: int = 0) -> bool:
         ''' 忽略目录结构压缩/加密压缩{src}目录，保存至{archive_path}
 
         Args:
             src: 源目录
             archive_path: 压缩包路径
+            volume: 分卷大小（字节），为0时不分卷；分卷文件名为{name}.partN.rar
 
         Returns:
             bool: 压缩是否成功
@@ -91,7 +92,7 @@ class Archive:
         '''
         logger = logging.getLogger(__name__)
         logger.debug('args: %s', {
-            'src': src, 'archive_path': archive_path
+            'src': src, 'archive_path': archive_path, 'volume': volume
         })
         if not os.path.isdir(src):
             raise FileNotFoundError('invalid arg: src')
@@ -108,16 +109,20 @@ class Archive:
                 bin_path = self._bin_path['rar']
             else:
                 raise OSError('Unsupported platform')
-            p = subprocess.run([
+            args = [
                 bin_path,
                 'a',        # 添加文件到压缩文档
                 '-ep',      # 从名称里排除路径
                 '-r',       # 递归子目录
                 '-o+',      # 设置覆盖模式
                 '-inul',    # 禁用所有消息
-                f"-hp{self._password}" \
-                if self._password else '--',  # 加密文件数据及文件头
-                # -- 停止参数扫描
+            ]
+            if self._password:
+                args.append(f"-hp{self._password}")  # 加密文件数据及文件头
+            if volume:
+                args.append(f"-v{max(volume // 1024, 1)}k")  # 创建分卷
+            p = subprocess.run(args + [
+                '--',       # 停止参数扫描
                 archive_path,
                 os.path.join(src, '*')
             ], capture_output=True)
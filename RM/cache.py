@@ -0,0 +1,68 @@
+# -*- coding: UTF-8 -*-
+""" 接口响应缓存：进程内保存，数据版本保存在Redis中，任一进程修改数据后所有进程的缓存失效
+"""
+import copy
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+
+class ResponseCache:
+    """按key缓存加载结果，满足以下任一条件时重新加载：
+
+    1. 超过ttl秒
+    2. 数据版本（version()的返回值）已变化
+    """
+
+    _ttl = 10
+    _max_entries = 256
+
+    def __init__(
+        self, version: Callable[[], str], ttl: float = 10, max_entries: int = 256
+    ):
+        """
+        Args:
+            version: 获取当前数据版本
+            ttl: 缓存有效期（秒）
+            max_entries: 最大缓存数量，超出时淘汰最久未使用的缓存
+        """
+        self._version = version
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[str, float, str, object]] = OrderedDict()
+
+    def get(self, key: tuple, loader: Callable[[], object]) -> tuple[object, str]:
+        """获取缓存（返回副本，调用方可直接修改）
+
+        Args:
+            key: 缓存键，如(接口路径, 用户ID, 参数)
+            loader: 缓存失效时调用，返回值需可JSON序列化
+
+        Returns:
+            (数据, ETag)
+        """
+        logger = logging.getLogger(__name__)
+        version = self._version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(key)
+                logger.debug("hit: %s", key)
+                return copy.deepcopy(entry[3]), entry[2]
+        value = loader()
+        etag = hashlib.sha1(
+            json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode()
+        ).hexdigest()
+        with self._lock:
+            self._entries[key] = (version, now + self._ttl, etag, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        logger.debug("miss: %s", key)
+        return value, etag
@@ -0,0 +1,94 @@
+# -*- coding: UTF-8 -*-
+''' 邮件指令解析：标题中的参数（--sender）及正文中的指令行（加急、组员、指定）
+
+仅做语法解析，不访问数据库；指令中的用户由validator解析及校验
+'''
+from typing import Callable, Iterable
+import re
+from .types import *
+
+# 标题按空格分隔
+_SUBJECT_SPLIT = re.compile(' +')
+# 有人习惯打冒号，与空格一并视为指令名与内容的分隔
+_LINE_SPLIT = re.compile('[ ：]+')
+# 全角逗号、半角逗号统一视为列表分隔
+_LIST_SPLIT = re.compile('[、，,]+')
+
+
+def _urgent(command: Mail_Command, value: str):
+    command['urgent'] = value in ('是', '1')
+
+
+def _members(command: Mail_Command, value: str):
+    command['members'] = [member.strip() for member in _LIST_SPLIT.split(value) if member.strip()]
+
+
+def _force(command: Mail_Command, value: str):
+    command['force'] = value
+
+
+# 正文指令：指令名 -> 处理函数(command, 内容)
+# 注意：如果指令重复，以最后一条为准
+DIRECTIVES: dict[str, Callable[[Mail_Command, str], None]] = {
+    '加急': _urgent,
+    '组员': _members,
+    '指定': _force,
+}
+
+
+def parse_subject(subject: str) -> str:
+    ''' 读取标题中的"-s/--sender userid"参数
+
+    Args:
+        subject: 邮件标题
+
+    Returns:
+        指定的发件人ID，未指定时返回空字符串
+    '''
+    sender = ''
+    tokens = _SUBJECT_SPLIT.split(subject.strip())
+    for idx, token in enumerate(tokens):
+        if token in ('-s', '--sender'):
+            following = tokens[idx + 1] if idx + 1 < len(tokens) else ''
+            sender = '' if following.startswith('-') else following
+        elif token.startswith('--sender='):
+            sender = token[len('--sender='):]
+        elif token.startswith('-s') and not token.startswith('--'):
+            sender = token[2:]
+    return sender
+
+
+def parse(subject: str, content: str) -> Mail_Command:
+    ''' 解析邮件标题及正文中的指令，无法识别的行将被忽略
+
+    Args:
+        subject: 邮件标题
+        content: 邮件内容
+
+    Returns:
+        Mail_Command
+    '''
+    command: Mail_Command = {
+        'sender': parse_subject(subject), 'urgent': False, 'members': [], 'force': ''
+    }
+    for line in content.splitlines():
+        # 按第一个分隔符分隔1次，长度不为2的指令行将被忽略
+        cmds = _LINE_SPLIT.split(line.strip(), 1)
+        if len(cmds) != 2 or not cmds[1]:
+            continue
+        handler = DIRECTIVES.get(cmds[0])
+        if handler:
+            handler(command, cmds[1].strip())
+    return command
+
+
+def parse_many(mails: Iterable[tuple[str, str]]) -> list[Mail_Command]:
+    ''' 批量解析邮件指令
+
+    Args:
+        mails: (邮件标题, 邮件内容)
+
+    Returns:
+        list[Mail_Command]：与输入顺序一致
+    '''
+    return [parse(subject, content) for subject, content in mails]
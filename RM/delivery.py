@@ -0,0 +1,275 @@
+# -*- coding: UTF-8 -*-
+""" 邮件附件的投递规划：按大小限制选择直接附加、分卷发送或下载链接
+"""
+import os
+import re
+import hmac
+import json
+import base64
+import hashlib
+import logging
+import datetime
+import shutil
+from walkdir import filtered_walk, file_paths
+from .archive import Archive
+from .types import *
+
+
+class Planner:
+    """投递规划器，在发送前检查附件总大小，避免超限邮件在完整上传后才被退回"""
+
+    _archive: Archive = None
+    _storage = ""
+    _size_limit = 0
+    _max_parts = 5
+    _link_url = ""
+    _link_secret = ""
+    _link_ttl = 72
+
+    def __init__(
+        self,
+        archive: Archive,
+        storage: str,
+        size_limit: int = 0,
+        max_parts: int = 5,
+        link_url: str = "",
+        link_secret: str = "",
+        link_ttl: int = 72,
+    ):
+        """初始化投递规划器
+
+        Args:
+            archive: 压缩工具
+            storage: 数据文件夹（使用其中的outbox和download目录）
+            size_limit: 单封邮件的附件大小上限（字节），为0时不检查
+            max_parts: 分卷发送时的最大邮件数，超过时改用下载链接
+            link_url: 下载链接前缀（manage的/utils/download）
+            link_secret: 下载链接的签名密钥，为空时禁用下载链接
+            link_ttl: 下载链接有效期（小时）
+
+        Raises:
+            TypeError/ValueError: 如果参数无效
+        """
+        logger = logging.getLogger(__name__)
+        if not isinstance(archive, Archive):
+            raise TypeError("invalid arg: archive")
+        if not os.path.isdir(storage):
+            raise ValueError("invalid arg: storage")
+        if not isinstance(size_limit, int) or size_limit < 0:
+            raise ValueError("invalid arg: size_limit")
+        if not isinstance(max_parts, int) or max_parts < 1:
+            raise ValueError("invalid arg: max_parts")
+        if not isinstance(link_ttl, int) or link_ttl < 1:
+            raise ValueError("invalid arg: link_ttl")
+        self._archive = archive
+        self._storage = storage
+        self._size_limit = size_limit
+        self._max_parts = max_parts
+        self._link_url = link_url.rstrip("/")
+        self._link_secret = link_secret
+        self._link_ttl = link_ttl
+        for child_dir in ["outbox", "download"]:
+            if not os.path.isdir(os.path.join(storage, child_dir)):
+                os.mkdir(os.path.join(storage, child_dir))
+        if size_limit:
+            logger.info("size_limit: %.1fMB", size_limit / 1048576)
+        if link_url and link_secret:
+            logger.info("download link enabled (%sh).", link_ttl)
+
+    def plan(self, work_path: str, codes: str, warnings: list[str]) -> Delivery:
+        """将{work_path}打包为{codes}.rar，并按大小限制规划投递方式：
+
+        1. 未超限：一封邮件附加压缩包（压缩失败时附加原始文件）
+        2. 超限：按大小限制分卷，每封邮件附加一个分卷
+        3. 分卷失败或分卷数超过max_parts：邮件不带附件，改为附上限时下载链接
+
+        Args:
+            work_path: 待发送的项目目录
+            codes: 项目编号
+            warnings: 追加压缩失败等告警信息
+
+        Returns:
+            Delivery
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("args: %s", {"work_path": work_path, "codes": codes})
+        self.purge()
+
+        outbox_path = os.path.join(
+            self._storage,
+            "outbox",
+            "{}_{}".format(datetime.datetime.now().timestamp(), codes),
+        )
+        os.mkdir(outbox_path)
+        archive_path = os.path.join(outbox_path, f"{codes}.rar")
+        archived = self._archive.archive(work_path, archive_path)
+        if archived:
+            attachments = [archive_path]
+        else:
+            # 压缩失败时复制原始文件，保证入队后附件不受后续文件操作（如加密）影响
+            warnings.append(f'压缩失败："{os.path.basename(work_path)}"')
+            attachments = [
+                shutil.copy(file_path, outbox_path)
+                for file_path in file_paths(filtered_walk(work_path))
+            ]
+        size = sum([os.path.getsize(attachment) for attachment in attachments])
+        logger.info("total size: %.1fMB", size / 1048576)
+
+        ret: Delivery = {"parts": [], "links": []}
+        if not self._size_limit or size <= self._size_limit:
+            ret["parts"].append({"attachments": attachments, "path": outbox_path})
+            logger.debug("return: %s", ret)
+            return ret
+
+        # 超限时优先分卷，分卷大小预留5%给MIME编码以外的开销
+        logger.warning("size exceeded: %.1fMB", size / 1048576)
+        if archived and (size // int(self._size_limit * 0.95)) < self._max_parts:
+            os.remove(archive_path)
+            if self._archive.archive(
+                work_path, archive_path, volume=int(self._size_limit * 0.95)
+            ):
+                volumes = sorted(
+                    [
+                        os.path.join(outbox_path, name)
+                        for name in os.listdir(outbox_path)
+                        if name.endswith(".rar")
+                    ],
+                    key=_volume_index,
+                )
+                if 0 < len(volumes) <= self._max_parts and all(
+                    [os.path.getsize(volume) <= self._size_limit for volume in volumes]
+                ):
+                    # 每个分卷使用独立目录，各自发送完毕后删除
+                    for idx, volume in enumerate(volumes, start=1):
+                        part_path = f"{outbox_path}_{idx}"
+                        os.mkdir(part_path)
+                        ret["parts"].append(
+                            {
+                                "attachments": [shutil.move(volume, part_path)],
+                                "path": part_path,
+                            }
+                        )
+                    shutil.rmtree(outbox_path)
+                    logger.info("split into %s volumes", len(volumes))
+                    logger.debug("return: %s", ret)
+                    return ret
+            warnings.append(f'分卷失败："{codes}"')
+            for name in os.listdir(outbox_path):
+                os.remove(os.path.join(outbox_path, name))
+            if not self._archive.archive(work_path, archive_path):
+                archived = False
+                attachments = [
+                    shutil.copy(file_path, outbox_path)
+                    for file_path in file_paths(filtered_walk(work_path))
+                ]
+
+        # 下载链接
+        if not (self._link_url and self._link_secret):
+            logger.warning("download link disabled, sending oversized attachments")
+            warnings.append("附件超过大小限制")
+            ret["parts"].append({"attachments": attachments, "path": outbox_path})
+            logger.debug("return: %s", ret)
+            return ret
+        expires = int(datetime.datetime.now().timestamp()) + self._link_ttl * 3600
+        download_path = os.path.join(
+            self._storage, "download", "{}_{}".format(expires, codes)
+        )
+        shutil.move(outbox_path, download_path)
+        for attachment in attachments:
+            relpath = os.path.relpath(
+                os.path.join(download_path, os.path.basename(attachment)),
+                self._storage,
+            )
+            ret["links"].append(
+                "{}/{}".format(
+                    self._link_url, sign(relpath, expires, self._link_secret)
+                )
+            )
+        ret["parts"].append({"attachments": [], "path": ""})
+        logger.info("using %s download links", len(ret["links"]))
+        logger.debug("return: %s", ret)
+        return ret
+
+    def link_ttl(self) -> int:
+        """下载链接有效期（小时）"""
+        return self._link_ttl
+
+    def purge(self) -> int:
+        """删除download中已过期的目录
+
+        Returns:
+            删除的目录数量
+        """
+        logger = logging.getLogger(__name__)
+        count = 0
+        now = datetime.datetime.now().timestamp()
+        download_path = os.path.join(self._storage, "download")
+        for name in os.listdir(download_path):
+            expires = name.split("_", 1)[0]
+            if expires.isdigit() and int(expires) < now:
+                shutil.rmtree(os.path.join(download_path, name), ignore_errors=True)
+                logger.info('purged "%s"', name)
+                count += 1
+        return count
+
+
+def sign(relpath: str, expires: int, secret: str) -> str:
+    """生成下载令牌
+
+    Args:
+        relpath: 文件相对于storage的路径
+        expires: 过期时间戳
+        secret: 签名密钥
+
+    Returns:
+        {payload}.{signature}
+    """
+    payload = (
+        base64.urlsafe_b64encode(
+            json.dumps([relpath.replace(os.sep, "/"), expires]).encode("utf-8")
+        )
+        .decode()
+        .rstrip("=")
+    )
+    signature = hmac.new(
+        secret.encode("utf-8"), payload.encode(), hashlib.sha256
+    ).hexdigest()
+    return f"{payload}.{signature}"
+
+
+def verify(token: str, secret: str) -> str | None:
+    """校验下载令牌
+
+    Args:
+        token: 下载令牌
+        secret: 签名密钥
+
+    Returns:
+        文件相对于storage的路径；令牌无效或过期时返回None
+    """
+    logger = logging.getLogger(__name__)
+    if not secret or token.count(".") != 1:
+        return None
+    payload, signature = token.split(".")
+    expected = hmac.new(
+        secret.encode("utf-8"), payload.encode(), hashlib.sha256
+    ).hexdigest()
+    if not hmac.compare_digest(signature, expected):
+        logger.warning("invalid signature")
+        return None
+    try:
+        relpath, expires = json.loads(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+    except ValueError:
+        return None
+    if expires < datetime.datetime.now().timestamp():
+        logger.info("expired token")
+        return None
+    return relpath
+
+
+def _volume_index(path: str) -> int:
+    """分卷排序键：{name}.partN.rar -> N"""
+    re_result = re.search(r"\.part([0-9]+)\.rar$", path)
+    return int(re_result.group(1)) if re_result else 0
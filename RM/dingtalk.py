@@ -1,8 +1,51 @@
 # -*- coding: UTF-8 -*-
 import logging
 import json
+import time
 from dingtalkchatbot.chatbot import DingtalkChatbot, ActionCard, CardItem
 from . import mysql
+from .http import HTTPClient
+from .types import *
+
+
+class PooledChatbot(DingtalkChatbot):
+    ''' 使用共用HTTP客户端发送的DingtalkChatbot（保持长连接，带超时和重试）
+    '''
+
+    def __init__(self, webhook: str, secret: str, http: HTTPClient):
+        super().__init__(webhook=webhook, secret=secret)
+        self.headers = {'Content-Type': 'application/json; charset=utf-8'}
+        self._http = http
+
+    def post(self, data: dict) -> dict:
+        ''' 发送消息，签名刷新和频率限制与DingtalkChatbot.post一致
+
+        Args:
+            data: 消息数据
+
+        Returns:
+            发送结果
+
+        Raises:
+            requests.RequestException: 如果请求失败
+        '''
+        now = time.time()
+        # 加签的时间戳有效期为1小时
+        if now - self.start_time >= 3600 and self.secret is not None and self.secret.startswith('SEC'):
+            self.start_time = now
+            self.update_webhook()
+        # 每个机器人每分钟最多发送20条消息
+        self.queue.put(now)
+        if self.queue.full():
+            elapse_time = now - self.queue.get()
+            if elapse_time < 60:
+                time.sleep(int(60 - elapse_time) + 1)
+        r = self._http.request('POST', self.webhook, headers=self.headers, data=json.dumps(data))
+        try:
+            return r.json()
+        except ValueError:
+            logging.getLogger(__name__).error('invalid response: %s %s', r.status_code, r.text)
+            return {'errcode': 500, 'errmsg': '服务器响应异常'}
 
 
 class Dingtalk:
@@ -13,7 +56,7 @@ class Dingtalk:
     _attend_url = ''
     _interaction_url = ''
 
-    def __init__(self, chatbot: dict | None = None, chatbot_debug: dict | None = None, attend_url: str = '', interaction_url: str = ''):
+    def __init__(self, chatbot: dict | None = None, chatbot_debug: dict | None = None, attend_url: str = '', interaction_url: str = '', http: HTTPClient | None = None):
         ''' 初始化dingtalk的配置
 
         Args:
@@ -21,11 +64,14 @@ class Dingtalk:
             chatbot_debug: 需包含'webhook'、'secret'
             attend_url: 打卡跳转地址
             interaction_url: 管理系统跳转地址
+            http: 共用的HTTP客户端，缺省时新建
 
         Raises:
             TypeError: 如果参数无效
         '''
         logger = logging.getLogger(__name__)
+        if not http:
+            http = HTTPClient()
         if not chatbot:
             chatbot = {}
         if not isinstance(chatbot.setdefault('webhook', ''), str):
@@ -33,8 +79,8 @@ class Dingtalk:
         if not isinstance(chatbot.setdefault('secret', ''), str):
             raise TypeError('invalid arg: chatbot.secret')
         if chatbot['webhook'] and chatbot['secret']:
-            self._chatbot = DingtalkChatbot(
-                webhook=chatbot['webhook'], secret=chatbot['secret'])
+            self._chatbot = PooledChatbot(
+                chatbot['webhook'], chatbot['secret'], http)
             logger.info('Chatbot set.')
         if not chatbot_debug:
             chatbot_debug = {}
@@ -43,8 +89,8 @@ class Dingtalk:
         if not isinstance(chatbot_debug.setdefault('secret', ''), str):
             raise TypeError('invalid arg: chatbot_debug.secret')
         if chatbot_debug['webhook'] and chatbot_debug['secret']:
-            self._chatbot_debug = DingtalkChatbot(
-                webhook=chatbot_debug['webhook'], secret=chatbot_debug['secret'])
+            self._chatbot_debug = PooledChatbot(
+                chatbot_debug['webhook'], chatbot_debug['secret'], http)
             logger.info('Chatbot_debug set.')
         if not isinstance(attend_url, str):
             raise TypeError('invalid arg: attend_url')
@@ -57,7 +103,7 @@ class Dingtalk:
             self._interaction_url = interaction_url
             logger.info('interaction_url: %s', interaction_url)
 
-    def send_markdown(self, title: str, content: str, phone: str = '', to_debug: bool = False, to_stdout: bool = False):
+    def send_markdown(self, title: str, content: str, phone: str = '', to_debug: bool = False, to_stdout: bool = False, log: bool = True) -> Message_Log | None:
         ''' 发送markdown，指定phone时尝试@该号码。
 
         Args:
@@ -66,6 +112,10 @@ class Dingtalk:
             phone: 需要@的号码
             to_debug: 发送至主通知群还是调试通知群
             to_stdout: 是否将通知重定向到stdout
+            log: 是否写入log_message；为False时由调用方批量写入
+
+        Returns:
+            发送日志；未发送时返回None
         '''
         logger = logging.getLogger(__name__)
         logger.debug('args: %s', {
@@ -105,21 +155,28 @@ class Dingtalk:
         except:
             logger.error('send_markdown error', exc_info=True)
         finally:
-            mysql.t_log.add_message(
-                'dingtalk',
-                'to_debug' if to_debug else 'to_main',
-                title,
-                content,
-                json.dumps(r),
-            )
-
-    def send_action_card(self, content: str, to_debug: bool = False, to_stdout: bool = False):
+            ret: Message_Log = {
+                'sender': 'dingtalk',
+                'receiver': 'to_debug' if to_debug else 'to_main',
+                'subject': title,
+                'content': content,
+                'result': json.dumps(r),
+            }
+            if log:
+                mysql.t_log.add_message(**ret)
+        return ret
+
+    def send_action_card(self, content: str, to_debug: bool = False, to_stdout: bool = False, log: bool = True) -> Message_Log | None:
         ''' 发送（打卡用）action_card。
 
         Args:
             content: 通知内容
             to_debug: 发送至主通知群还是调试通知群
             to_stdout: 是否将通知重定向到stdout
+            log: 是否写入log_message；为False时由调用方批量写入
+
+        Returns:
+            发送日志；未发送时返回None
         '''
         logger = logging.getLogger(__name__)
         logger.debug('args: %s', {
@@ -166,10 +223,13 @@ class Dingtalk:
         except:
             logger.error('send_action_card error', exc_info=True)
         finally:
-            mysql.t_log.add_message(
-                'dingtalk',
-                'to_debug' if to_debug else 'to_main',
-                '任务状态',
-                content,
-                json.dumps(r),
-            )
+            ret: Message_Log = {
+                'sender': 'dingtalk',
+                'receiver': 'to_debug' if to_debug else 'to_main',
+                'subject': '任务状态',
+                'content': content,
+                'result': json.dumps(r),
+            }
+            if log:
+                mysql.t_log.add_message(**ret)
+        return ret
@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+""" 通知并发发送：邮件、钉钉、企业微信同时发送，发送日志合并为一次写入
+"""
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from . import mysql
+from .types import *
+
+# 各通道的默认等待时间（秒）
+DEFAULT_TIMEOUTS = {"mail": 300, "dingtalk": 15, "wxwork": 15}
+
+
+class Dispatcher:
+    """通知发送线程池，在进程内复用"""
+
+    _executor: ThreadPoolExecutor = None
+    _timeouts = {}
+
+    def __init__(self, max_workers: int = 4, timeouts: dict[str, float] | None = None):
+        """
+        Args:
+            max_workers: 最大并发数
+            timeouts: 各通道的等待时间（秒），缺省时使用DEFAULT_TIMEOUTS
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="notify"
+        )
+        self._timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self._timeouts.update(timeouts)
+
+    def batch(self) -> "Batch":
+        """新建一组通知"""
+        return Batch(self._executor, self._timeouts)
+
+
+class Batch:
+    """一组并发发送的通知，wait()时等待全部完成并批量写入发送日志"""
+
+    def __init__(self, executor: ThreadPoolExecutor, timeouts: dict[str, float]):
+        self._executor = executor
+        self._timeouts = timeouts
+        self._futures: list[tuple[str, float, Future]] = []
+
+    def submit(self, channel: str, fn, *args, **kwargs):
+        """提交一个通知
+
+        Args:
+            channel: 通道名，用于确定等待时间
+            fn: 发送函数；返回Message_Log（或其列表）时由wait()统一写入日志
+        """
+        deadline = time.monotonic() + self._timeouts.get(channel, 30)
+        self._futures.append(
+            (channel, deadline, self._executor.submit(fn, *args, **kwargs))
+        )
+
+    def wait(self) -> dict[str, list]:
+        """等待全部通知完成，超时的通知不再等待（仍在后台继续）
+
+        Returns:
+            {通道名: [返回值或异常]}
+        """
+        logger = logging.getLogger(__name__)
+        ret: dict[str, list] = {}
+        logs: list[Message_Log] = []
+        for channel, deadline, future in self._futures:
+            try:
+                result = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeoutError as err:
+                logger.error("%s timed out", channel)
+                result = err
+            except Exception as err:
+                logger.error("%s failed", channel, exc_info=True)
+                result = err
+            ret.setdefault(channel, []).append(result)
+            if isinstance(result, dict):
+                logs.append(result)
+            elif isinstance(result, list):
+                logs.extend([item for item in result if isinstance(item, dict)])
+        self._futures = []
+        try:
+            mysql.t_log.add_messages(logs)
+        except Exception:
+            logger.error("add_messages failed", exc_info=True)
+        logger.debug("return: %s", ret)
+        return ret
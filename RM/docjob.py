@@ -0,0 +1,137 @@
+# -*- coding: UTF-8 -*-
+""" 文档服务的任务接口：worker通过Redis Stream（document）将COM操作交给独立的文档服务进程
+"""
+import os
+import time
+import logging
+from .redis import RedisStream
+from .types import *
+
+# 可远程执行的文档操作
+OPERATIONS = ["read_document", "read_XT13", "encrypt_batch"]
+# 文档服务在客户端截止时间前预留的回复时间（秒）
+REPLY_MARGIN = 5
+
+
+class DocumentClient:
+    """文档服务客户端，接口与document模块一致，路径以storage的相对路径传递"""
+
+    _stream: RedisStream = None
+    _storage = ""
+    _timeout = 360
+
+    def __init__(self, stream: RedisStream, storage: str, timeout: int = 360):
+        """
+        Args:
+            stream: 已初始化的RedisStream
+            storage: 本地数据文件夹（与文档服务共享）
+            timeout: 等待单个任务的时间（秒），应大于文档服务的任务超时
+
+        Raises:
+            TypeError/ValueError: 如果参数无效
+        """
+        logger = logging.getLogger(__name__)
+        if not isinstance(stream, RedisStream):
+            raise TypeError("invalid arg: stream")
+        if not isinstance(timeout, int) or timeout < 1:
+            raise ValueError("invalid arg: timeout")
+        self._stream = stream
+        self._storage = os.path.realpath(storage)
+        self._timeout = timeout
+        logger.info("document service enabled (timeout: %ss).", timeout)
+
+    def read_document(self, work_path: str) -> Attachment:
+        """远程调用document.read_document"""
+        return self._call("read_document", [self._relpath(work_path)])
+
+    def read_XT13(self, work_path: str) -> Attachment:
+        """远程调用document.read_XT13"""
+        return self._call("read_XT13", [self._relpath(work_path)])
+
+    def encrypt_batch(self, document_paths: list[str]) -> dict[str, bool]:
+        """远程调用document.encrypt_batch，任务失败时视为全部加密失败"""
+        logger = logging.getLogger(__name__)
+        if not document_paths:
+            return {}
+        relpaths = {self._relpath(path): path for path in document_paths}
+        try:
+            ret = self._call("encrypt_batch", list(relpaths))
+        except Exception:
+            logger.warning("encrypt_batch failed", exc_info=True)
+            return {path: False for path in document_paths}
+        return {path: ret.get(relpath, False) for relpath, path in relpaths.items()}
+
+    def _relpath(self, path: str) -> str:
+        relpath = os.path.relpath(os.path.realpath(path), self._storage)
+        if relpath.startswith(".."):
+            raise ValueError(f"path outside storage: {path}")
+        return relpath.replace(os.sep, "/")
+
+    def _call(self, operation: str, paths: list[str]):
+        """提交任务并等待结果
+
+        Raises:
+            TimeoutError: 如果超时未返回
+            RuntimeError: 如果文档服务处理失败
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("args: %s", {"operation": operation, "paths": paths})
+        # 任务可能在Stream中排队，传递截止时间，文档服务据此缩短任务的执行时间
+        ret = self._stream.call(
+            "document",
+            {
+                "operation": operation,
+                "paths": "\n".join(paths),
+                "deadline": str(time.time() + self._timeout),
+            },
+            self._timeout,
+        )
+        if ret.get("err"):
+            raise RuntimeError(f"document service: {ret['err']}")
+        logger.debug("return: %s", ret["data"])
+        return ret["data"]
+
+
+def time_limit(fields: dict, timeout: float) -> float:
+    """计算任务的执行时间上限：不超过文档服务的任务超时，并在客户端截止时间前留出回复时间
+
+    Args:
+        fields: 任务参数
+        timeout: 文档服务的任务超时（秒）
+
+    Returns:
+        执行时间上限（秒），小于等于0时客户端已不再等待
+    """
+    try:
+        remaining = float(fields["deadline"]) - time.time() - REPLY_MARGIN
+    except (KeyError, ValueError):
+        return timeout
+    return min(timeout, remaining)
+
+
+def execute(storage: str, operation: str, paths: list[str]):
+    """在文档服务的子进程中执行任务
+
+    Args:
+        storage: 文档服务的数据文件夹
+        operation: OPERATIONS之一
+        paths: storage的相对路径
+
+    Returns:
+        对应document函数的返回值（encrypt_batch的键为相对路径）
+    """
+    from . import document
+
+    if operation not in OPERATIONS:
+        raise ValueError(f"invalid operation: {operation}")
+    storage = os.path.realpath(storage)
+    full_paths = []
+    for path in paths:
+        full_path = os.path.realpath(os.path.join(storage, path))
+        if os.path.commonpath([storage, full_path]) != storage:
+            raise ValueError(f"path outside storage: {path}")
+        full_paths.append(full_path)
+    if operation == "encrypt_batch":
+        ret = document.encrypt_batch(full_paths)
+        return {path: ret[full_path] for path, full_path in zip(paths, full_paths)}
+    return getattr(document, operation)(full_paths[0])
@@ -2,15 +2,26 @@
 """ 文档操作工具类
 """
 import os
+import io
 import shutil
 import logging
 import re
+import sys
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
 from walkdir import filtered_walk, file_paths
-import win32com.client
+if sys.platform == "win32":
+    import win32com.client
 from docx import Document
 
+from .rules import Reader, load
 from .types import *
 
+# 报告类型规则，新增报告类型时修改conf/rules.json
+rules = load(os.path.join("conf", "rules.json"))
+
 
 def read_document(work_path: str) -> Attachment:
     """读取{work_path}下的所有word文档，读取项目编号、项目名称、委托单位、文档页数
@@ -50,78 +61,21 @@ def read_document(work_path: str) -> Attachment:
             logger.info("page: %s", page)
             # 读项目编号
             # 印象中所有项目编号都能在前几行读到
-            pattern = re.compile(
-                "SHTEC20[0-9]{2}(PRO|PST|DSYS|SOF|SRV|PER|FUN|PCT)[0-9]{4}([-_][0-9]+){0,1}"
-            )
-            for i in range(5):
-                re_result = re.search(pattern, document.Paragraphs(i + 1).Range.Text)
-                if re_result:
-                    code = re_result.group()
-                    logger.info("code: %s", code)
-                    break
-            else:
+            reader = Reader(document)
+            code = rules.find_code(reader)
+            if not code:
                 logger.warning("ignored document")
                 continue
+            logger.info("code: %s", code)
             # 附件和复核意见单的逻辑已去除
 
-            # 读取系统名称和委托单位
-            if "DSYS" in code:
-                logger.debug("reading DSYS")
-                # 从基本信息表中读取
-                name = document.Tables(2).Cell(2, 2).Range.Text
-                company = document.Tables(2).Cell(5, 2).Range.Text
-            elif "PRO" in code or "PST" in code or "PER" in code or "PCT" in code:
-                logger.debug("reading PRO/PST/PER/PCT")
-                # 直接从第一个表格中读取
-                name = document.Tables(1).Cell(1, 2).Range.Text
-                company = document.Tables(1).Cell(2, 2).Range.Text
-            elif "SOF" in code or "FUN" in code:
-                logger.debug("reading SOF/FUN")
-                # 遍历第一页的行读取
-                for i in range(30):
-                    paragraph = document.Paragraphs(i + 1).Range.Text.strip()
-                    if "名称" in paragraph:
-                        name = re.sub("^.*名称(:|：)", "", paragraph)
-                    if "委托单位" in paragraph:
-                        company = re.sub("^.*单位(:|：)", "", paragraph)
-                    if name and company:
-                        break
-            # 其他报告，自求多福
-            else:
-                logger.debug("reading others")
-                # 先尝试读表格
-                for i in range(document.Tables(1).Rows.Count):
-                    if "项目名称" in document.Tables(1).Cell(i + 1, 1).Range.Text:
-                        name = document.Tables(1).Cell(i + 1, 2).Range.Text
-                    elif "报告名称" in document.Tables(1).Cell(i + 1, 1).Range.Text:
-                        name = document.Tables(1).Cell(i + 1, 2).Range.Text
-                    elif "系统名称" in document.Tables(1).Cell(i + 1, 1).Range.Text:
-                        name = document.Tables(1).Cell(i + 1, 2).Range.Text
-                    elif "委托单位" in document.Tables(1).Cell(i + 1, 1).Range.Text:
-                        company = document.Tables(1).Cell(i + 1, 2).Range.Text
-                    elif "被测单位" in document.Tables(1).Cell(i + 1, 1).Range.Text:
-                        company = document.Tables(1).Cell(i + 1, 2).Range.Text
-                # 再尝试读行
-                for i in range(30):
-                    paragraph = document.Paragraphs(i + 1).Range.Text.strip()
-                    if (
-                        "项目名称" in paragraph
-                        or "报告名称" in paragraph
-                        or "系统名称" in paragraph
-                    ):
-                        name = re.sub("^.*名称(:|：)", "", paragraph)
-                    elif "委托单位" in paragraph or "被测单位" in paragraph:
-                        company = re.sub("^.*单位(:|：)", "", paragraph)
-                    if name and company:
-                        break
-            # 尝试去除可能存在的换行符
+            # 按报告类型规则读取系统名称和委托单位
+            name, company = rules.extract(reader, code)
             if name:
-                name = re.sub("(\r|\n|\x07| *)", "", name)
                 logger.info("name: %s", name)
                 ret["names"][code] = name
             # 委托单位有效时覆盖缓存值
             if company:
-                company = re.sub("(\r|\n|\x07| *)", "", company)
                 logger.info("company: %s", company)
                 ret["company"] = company
             # 累加项目包总页数
@@ -165,12 +119,8 @@ def read_XT13(work_path: str) -> Attachment:
         document = None
         try:
             document = word.Documents.Open(FileName=document_path)
-            re_result = re.search(
-                "SHTEC20[0-9]{2}(PRO|PST|DSYS|SOF|SRV|PER|FUN|PCT)[0-9]{4}([-_][0-9]+){0,1}",
-                document.Paragraphs(1).Range.Text,
-            )
-            if re_result:
-                code = re_result.group()
+            code = rules.match(document.Paragraphs(1).Range.Text)
+            if code:
                 logger.info("code: %s", code)
                 name = document.Tables(1).Cell(2, 2).Range.Text
                 name = re.sub("(\r|\n|\x07| *)", "", name)
@@ -187,6 +137,83 @@ def read_XT13(work_path: str) -> Attachment:
     return ret
 
 
+class XT13Template:
+    """预处理的XT13模板：在模板中填入占位符后拆分document.xml，生成时只需拼接字符串并重新打包"""
+
+    _PLACEHOLDER = re.compile(r"\{\{XT13:(code|name|author)\}\}")
+
+    def __init__(self, template_path: str):
+        """解析模板并生成骨架
+
+        Args:
+            template_path: 模板路径
+
+        Raises:
+            ValueError: 如果模板中缺少占位符
+        """
+        template_document = Document(template_path)
+        # 项目编号(bold)
+        template_document.paragraphs[0].add_run("{{XT13:code}}").bold = True
+        # 项目名称
+        template_document.tables[0].cell(1, 1).text = "{{XT13:name}}"
+        # 报告撰写人
+        template_document.tables[0].cell(2, 1).text = "{{XT13:author}}"
+        buffer = io.BytesIO()
+        template_document.save(buffer)
+        self._members: list[tuple[zipfile.ZipInfo, bytes]] = []
+        self._parts: list[str] = []
+        with zipfile.ZipFile(buffer) as z:
+            for info in z.infolist():
+                if info.filename == "word/document.xml":
+                    # 奇数位为字段名，偶数位为原样输出的XML片段
+                    self._parts = self._PLACEHOLDER.split(
+                        z.read(info).decode("utf-8")
+                    )
+                self._members.append((info, z.read(info)))
+        if len(self._parts) != 7:
+            raise ValueError(f"invalid template: {template_path}")
+
+    def stamp(self, target_path: str, values: dict[str, str]):
+        """使用{values}替换占位符，保存至{target_path}
+
+        Args:
+            target_path: 保存路径
+            values: 包含code、name、author
+        """
+        document_xml = "".join(
+            [
+                part if i % 2 == 0 else escape(values[part])
+                for i, part in enumerate(self._parts)
+            ]
+        ).encode("utf-8")
+        with zipfile.ZipFile(target_path, "w", zipfile.ZIP_DEFLATED) as z:
+            for info, data in self._members:
+                z.writestr(
+                    info, document_xml if info.filename == "word/document.xml" else data
+                )
+
+
+# 模板缓存，每个模板在进程内只解析一次
+_templates: dict[str, XT13Template] = {}
+_templates_lock = threading.Lock()
+
+
+def get_template(template: str) -> XT13Template:
+    """从缓存中获取XT13模板，首次使用时解析
+
+    Args:
+        template: 模板文件名（位于template目录）
+
+    Returns:
+        XT13Template
+    """
+    with _templates_lock:
+        if template not in _templates:
+            logging.getLogger(__name__).info('loading template "%s"', template)
+            _templates[template] = XT13Template(os.path.join("template", template))
+        return _templates[template]
+
+
 def gen_XT13(authorname: str, code: str, project_name: str, target_path):
     """生成XT13
 
@@ -210,65 +237,151 @@ def gen_XT13(authorname: str, code: str, project_name: str, target_path):
     logger.info('generating XT13 for "%s" to "%s"', code, target_path)
     try:
         # 根据项目编号读取不同的审核意见单模板
-        if "PRO" in code or "PST" in code:
-            template_document = Document(
-                os.path.join("template", "RD-XT13测评报告审核、签发意见单-PROPST.docx")
-            )
-        elif "SOF" in code:
-            template_document = Document(
-                os.path.join("template", "RD-XT13测评报告审核、签发意见单-SOF.docx")
-            )
-        elif "DSYS" in code:
-            template_document = Document(
-                os.path.join("template", "RD-XT13测评报告审核、签发意见单-DSYS.docx")
-            )
-        elif "SRV" in code:
-            template_document = Document(
-                os.path.join("template", "RD-XT13测评报告审核、签发意见单-SRV.docx")
-            )
-        elif "PER" in code:
-            template_document = Document(
-                os.path.join("template", "RD-XT13测评报告审核、签发意见单-PER.docx")
-            )
-        elif "FUN" in code:
-            template_document = Document(
-                os.path.join("template", "RD-XT13测评报告审核、签发意见单-FUN.docx")
-            )
-        else:
+        template = rules.template(code)
+        if not template:
             # 目前无视其他类型的报告
             return
-        # 项目编号(bold)
-        template_document.paragraphs[0].add_run(code).bold = True
-        # 项目名称
-        template_document.tables[0].cell(1, 1).text = project_name
-        # 报告撰写人
-        template_document.tables[0].cell(2, 1).text = authorname
-        template_document.save(target_path)
+        get_template(template).stamp(
+            target_path, {"code": code, "name": project_name, "author": authorname}
+        )
     except:
         logger.warning("generating XT13 failed", exc_info=True)
 
 
-def encrypt(document_path: str):
-    """加密文档（在安装DLP的worker上直接另存为）
+def gen_XT13_batch(authorname: str, names: dict[str, str], target_dir: str):
+    """为项目包中的每个项目并行生成XT13，已有XT13时跳过
 
     Args:
-        document_path(str): 文档路径
+        authorname: 撰写人名字
+        names: {项目编号: 项目名称}
+        target_dir: 保存目录
     """
     logger = logging.getLogger(__name__)
-    logger.debug("args: %s", {"document_path": document_path})
+    logger.debug(
+        "args: %s",
+        {"authorname": authorname, "names": names, "target_dir": target_dir},
+    )
 
-    word = win32com.client.gencache.EnsureDispatch("Word.Application")
-    document = None
-    try:
-        logger.info('encrypting "%s"', os.path.basename(document_path))
-        document = word.Documents.Open(FileName=document_path)
-        document.SaveAs2(FileName=document_path + ".enc")
-        document.Close(SaveChanges=0)
-        document = None
-        os.remove(document_path)
-        shutil.move(document_path + ".enc", document_path)
-    except:
-        logger.warning("Encryption failed.", exc_info=True)
-    finally:
-        if document:
-            document.Close(SaveChanges=0)
+    tasks = []
+    for code, project_name in names.items():
+        target_path = os.path.join(target_dir, f"RD-XT13测评报告审核、签发意见单{code}.docx")
+        if os.path.exists(target_path):
+            continue
+        tasks.append((authorname, code, project_name, target_path))
+    if not tasks:
+        return
+    with ThreadPoolExecutor(max_workers=min(len(tasks), 4)) as executor:
+        # gen_XT13内部已处理异常，在此仅等待全部完成
+        list(executor.map(lambda task: gen_XT13(*task), tasks))
+
+
+class WordSession:
+    """长期持有的Word实例，处理{recycle}个文档或出错后重启，退出时调用Quit"""
+
+    _word = None
+    _count = 0
+    _recycle = 20
+
+    def __init__(self, recycle: int = 20):
+        """
+        Args:
+            recycle: 处理多少个文档后重启Word
+        """
+        if not isinstance(recycle, int) or recycle < 1:
+            raise ValueError("invalid arg: recycle")
+        self._recycle = recycle
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.quit()
+
+    def open(self, document_path: str):
+        """打开文档，必要时启动或重启Word
+
+        Args:
+            document_path: 文档路径
+
+        Returns:
+            Document
+        """
+        logger = logging.getLogger(__name__)
+        if self._word and self._count >= self._recycle:
+            logger.info("recycling Word after %s documents", self._count)
+            self.quit()
+        if not self._word:
+            # DispatchEx启动独立的Word进程，Quit时不影响其他实例
+            self._word = win32com.client.DispatchEx("Word.Application")
+            self._word.Visible = False
+            self._word.DisplayAlerts = 0  # wdAlertsNone=0
+            self._count = 0
+        self._count += 1
+        return self._word.Documents.Open(FileName=document_path)
+
+    def quit(self):
+        """关闭Word进程"""
+        logger = logging.getLogger(__name__)
+        if not self._word:
+            return
+        try:
+            self._word.Quit(SaveChanges=0)
+        except Exception:
+            logger.warning("Word.Quit() failed", exc_info=True)
+        self._word = None
+        self._count = 0
+
+
+def encrypt_batch(document_paths: list[str], recycle: int = 20) -> dict[str, bool]:
+    """使用同一个Word实例批量加密文档（在安装DLP的worker上直接另存为）
+
+    Args:
+        document_paths: 文档路径列表
+        recycle: 处理多少个文档后重启Word
+
+    Returns:
+        {文档路径: 是否加密成功}
+    """
+    logger = logging.getLogger(__name__)
+    logger.debug("args: %s", {"document_paths": document_paths, "recycle": recycle})
+
+    ret = {}
+    with WordSession(recycle) as session:
+        for document_path in document_paths:
+            document = None
+            try:
+                logger.info('encrypting "%s"', os.path.basename(document_path))
+                document = session.open(document_path)
+                document.SaveAs2(FileName=document_path + ".enc")
+                document.Close(SaveChanges=0)
+                document = None
+                os.remove(document_path)
+                shutil.move(document_path + ".enc", document_path)
+                ret[document_path] = True
+            except:
+                logger.warning("Encryption failed.", exc_info=True)
+                ret[document_path] = False
+                if document:
+                    try:
+                        document.Close(SaveChanges=0)
+                    except Exception:
+                        pass
+                # 出错后Word可能处于异常状态（如弹窗），直接重启
+                session.quit()
+                if os.path.exists(document_path + ".enc"):
+                    os.remove(document_path + ".enc")
+
+    logger.debug("return: %s", ret)
+    return ret
+
+
+def encrypt(document_path: str) -> bool:
+    """加密文档（在安装DLP的worker上直接另存为）
+
+    Args:
+        document_path(str): 文档路径
+
+    Returns:
+        是否加密成功
+    """
+    return encrypt_batch([document_path])[document_path]
@@ -0,0 +1,173 @@
+# -*- coding: UTF-8 -*-
+""" 通知接口共用的HTTP客户端：连接池、超时、带抖动的有限重试、耗时统计
+"""
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+# 可安全重试的响应状态码（请求未被处理）
+RETRY_STATUS = [429, 502, 503, 504]
+
+
+class HTTPClient:
+    """基于requests.Session的HTTP客户端，同一host复用长连接
+
+    base_url可替换为本地stub服务，便于测试
+    """
+
+    _base_url = ""
+    _session: requests.Session = None
+    _timeout = (3.05, 10)
+    _retries = 2
+    _backoff = 0.5
+
+    def __init__(
+        self,
+        base_url: str = "",
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10,
+        retries: int = 2,
+        backoff: float = 0.5,
+        pool_size: int = 10,
+    ):
+        """
+        Args:
+            base_url: 相对路径的前缀，如https://qyapi.weixin.qq.com
+            connect_timeout: 连接超时（秒）
+            read_timeout: 读取超时（秒）
+            retries: 最大重试次数
+            backoff: 重试间隔基数（秒），第n次重试等待backoff * 2^(n-1) * [0.5, 1.5)
+            pool_size: 每个host的最大连接数
+        """
+        self._base_url = base_url.rstrip("/")
+        self._timeout = (connect_timeout, read_timeout)
+        self._retries = retries
+        self._backoff = backoff
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._metrics: dict[str, dict] = {}
+
+    def base_url(self) -> str:
+        return self._base_url
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """发送请求，失败时按以下规则重试：
+
+        1. 连接超时：所有请求均重试
+        2. 读取超时、连接中断：仅重试GET（POST可能已被处理，避免重复发送消息）
+        3. 响应状态码为RETRY_STATUS：所有请求均重试
+
+        Args:
+            method: GET/POST
+            url: 绝对地址或相对于base_url的路径
+            **kwargs: 直接传入requests
+
+        Returns:
+            requests.Response
+
+        Raises:
+            requests.RequestException: 如果重试后仍然失败
+        """
+        logger = logging.getLogger(__name__)
+        if not url.startswith(("http://", "https://")):
+            url = self._base_url + url
+        kwargs.setdefault("timeout", self._timeout)
+        key = "{} {}".format(method.upper(), urlsplit(url).path)
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            error = None
+            try:
+                r = self._session.request(method, url, **kwargs)
+                if r.status_code not in RETRY_STATUS:
+                    self._record(key, start, attempt, False)
+                    return r
+                error = requests.HTTPError(f"{r.status_code} {r.reason}", response=r)
+            except requests.exceptions.ConnectTimeout as err:
+                error = err
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as err:
+                if method.upper() != "GET":
+                    self._record(key, start, attempt, True)
+                    raise
+                error = err
+            if attempt >= self._retries:
+                self._record(key, start, attempt, True)
+                if isinstance(error, requests.HTTPError):
+                    return error.response
+                raise error
+            attempt += 1
+            delay = self._backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            logger.warning("%s failed (%s), retry in %.2fs", key, error, delay)
+            time.sleep(delay)
+
+    def get_json(self, url: str, **kwargs) -> dict:
+        """GET并解析JSON"""
+        return self.request("GET", url, **kwargs).json()
+
+    def post_json(self, url: str, **kwargs) -> dict:
+        """POST并解析JSON"""
+        return self.request("POST", url, **kwargs).json()
+
+    def metrics(self) -> dict[str, dict]:
+        """请求统计
+
+        Returns:
+            {"METHOD path": {count, errors, retries, total_ms, max_ms}}
+        """
+        with self._lock:
+            return {key: dict(value) for key, value in self._metrics.items()}
+
+    def _record(self, key: str, start: float, retries: int, failed: bool):
+        elapsed = (time.monotonic() - start) * 1000
+        with self._lock:
+            item = self._metrics.setdefault(
+                key, {"count": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            item["count"] += 1
+            item["errors"] += 1 if failed else 0
+            item["retries"] += retries
+            item["total_ms"] += elapsed
+            item["max_ms"] = max(item["max_ms"], elapsed)
+        logging.getLogger(__name__).debug("%s: %.1fms", key, elapsed)
+
+
+class TokenBucket:
+    """令牌桶限流，按rate匀速补充令牌，最多积累capacity个"""
+
+    def __init__(self, rate: float, capacity: int):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 令牌上限（允许的突发请求数）
+        """
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """取得一个令牌，令牌不足时阻塞等待
+
+        Returns:
+            等待时间（秒）
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._capacity, self._tokens + (now - self._updated) * self._rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait:
+            logging.getLogger(__name__).debug("rate limited, wait %.2fs", wait)
+            time.sleep(wait)
+        return wait
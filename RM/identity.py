@@ -0,0 +1,98 @@
+# -*- coding: UTF-8 -*-
+''' 发件人及审核人的身份解析：发件人按邮箱精确查询（含转发邮箱），审核人按内存中的ID、姓名索引匹配
+'''
+import time
+import logging
+import threading
+from email.utils import parseaddr
+from . import mysql
+from .types import *
+
+
+class Resolver:
+    ''' 身份解析器
+
+    1. 发件人：按邮箱（或--sender指定的ID）精确查询user表，未命中时查询user_alias表
+    2. 审核人：首次使用时加载所有可用审核人，按ID、姓名建立索引；user表变更或超过ttl秒后重新加载
+    '''
+
+    _ttl = 300
+
+    def __init__(self, ttl: float = 300):
+        '''
+        Args:
+            ttl: 审核人索引的有效期（秒），用于兜底直接修改数据库的情况
+        '''
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded = None
+        self._ids: dict[str, UserItem] = {}
+        self._names: dict[str, list[str]] = {}
+
+    def invalidate(self, table: str = 'user'):
+        ''' 使审核人索引失效，可作为mysql.on_change的监听函数
+
+        Args:
+            table: 变更的表名，仅user表变更时失效
+        '''
+        if table == 'user':
+            self._loaded = None
+
+    def sender(self, from_: str, user_id: str = '') -> UserItem | None:
+        ''' 解析发件人
+
+        Args:
+            from_: 发件人邮箱
+            user_id: 手动指定的发件人ID（优先）
+
+        Returns:
+            UserItem | None
+        '''
+        logger = logging.getLogger(__name__)
+        if user_id:
+            logger.info('manual sender: %s', user_id)
+            return mysql.t_user.fetch(user_id)
+        email = parseaddr(from_)[1].strip().lower()
+        if not email:
+            return None
+        return mysql.t_user.fetch_by_email(email)
+
+    def reviewer(self, keyword: str) -> str:
+        ''' 按ID或姓名解析审核人，姓名优先完全匹配，其次为唯一的部分匹配
+
+        Args:
+            keyword: 审核人ID或姓名
+
+        Returns:
+            审核人ID，无法唯一确定时返回空字符串
+        '''
+        keyword = keyword.strip()
+        if not keyword:
+            return ''
+        ids, names = self._index()
+        if keyword in ids:
+            return keyword
+        matched = names.get(keyword)
+        if matched is None:
+            matched = [user_id for name, users in names.items() if keyword in name for user_id in users]
+        return matched[0] if len(matched) == 1 else ''
+
+    def _index(self) -> tuple[dict[str, UserItem], dict[str, list[str]]]:
+        ''' 获取审核人索引，过期时重新加载
+        '''
+        logger = logging.getLogger(__name__)
+        with self._lock:
+            if self._loaded is None or time.monotonic() - self._loaded >= self._ttl:
+                ids: dict[str, UserItem] = {}
+                names: dict[str, list[str]] = {}
+                for user in mysql.t_user.search(only_reviewer=True):
+                    ids[user['id']] = user
+                    names.setdefault(user['name'], []).append(user['id'])
+                self._ids, self._names = ids, names
+                self._loaded = time.monotonic()
+                logger.debug('loaded %s reviewers', len(ids))
+            return self._ids, self._names
+
+
+resolver = Resolver()
+mysql.on_change(resolver.invalidate)
@@ -1,12 +1,19 @@
 # -*- coding: UTF-8 -*-
 import os
-import sys
 import logging
 import datetime
+import json
+import shutil
+import imaplib
+import smtplib
+import mimetypes
+import threading
+import time
 import zmail
-from email.header import Header
-from email.utils import formataddr, parseaddr
+from email.message import EmailMessage
+from email.utils import formataddr, formatdate, parseaddr
 from . import mysql
+from .redis import RedisStream
 from .types import *
 
 
@@ -15,6 +22,12 @@ class Mail:
 
     _pop3_config = {}
     _smtp_config = {}
+    _imap_config = {}
+    _imap_idle: imaplib.IMAP4 | None = None
+    _smtp_session: "SMTPSession | None" = None
+    _outbox: RedisStream | None = None
+    _outbox_attempts = 5
+    _outbox_backoff = 30
     _default_domain = ""
     _default_cc = ""
 
@@ -24,6 +37,7 @@ class Mail:
         smtp_config: dict | None = None,
         default_domain: str = "example.com",
         default_cc: str = "",
+        imap_config: dict | None = None,
     ):
         """初始化mail的配置
 
@@ -32,6 +46,7 @@ class Mail:
             smtp_config: 需包含'username'、'password'、'host'、'port'、'ssl'、'tls'
             default_domain: 白名单邮箱域名
             default_cc: 默认抄送者
+            imap_config: 需包含'username'、'password'、'host'、'port'、'ssl'、'tls'；缺省时使用POP3收信
 
         Raises:
             ValueError/TypeError: 如果参数无效
@@ -68,8 +83,25 @@ class Mail:
         ).smtp_able():
             raise ValueError("Failed to login SMTP Server.")
         self._smtp_config = smtp_config
+        self._smtp_session = SMTPSession(smtp_config)
         logger.info("SMTP configration (%s) confirmed.", smtp_config["username"])
 
+        # imap（可选），配置后替代pop3收信，连接失败则抛出异常
+        if imap_config:
+            imap_config.setdefault("username", "rm@example.com")
+            imap_config.setdefault("password", "rm")
+            imap_config.setdefault("host", "example.com")
+            imap_config.setdefault("port", 143)
+            imap_config.setdefault("ssl", False)
+            imap_config.setdefault("tls", False)
+            self._imap_config = imap_config
+            try:
+                self._imap_connect().logout()
+            except Exception as err:
+                self._imap_config = {}
+                raise ValueError("Failed to login IMAP Server.") from err
+            logger.info("IMAP configration (%s) confirmed.", imap_config["username"])
+
         # 其他邮件设置
         if not isinstance(default_domain, str):
             raise TypeError("invalid arg: default_domain")
@@ -96,6 +128,8 @@ class Mail:
         """
         logger = logging.getLogger(__name__)
         logger.debug("args: %s", {"temp_path": work_path, "keywords": keywords})
+        if self._imap_config:
+            return self._receive_imap(work_path, keywords)
         pop3_server = zmail.server(
             username=self._pop3_config["username"],
             password=self._pop3_config["password"],
@@ -155,6 +189,180 @@ class Mail:
         logger.debug("return: %s", ret)
         return ret
 
+    def _receive_imap(
+        self, work_path: str, keywords: dict[str, str]
+    ) -> list[Parsed_Mail]:
+        """receive的IMAP实现：在服务端按主题关键词和发件域名SEARCH，仅下载命中的UID
+
+        Args:
+            work_path: 临时存放邮件的位置
+            keywords: {'submit': (str), 'finish': (str)}
+
+        Returns:
+            list[Parsed_Mail]
+
+        Raises:
+            RuntimeError: 如果IMAP服务器连接失败
+        """
+        logger = logging.getLogger(__name__)
+        try:
+            imap = self._imap_connect()
+        except Exception as err:
+            logger.error("imap_server unable", exc_info=True)
+            raise RuntimeError("IMAP server connection failed.") from err
+
+        ret: list[Parsed_Mail] = []
+        try:
+            for operator in ["submit", "finish"]:
+                # 关键词可能包含中文，以literal方式传入
+                imap.literal = keywords[operator].encode("utf-8")
+                typ, data = imap.uid(
+                    "SEARCH",
+                    "CHARSET",
+                    "UTF-8",
+                    "FROM",
+                    self._default_domain,
+                    "SUBJECT",
+                )
+                if typ != "OK":
+                    raise RuntimeError(f"IMAP search failed: {data}")
+                uids = data[0].split() if data and data[0] else []
+                logger.debug('%s elements in "%s"', len(uids), keywords[operator])
+                # 反向处理邮件，当发生重复时按最后一份处理
+                for uid in reversed(uids):
+                    typ, data = imap.uid("FETCH", uid, "(RFC822)")
+                    if typ != "OK" or not data or not isinstance(data[0], tuple):
+                        logger.warning("fetch %s failed: %s", uid, data)
+                        continue
+                    temp_path = os.path.join(
+                        work_path, "{}_".format(datetime.datetime.now().timestamp())
+                    )
+                    os.mkdir(temp_path)
+                    logger.info('saving eml to "%s"', temp_path)
+                    with open(os.path.join(temp_path, f"{operator}.eml"), "wb") as f:
+                        f.write(data[0][1])
+                    mail = zmail.read(os.path.join(temp_path, f"{operator}.eml"))
+                    parsed_mail: Parsed_Mail = {
+                        "operator": operator,
+                        "keyword": keywords[operator],
+                        "timestamp": int(mail["date"].timestamp()),
+                        "from_": parseaddr(mail["from"])[1],
+                        "subject": mail["subject"],
+                        "content": mail["content_text"][0],
+                        "temp_path": "",
+                    }
+                    # 与POP3保持一致的目录命名：{timestamp}_{user}_
+                    parsed_mail["temp_path"] = temp_path.rstrip("_") + "_{}_".format(
+                        parsed_mail["from_"].split("@")[0]
+                    )
+                    os.rename(temp_path, parsed_mail["temp_path"])
+                    os.mkdir(os.path.join(parsed_mail["temp_path"], "attachments"))
+                    zmail.save_attachment(
+                        mail,
+                        target_path=os.path.join(
+                            parsed_mail["temp_path"], "attachments"
+                        ),
+                        overwrite=True,
+                    )
+                    ret.append(parsed_mail)
+                    imap.uid("STORE", uid, "+FLAGS", "(\\Deleted)")
+                    logger.info("deleted %s", uid.decode())
+            imap.expunge()
+        finally:
+            try:
+                imap.logout()
+            except Exception:
+                logger.debug("imap logout failed", exc_info=True)
+
+        logger.debug("return: %s", ret)
+        return ret
+
+    def _imap_connect(self) -> imaplib.IMAP4:
+        """按照IMAP配置登录服务器，并选中INBOX
+
+        Returns:
+            imaplib.IMAP4
+        """
+        if self._imap_config["ssl"]:
+            imap = imaplib.IMAP4_SSL(
+                self._imap_config["host"], self._imap_config["port"], timeout=300
+            )
+        else:
+            imap = imaplib.IMAP4(
+                self._imap_config["host"], self._imap_config["port"], timeout=300
+            )
+            if self._imap_config["tls"]:
+                imap.starttls()
+        imap.login(self._imap_config["username"], self._imap_config["password"])
+        imap.select("INBOX")
+        return imap
+
+    def idle_able(self) -> bool:
+        """是否启用了IMAP收信（可使用wait监听新邮件）"""
+        return bool(self._imap_config)
+
+    def wait(self, timeout: int = 1740) -> bool:
+        """通过IMAP IDLE保持连接，阻塞等待新邮件到达
+
+        RFC 2177要求客户端至少每29分钟重新发起IDLE，因此默认超时为1740秒。
+        超时后直接丢弃连接，下一次调用时重新登录。
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            bool: 是否有新邮件到达
+
+        Raises:
+            RuntimeError: 如果未启用IMAP或服务器不支持IDLE
+        """
+        logger = logging.getLogger(__name__)
+        if not self._imap_config:
+            raise RuntimeError("IMAP not configured.")
+        if not self._imap_idle:
+            self._imap_idle = self._imap_connect()
+            if "IDLE" not in self._imap_idle.capabilities:
+                self._imap_idle.logout()
+                self._imap_idle = None
+                raise RuntimeError("IMAP server does not support IDLE.")
+            logger.info("IMAP IDLE connection established.")
+        imap = self._imap_idle
+        tag = imap._new_tag()
+        try:
+            imap.send(tag + b" IDLE\r\n")
+            line = imap.readline()
+            if not line.startswith(b"+"):
+                raise RuntimeError(f"IDLE rejected: {line!r}")
+            # 等待服务器推送，仅EXISTS代表有新邮件
+            imap.sock.settimeout(timeout)
+            while True:
+                line = imap.readline()
+                logger.debug("IDLE response: %s", line)
+                if not line:
+                    raise ConnectionError("IMAP connection closed.")
+                if line.startswith(b"*") and line.rstrip().endswith(b"EXISTS"):
+                    break
+            imap.sock.settimeout(300)
+            imap.send(b"DONE\r\n")
+            while not line.startswith(tag):
+                line = imap.readline()
+                if not line:
+                    raise ConnectionError("IMAP connection closed.")
+            imap.tagged_commands.pop(tag, None)
+        except (TimeoutError, OSError, imaplib.IMAP4.error, RuntimeError) as err:
+            # 超时后的socket不可再读，丢弃连接
+            logger.debug("IDLE interrupted: %s", err)
+            try:
+                imap.shutdown()
+            except Exception:
+                pass
+            self._imap_idle = None
+            if isinstance(err, TimeoutError):
+                return False
+            raise
+        logger.info("new mail notified by IDLE")
+        return True
+
     def read(self, temp_path: str) -> Parsed_Mail | None:
         """在{temp_path}中读取eml文件
 
@@ -202,16 +410,23 @@ class Mail:
         attachments: list[str] | None = None,
         needs_cc: bool = False,
         to_stdout: bool = False,
-    ):
-        """发送邮件
+        cleanup: list[str] | None = None,
+        log: bool = True,
+    ) -> list[Message_Log]:
+        """发送邮件；启用outbox时仅将邮件放入队列，由process_outbox异步发送
 
         Args:
             recipient: 对象邮箱
             subject: 邮件主题
             content: 邮件内容
-            attachments: 附件文件路径
+            attachments: 附件文件路径（入队时只记录路径）
             needs_cc: 是否抄送管理员
             to_stdout: 是否将邮件重定向到stdout
+            cleanup: 邮件发送完毕（或进入死信）后删除的文件/目录
+            log: 是否写入log_message；为False时由调用方批量写入
+
+        Returns:
+            发送日志；放入队列或重定向到stdout时为空列表
         """
         logger = logging.getLogger(__name__)
         logger.debug(
@@ -223,55 +438,316 @@ class Mail:
                 "attachments": attachments,
                 "needs_cc": needs_cc,
                 "to_stdout": to_stdout,
+                "cleanup": cleanup,
+                "log": log,
             },
         )
+        message: Outgoing_Mail = {
+            "recipient": recipient,
+            "subject": subject,
+            "content": content,
+            "attachments": attachments if attachments else [],
+            "needs_cc": needs_cc,
+        }
+        if not cleanup:
+            cleanup = []
 
-        if not attachments:
-            attachments = []
-        for attachment in attachments:
-            logger.info(
-                'size of "{}": {:.2}MB'.format(
-                    os.path.basename(attachment), os.path.getsize(attachment) / 1048576
-                )
+        if self._outbox and not to_stdout:
+            entry_id = self._outbox.add(
+                source="mail",
+                name="outbox",
+                fields={
+                    "message": json.dumps(message, ensure_ascii=False),
+                    "cleanup": json.dumps(cleanup, ensure_ascii=False),
+                    "attempts": 0,
+                },
             )
+            logger.info('queued "%s" (%s)', subject, entry_id)
+            return []
+        _, logs = self._send_batch([message], to_stdout)
+        if log and logs:
+            mysql.t_log.add_messages(logs)
+        _remove(cleanup)
+        return logs
 
-        mail = {
-            "subject": subject,
-            "from": formataddr(
-                (
-                    Header("审核管理机器人", "utf-8").encode(),
-                    self._smtp_config["username"],
+    def enable_outbox(
+        self, stream: RedisStream, max_attempts: int = 5, backoff: int = 30
+    ):
+        """启用outbox，之后send仅将邮件放入队列
+
+        Args:
+            stream: Redis Stream客户端
+            max_attempts: 最大发送次数，超过后移入死信
+            backoff: 首次重试的等待时间（秒），之后按指数递增
+        """
+        logger = logging.getLogger(__name__)
+        if not isinstance(max_attempts, int) or max_attempts < 1:
+            raise ValueError("invalid arg: max_attempts")
+        if not isinstance(backoff, int) or backoff < 0:
+            raise ValueError("invalid arg: backoff")
+        self._outbox = stream
+        self._outbox_attempts = max_attempts
+        self._outbox_backoff = backoff
+        logger.info(
+            "outbox enabled (max_attempts: %s, backoff: %ss)", max_attempts, backoff
+        )
+
+    def process_outbox(self, to_stdout: bool = False) -> int:
+        """发送outbox中的邮件（阻塞读取，供后台线程循环调用）
+
+        发送失败时按backoff * 2^(n-1)秒延迟重试，达到最大次数后移入死信（outbox:dead）。
+
+        Args:
+            to_stdout: 是否将邮件重定向到stdout
+
+        Returns:
+            本次处理的邮件数量
+
+        Raises:
+            RuntimeError: 如果未启用outbox
+        """
+        logger = logging.getLogger(__name__)
+        if not self._outbox:
+            raise RuntimeError("outbox not enabled.")
+        self._outbox.promote_due("outbox")
+        entries = self._outbox.read_outbox()
+        for entry_id, fields in entries:
+            message: Outgoing_Mail = json.loads(fields["message"])
+            cleanup: list[str] = json.loads(fields.get("cleanup", "[]"))
+            attempts = int(fields.get("attempts", 0)) + 1
+            logger.info('sending "%s" (attempt %s)', message["subject"], attempts)
+            err = self.send_batch([message], to_stdout=to_stdout)[0]
+            if not err:
+                _remove(cleanup)
+            elif attempts >= self._outbox_attempts:
+                logger.error(
+                    'dead-lettered "%s" after %s attempts', message["subject"], attempts
                 )
-            ),
-            "content_text": content,
-            "attachments": attachments,
-        }
-        if to_stdout:
-            logger.warning("redirect to stdout")
-            return
+                self._outbox.dead_letter(
+                    "outbox", fields | {"attempts": attempts, "error": err}
+                )
+                _remove(cleanup)
+            else:
+                delay = self._outbox_backoff * 2 ** (attempts - 1)
+                logger.warning('retrying "%s" in %ss', message["subject"], delay)
+                self._outbox.retry_later(
+                    "outbox", fields | {"attempts": attempts, "error": err}, delay
+                )
+            self._outbox.ack("outbox", [entry_id], delete=True)
+        return len(entries)
+
+    def send_batch(
+        self, messages: list[Outgoing_Mail], to_stdout: bool = False, log: bool = True
+    ) -> list[str]:
+        """通过同一个SMTP会话依次发送多封邮件，发送日志一次写入log_message
+
+        Args:
+            messages: 待发送的邮件
+            to_stdout: 是否将邮件重定向到stdout
+            log: 是否写入log_message
+
+        Returns:
+            list[str]: 与messages一一对应的错误信息，发送成功时为空字符串
+        """
+        ret, logs = self._send_batch(messages, to_stdout)
+        if log and logs:
+            mysql.t_log.add_messages(logs)
+        return ret
+
+    def _send_batch(
+        self, messages: list[Outgoing_Mail], to_stdout: bool = False
+    ) -> tuple[list[str], list[Message_Log]]:
+        """通过同一个SMTP会话依次发送多封邮件
+
+        Returns:
+            (与messages一一对应的错误信息, 发送日志)
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("args: %s", {"messages": messages, "to_stdout": to_stdout})
+
+        ret: list[str] = []
+        logs: list[Message_Log] = []
+        for message in messages:
+            if to_stdout:
+                logger.warning("redirect to stdout")
+                ret.append("")
+                continue
+
+            err = ""
+            try:
+                for attachment in message["attachments"]:
+                    logger.info(
+                        'size of "{}": {:.2}MB'.format(
+                            os.path.basename(attachment),
+                            os.path.getsize(attachment) / 1048576,
+                        )
+                    )
+                to_addrs = [message["recipient"]]
+                if self._default_cc and message["needs_cc"]:
+                    to_addrs.append(self._default_cc)
+                self._smtp_session.send(self._build(message), to_addrs)
+            except Exception as e:
+                logger.error("send_mail error", exc_info=True)
+                err = str(e)
+            ret.append(err)
+            logs.append(
+                {
+                    "sender": "mail",
+                    "receiver": message["recipient"],
+                    "subject": message["subject"],
+                    "content": message["content"],
+                    "result": err,
+                }
+            )
+
+        logger.debug("return: %s", ret)
+        return ret, logs
 
+    def keepalive(self):
+        """保持SMTP会话（空闲超时时发送NOOP，断开时重连）"""
         try:
-            smtp_server = zmail.server(
-                username=self._smtp_config["username"],
-                password=self._smtp_config["password"],
-                smtp_host=self._smtp_config["host"],
-                smtp_port=self._smtp_config["port"],
-                smtp_ssl=self._smtp_config["ssl"],
-                smtp_tls=self._smtp_config["tls"],
-                timeout=300,
+            self._smtp_session.keepalive()
+        except Exception:
+            logging.getLogger(__name__).warning("keepalive failed", exc_info=True)
+
+    def _build(self, message: Outgoing_Mail) -> EmailMessage:
+        """将Outgoing_Mail组装为MIME邮件
+
+        Args:
+            message: 待发送的邮件
+
+        Returns:
+            EmailMessage
+        """
+        mime = EmailMessage()
+        mime["Subject"] = message["subject"]
+        mime["From"] = formataddr(("审核管理机器人", self._smtp_config["username"]))
+        mime["To"] = message["recipient"]
+        if self._default_cc and message["needs_cc"]:
+            mime["Cc"] = self._default_cc
+        mime["Date"] = formatdate(localtime=True)
+        mime.set_content(message["content"])
+        for attachment in message["attachments"]:
+            maintype, subtype = (
+                mimetypes.guess_type(attachment)[0] or "application/octet-stream"
+            ).split("/", 1)
+            with open(attachment, "rb") as f:
+                mime.add_attachment(
+                    f.read(),
+                    maintype=maintype,
+                    subtype=subtype,
+                    filename=os.path.basename(attachment),
+                )
+        return mime
+
+
+def _remove(paths: list[str]):
+    """删除文件或目录，忽略不存在的路径"""
+    logger = logging.getLogger(__name__)
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+        else:
+            continue
+        logger.debug('removed "%s"', path)
+
+
+class SMTPSession:
+    """smtplib的长连接封装，空闲时以NOOP保活，断线时自动重连"""
+
+    _config = {}
+    _keepalive = 60
+    _timeout = 300
+    _smtp: smtplib.SMTP | None = None
+    _last_active = 0.0
+
+    def __init__(self, config: dict, keepalive: int = 60, timeout: int = 300):
+        """初始化会话配置（首次发送时才建立连接）
+
+        Args:
+            config: 需包含'username'、'password'、'host'、'port'、'ssl'、'tls'
+            keepalive: 空闲超过该秒数时，使用前先发送NOOP确认连接可用
+            timeout: socket超时时间
+        """
+        self._config = config
+        self._keepalive = keepalive
+        self._timeout = timeout
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """建立连接并登录，已有连接将被关闭
+
+        Raises:
+            smtplib.SMTPException/OSError: 如果连接或登录失败
+        """
+        logger = logging.getLogger(__name__)
+        self.close()
+        if self._config["ssl"]:
+            smtp = smtplib.SMTP_SSL(
+                self._config["host"], self._config["port"], timeout=self._timeout
             )
-            if self._default_cc and needs_cc:
-                smtp_server.send_mail([recipient], mail, cc=self._default_cc)
-            else:
-                smtp_server.send_mail([recipient], mail)
-        except:
-            logger.error("send_mail error", exc_info=True)
-        finally:
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            mysql.t_log.add_message(
-                "mail",
-                recipient,
-                subject,
-                content,
-                str(exc_value) if exc_type else "",
+        else:
+            smtp = smtplib.SMTP(
+                self._config["host"], self._config["port"], timeout=self._timeout
             )
+            if self._config["tls"]:
+                smtp.starttls()
+        smtp.login(self._config["username"], self._config["password"])
+        self._smtp = smtp
+        self._last_active = time.monotonic()
+        logger.debug("SMTP session established.")
+
+    def close(self):
+        """关闭连接"""
+        if not self._smtp:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def keepalive(self):
+        """空闲超时时发送NOOP，失败时重连"""
+        with self._lock:
+            self._ensure()
+
+    def send(self, message: EmailMessage, to_addrs: list[str]):
+        """发送一封邮件；连接已断开时重连并重试一次
+
+        Args:
+            message: MIME邮件
+            to_addrs: 收件人（含抄送）
+
+        Raises:
+            smtplib.SMTPException/OSError: 如果发送失败
+        """
+        logger = logging.getLogger(__name__)
+        with self._lock:
+            self._ensure()
+            try:
+                self._smtp.send_message(message, to_addrs=to_addrs)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                logger.warning("SMTP session lost, reconnecting")
+                self.connect()
+                self._smtp.send_message(message, to_addrs=to_addrs)
+            self._last_active = time.monotonic()
+
+    def _ensure(self):
+        """确保存在可用连接（调用方需持有锁）"""
+        if not self._smtp:
+            self.connect()
+            return
+        if time.monotonic() - self._last_active < self._keepalive:
+            return
+        try:
+            code, _ = self._smtp.noop()
+        except (smtplib.SMTPException, OSError):
+            code = 0
+        if code != 250:
+            logging.getLogger(__name__).debug("NOOP failed (%s), reconnecting", code)
+            self.connect()
+        else:
+            self._last_active = time.monotonic()
@@ -4,6 +4,7 @@ import logging
 from mysql.connector import MySQLConnection
 from mysql.connector.pooling import MySQLConnectionPool
 from . import t_current, t_history, t_log, t_user
+from . import migrate
 from . import var
 
 
@@ -35,10 +36,19 @@ def init(**kwargs):
     test_cursor.close()
     logger.info(
         'MySQL configration (%s@%s) confirmed.', test_cnx.user, test_cnx.server_host)
+    # 执行数据库结构迁移，并检查高频查询的索引
+    logger.info('schema version: %s', migrate.upgrade(test_cnx))
+    migrate.check(test_cnx)
     test_cnx.close()
     var.kwargs = kwargs
 
 
+def on_change(listener):
+    ''' 注册数据变更的监听函数，current、user表变更后调用listener(表名)
+    '''
+    var.listeners.append(listener)
+
+
 def connect():
     logger = logging.getLogger(__name__)
     var.pool = MySQLConnectionPool(pool_name='RM', **var.kwargs)
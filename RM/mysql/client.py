@@ -1,4 +1,5 @@
 # -*- coding: UTF-8 -*-
+import logging
 from mysql.connector.cursor import MySQLCursor
 from mysql.connector.pooling import MySQLConnectionPool
 from . import var
@@ -47,3 +48,17 @@ class Selection:
         self._cursor.close()
         self._cnx.close()
         return not bool(exc_type)
+
+
+def changed(table: str):
+    ''' 通知监听函数数据已变更（在事务提交后调用），监听函数的异常不影响调用方
+
+    Args:
+        table: 表名
+    '''
+    logger = logging.getLogger(__name__)
+    for listener in var.listeners:
+        try:
+            listener(table)
+        except Exception:
+            logger.warning('listener failed: %s', table, exc_info=True)
@@ -0,0 +1,176 @@
+# -*- coding: UTF-8 -*-
+''' 数据库结构迁移：按版本顺序执行，已执行的版本记录在schema_version表中
+'''
+import logging
+from mysql.connector import MySQLConnection
+
+# 迁移列表：(版本, 说明, 步骤)
+# 步骤为('column', 表名, 列名, 定义)、('index', 表名, 索引名, 列名列表)或('sql', 语句)，均可重复执行：
+#   column步骤在列已存在时跳过；index步骤在索引已存在时跳过，列不存在时迁移失败，版本不会被记录
+MIGRATIONS: list[tuple[int, str, list[tuple]]] = [
+    (1, 'indexes for query patterns', [
+        # 旧版数据库中可能缺少的列和表
+        ('column', 'user', 'email', "VARCHAR(100) DEFAULT ''"),
+        ('sql', '''
+            CREATE TABLE IF NOT EXISTS log_message (
+                id INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sender VARCHAR(20) DEFAULT '',
+                receiver TEXT,
+                subject TEXT,
+                content TEXT,
+                result TEXT
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        '''),
+        ('index', 'current', 'idx_current_authorid', ['authorid']),
+        ('index', 'current', 'idx_current_reviewerid', ['reviewerid']),
+        ('index', 'history', 'idx_history_authorid', ['authorid']),
+        ('index', 'history', 'idx_history_reviewerid', ['reviewerid']),
+        ('index', 'history', 'idx_history_end', ['end']),
+        ('index', 'user', 'idx_user_email', ['email']),
+        ('index', 'user', 'idx_user_role_available', ['role', 'available']),
+        ('index', 'log_mail', 'idx_log_mail_time', ['time']),
+        ('index', 'log_manage', 'idx_log_manage_time', ['time']),
+        ('index', 'log_message', 'idx_log_message_time', ['time']),
+    ]),
+    (2, 'user_alias for forwarding addresses', [
+        ('sql', '''
+            CREATE TABLE IF NOT EXISTS user_alias (
+                email VARCHAR(100) NOT NULL PRIMARY KEY,
+                user_id VARCHAR(20) NOT NULL,
+                INDEX idx_user_alias_user_id (user_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        '''),
+    ]),
+]
+
+# 高频查询及其应使用的索引：(说明, 语句, 参数, 表名, 索引名)
+HOT_QUERIES: list[tuple[str, str, tuple, str, str]] = [
+    ('t_current.search_mine(author)', 'SELECT id FROM current WHERE authorid = %s', ('',), 'current', 'idx_current_authorid'),
+    ('t_current.search_mine(reviewer)', 'SELECT id FROM current WHERE reviewerid = %s', ('',), 'current', 'idx_current_reviewerid'),
+    ('t_history.search(authorid)', 'SELECT id FROM history WHERE authorid = %s', ('',), 'history', 'idx_history_authorid'),
+    ('t_history.search(reviewerid)', 'SELECT id FROM history WHERE reviewerid = %s', ('',), 'history', 'idx_history_reviewerid'),
+    ('t_user.fetch_by_email', 'SELECT id FROM user WHERE email = %s', ('',), 'user', 'idx_user_email'),
+    ('t_user.pop', 'SELECT id FROM user WHERE available = 1 AND role = 1', (), 'user', 'idx_user_role_available'),
+]
+
+
+def upgrade(cnx: MySQLConnection) -> int:
+    ''' 执行未执行过的迁移，多个进程同时启动时通过GET_LOCK串行执行
+
+    Args:
+        cnx: 数据库连接
+
+    Returns:
+        当前版本
+
+    Raises:
+        RuntimeError: 如果无法获取锁，或迁移步骤失败（该版本不会被记录）
+    '''
+    logger = logging.getLogger(__name__)
+    cursor = cnx.cursor(buffered=True)
+    cursor.execute("SELECT GET_LOCK('RM.migrate', 60)")
+    if cursor.fetchone()[0] != 1:
+        cursor.close()
+        raise RuntimeError('Cannot acquire migration lock.')
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT NOT NULL PRIMARY KEY,
+                description VARCHAR(200) DEFAULT '',
+                applied TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''')
+        cursor.execute('SELECT IFNULL(MAX(version), 0) FROM schema_version')
+        current = int(cursor.fetchone()[0])
+        for version, description, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info('applying migration %s: %s', version, description)
+            for step in steps:
+                _apply(cursor, step)
+            cursor.execute(
+                'INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+                (version, description)
+            )
+            cnx.commit()
+            current = version
+        logger.debug('schema version: %s', current)
+        return current
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK('RM.migrate')")
+        cursor.fetchall()
+        cursor.close()
+
+
+def _apply(cursor, step: tuple):
+    ''' 执行单个迁移步骤（可重复执行）
+
+    Raises:
+        RuntimeError: 如果索引的列不存在
+    '''
+    logger = logging.getLogger(__name__)
+    if step[0] == 'sql':
+        cursor.execute(step[1])
+        return
+    if step[0] == 'column':
+        _, table, name, definition = step
+        if _count_columns(cursor, table, [name]):
+            logger.debug('column exists: %s.%s', table, name)
+            return
+        cursor.execute('ALTER TABLE `{}` ADD COLUMN `{}` {}'.format(table, name, definition))
+        logger.info('added column %s.%s', table, name)
+        return
+    _, table, name, columns = step
+    cursor.execute('''
+        SELECT COUNT(1) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    ''', (table, name))
+    if cursor.fetchone()[0]:
+        logger.debug('index exists: %s.%s', table, name)
+        return
+    if _count_columns(cursor, table, columns) != len(columns):
+        raise RuntimeError(f'Cannot create index {table}.{name}: missing columns.')
+    cursor.execute('ALTER TABLE `{}` ADD INDEX `{}` ({})'.format(
+        table, name, ', '.join([f'`{column}`' for column in columns])
+    ))
+    logger.info('created index %s.%s', table, name)
+
+
+def _count_columns(cursor, table: str, columns: list[str]) -> int:
+    ''' 统计{table}中存在的{columns}数量
+    '''
+    cursor.execute(
+        f'''
+        SELECT COUNT(1) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name IN ({', '.join(['%s'] * len(columns))})
+        ''', (table, *columns)
+    )
+    return cursor.fetchone()[0]
+
+
+def check(cnx: MySQLConnection) -> list[str]:
+    ''' 使用EXPLAIN检查高频查询是否可以使用对应的索引
+
+    Args:
+        cnx: 数据库连接
+
+    Returns:
+        无法使用索引的查询说明
+    '''
+    logger = logging.getLogger(__name__)
+    ret = []
+    cursor = cnx.cursor(buffered=True, dictionary=True)
+    try:
+        for description, sql, params, table, index in HOT_QUERIES:
+            cursor.execute('EXPLAIN ' + sql, params)
+            rows = [row for row in cursor.fetchall() if row['table'] == table]
+            possible_keys = rows[0]['possible_keys'].split(',') if rows and rows[0]['possible_keys'] else []
+            if index not in possible_keys:
+                logger.warning('%s cannot use %s (possible_keys: %s)', description, index, possible_keys)
+                ret.append(description)
+            else:
+                logger.debug('%s: key=%s', description, rows[0]['key'])
+    finally:
+        cursor.close()
+    return ret
@@ -4,7 +4,7 @@
 import logging
 import json
 import hashlib
-from .client import Transaction, Selection
+from .client import Transaction, Selection, changed
 from . import t_user
 from ..types import *
 
@@ -68,6 +68,47 @@ def search(page_index: int = 1, page_size: int = 10, **kwargs) -> Currents:
     return ret
 
 
+def search_mine(user_id: str) -> Currents:
+    ''' 查询{user_id}作为撰写人或审核人的全部项目（一次查询，两个分支分别使用authorid、reviewerid索引）
+
+    Args:
+        user_id: 用户ID
+
+    Returns:
+        {"current": list[MineRecord], 'total': int}，撰写人的项目在前；自己审核自己的项目出现两次
+    '''
+    logger = logging.getLogger(__name__)
+    logger.debug('args: %s', {'user_id': user_id})
+
+    ret: Currents = {'current': [], 'total': 0}
+    with Selection() as cursor:
+        select = '''
+            SELECT c.id, u_a.id, u_a.name, u_r.id, u_r.name, UNIX_TIMESTAMP(c.start) AS start, null, c.pages, c.urgent, c.company, c.names, '{}' AS role
+            FROM current c
+            LEFT JOIN user u_a ON c.authorid = u_a.id
+            LEFT JOIN user u_r ON c.reviewerid = u_r.id
+            WHERE c.{} = %s
+        '''
+        sql = f'''
+            {select.format('author', 'authorid')}
+            UNION ALL
+            {select.format('reviewer', 'reviewerid')}
+            ORDER BY role, start
+        '''
+        cursor.execute(sql, (user_id, user_id))
+        keys = ['id', 'authorid', 'authorname', 'reviewerid', 'reviewername',
+                'start', 'end', 'pages', 'urgent', 'company', 'names', 'role']
+        for row in cursor.fetchall():
+            logger.debug('row: %s', row)
+            d = MineRecord(zip(keys, row))
+            d['names'] = json.loads(d['names'])
+            d['urgent'] = bool(d['urgent'])
+            ret['current'].append(d)
+    ret['total'] = len(ret['current'])
+    logger.debug('return: %s', ret)
+    return ret
+
+
 def fetch(current_id: str) -> CurrentRecord | None:
     ''' 按照current_id查询对应项目的信息
 
@@ -151,6 +192,7 @@ def add(names: dict[str, str], company: str, pages: int, urgent: bool, authorid:
             "UPDATE user SET pages = pages + %s WHERE id = %s", 
             (int(pages * 1.5) if urgent else pages, reviewerid)
         )
+    changed('current')
 
 
 def edit(current_id: str, **kwargs):
@@ -228,6 +270,7 @@ def edit(current_id: str, **kwargs):
                         record['reviewerid'],
                     ),
                 )
+    changed('current')
 
 
 def finish(current_id: str, finish_timestamp: int):
@@ -269,6 +312,7 @@ def finish(current_id: str, finish_timestamp: int):
             finish_timestamp,
         )
         )
+    changed('current')
 
 
 def finish_by_name(names: dict[str, str], finish_timestamp: int):
@@ -313,6 +357,7 @@ def delete(current_id: str):
             "UPDATE user SET pages = pages - %s WHERE id = %s",
             (weighted_pages, record['reviewerid']),
         )
+    changed('current')
 
 
 def gen_id(names: dict[str, str]) -> str:
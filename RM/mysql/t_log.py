@@ -95,3 +95,28 @@ def add_message(sender: Literal['mail', 'wxwork', 'dingtalk'], receiver: str, su
             VALUES (%s, %s, %s, %s, %s)
             ''', (sender, receiver, subject, content, result)
         )
+
+
+def add_messages(messages: list[Message_Log]):
+    ''' 向log_message中批量插入操作日志（一次提交）
+
+    Args:
+        messages: 日志列表
+    '''
+    logger = logging.getLogger(__name__)
+    logger.debug('args: %s', {'messages': messages})
+    if not messages:
+        return
+
+    with Transaction() as cursor:
+        cursor.executemany('''
+            INSERT INTO log_message (sender, receiver, subject, content, result)
+            VALUES (%s, %s, %s, %s, %s)
+            ''', [(
+                message['sender'],
+                message['receiver'],
+                message['subject'],
+                message['content'],
+                message['result'],
+            ) for message in messages]
+        )
@@ -5,7 +5,7 @@
 '''
 from typing import Literal
 import logging
-from .client import Transaction, Selection
+from .client import Transaction, Selection, changed
 from ..types import *
 
 
@@ -76,6 +76,41 @@ def fetch(user_id: str) -> UserItem | None:
     return ret
 
 
+def fetch_by_email(email: str) -> UserItem | None:
+    ''' 按照邮箱精确获取user表内容，user表中无匹配时再查询user_alias表中登记的转发邮箱
+
+    Args:
+        email: 邮箱地址
+
+    Returns:
+        UserItem | None
+    '''
+    logger = logging.getLogger(__name__)
+    logger.debug('args: %s', {'email': email})
+
+    ret: UserItem | None = None
+    with Selection() as cursor:
+        sql = '''
+            SELECT id, name, phone, email, role, status
+            FROM user
+            WHERE available = 1 AND email = %s
+            UNION ALL
+            SELECT user.id, user.name, user.phone, user.email, user.role, user.status
+            FROM user_alias JOIN user ON user.id = user_alias.user_id
+            WHERE user.available = 1 AND user_alias.email = %s
+            LIMIT 2
+        '''
+        cursor.execute(sql, (email, email))
+        rows = cursor.fetchall()
+        logger.debug('rows: %s', rows)
+        # 邮箱重复登记时无法确定用户，视为无匹配
+        if len(rows) == 1 or (rows and rows[0][0] == rows[-1][0]):
+            keys = ['id', 'name', 'phone', 'email', 'role', 'status']
+            ret = UserItem(zip(keys, rows[0]))
+    logger.debug('return: %s', ret)
+    return ret
+
+
 def __contains__(user_id: str) -> bool:
     ''' 检查user表中是否存在{user_id}
 
@@ -168,6 +203,7 @@ def set_status(user_id: str, status: Literal[0, 1, 2]):
             WHERE id = %s
         '''
         cursor.execute(sql, (status, user_id))
+    changed('user')
 
 
 def reset_status(days: int = 7):
@@ -186,3 +222,4 @@ def reset_status(days: int = 7):
             WHERE status != 0 AND DATEDIFF(NOW(), status_since) >= %s
         '''
         cursor.execute(sql, (days,))
+    changed('user')
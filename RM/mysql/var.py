@@ -1,4 +1,7 @@
+from typing import Callable
 from mysql.connector.pooling import MySQLConnectionPool
 
 kwargs = {}
 pool: MySQLConnectionPool = None
+# 数据变更的监听函数，参数为表名
+listeners: list[Callable[[str], None]] = []
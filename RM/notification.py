@@ -1,249 +1,172 @@
 # -*- coding: UTF-8 -*-
-from typing import TypedDict
+from typing import Literal
 import logging
 import datetime
-from . import mysql
+import string
 from .types import *
 
 
-def build_submit_mail(record: CurrentRecord, warnings: list[str]) -> Built_Message:
-    ''' 根据传入的参数，生成邮件内容
-
-    Args:
-        record: 对象结果记录
-        warnings: 处理过程中产生的告警信息
-
-    Returns:
-        Built_Message
-    '''
-    logger = logging.getLogger(__name__)
-    logger.debug('args: %s', {'record': record, 'warnings': warnings})
-
-    # 邮件内容
-    ret: Built_Message = {'subject': '', 'content': ''}
-    urgent = '是' if record['urgent'] else '否'
-    ret['subject'] = '[报告分配审核] {}'.format('+'.join(record['names']))
-    ret['content'] = (
-        '项目名称：\r\n'
-        '{}\r\n'
-        '委托单位：\r\n'
-        '  - {}\r\n'
-        '编写人：{}\r\n'
-        '页数：{}\r\n'
-        '加急：{}\r\n'.format(
-            '\r\n'.join([f"  - {key}：{value}" for key,
-                        value in record['names'].items()]),
-            record['company'],
-            record['authorname'],
-            record['pages'],
-            urgent
-        )
-    )
-
-    logger.debug('return: %s', ret)
-    return ret
-
-
-def build_submit_dingtalk(record: CurrentRecord, warnings: list[str]) -> Built_Message:
-    ''' 根据传入的参数，生成钉钉通知内容
-
-    Args:
-        record: 对象结果记录
-        warnings: 处理过程中产生的告警信息
-
-    Returns:
-        Built_Message
-    '''
-    logger = logging.getLogger(__name__)
-    logger.debug('args: %s', {'record': record, 'warnings': warnings})
-
-    # 钉钉通知内容
-    ret: Built_Message = {'subject': '报告分配审核', 'content': ''}
-    urgent = '是' if record['urgent'] else '否'
-    user = mysql.t_user.fetch(record['reviewerid'])
-    ret['content'] = (
-        '**项目编号（分配审核）**\n\n'
-        '{}\n\n'
-        '**页数**\n\n'
-        '- {}\n\n'
-        '**加急**\n\n'
-        '- {}\n\n'
-        '**分配**\n\n'
-        '- {} -> @{}\n\n'.format(
-            '\n'.join(['- ' + code for code in record['names']]),
-            record['pages'],
-            urgent,
-            record['authorname'],
-            user['phone'] if user else record['reviewername'],
-        )
-    )
-    if warnings:
-        ret['content'] += (
-            '> ###### Warnings:\n\n' +
-            '\n'.join(['> ###### - ' + warning for warning in warnings]) + '\n\n'
-        )
-
-    logger.debug('return: %s', ret)
-    return ret
-
-
-def build_submit_wxwork(record: CurrentRecord, warnings: list[str]) -> Built_Message:
-    ''' 根据传入的参数，生成企业微信通知内容
-
-    Args:
-        record: 对象结果记录
-        warnings: 处理过程中产生的告警信息
-
-    Returns:
-        Built_Message
+class Template:
+    ''' 预编译的文本模板，导入时解析为(文本, 字段名)序列，渲染时直接拼接
     '''
-    logger = logging.getLogger(__name__)
-    logger.debug('args: %s', {'record': record, 'warnings': warnings})
 
-    # 企业微信通知内容
-    ret: Built_Message = {'subject': '', 'content': ''}
-    urgent = '是' if record['urgent'] else '否'
-    ret['content'] = (
-        '- [报告分配审核] -\n\n'
-        '项目编号\n'
-        '{}\n'
-        '页数\n'
-        '· {}\n'
-        '加急\n'
-        '· {}\n'
-        '分配\n'
-        '· {} -> {}'.format(
-            '\n'.join(['· ' + code for code in record['names']]),
-            record['pages'],
-            urgent,
-            record['authorname'],
-            record['reviewername'],
-        )
-    )
-    if warnings:
-        ret['content'] += (
-            '\n\nWarnings:\n' +
-            '\n'.join(['· ' + warning for warning in warnings])
-        )
-
-    logger.debug('return: %s', ret)
-    return ret
-
-
-def build_finish_mail(record: HistoryRecord, warnings: list[str]) -> Built_Message:
-    ''' 根据传入的参数，生成邮件通知内容
+    def __init__(self, text: str):
+        self._parts = [
+            (literal, field) for literal, field, _, _ in string.Formatter().parse(text)
+        ]
+
+    def render(self, context: Notify_Context) -> str:
+        return ''.join([
+            literal + context[field] if field else literal
+            for literal, field in self._parts
+        ])
+
+
+# 各通知方式的模板：{事件: {通知方式: (标题, 内容)}}
+TEMPLATES: dict[str, dict[str, tuple[Template, Template]]] = {
+    'submit': {
+        'mail': (
+            Template('[报告分配审核] {codes}'),
+            Template(
+                '项目名称：\r\n'
+                '{names_mail}\r\n'
+                '委托单位：\r\n'
+                '  - {company}\r\n'
+                '编写人：{authorname}\r\n'
+                '页数：{pages}\r\n'
+                '加急：{urgent}\r\n'
+            ),
+        ),
+        'dingtalk': (
+            Template('报告分配审核'),
+            Template(
+                '**项目编号（分配审核）**\n\n'
+                '{codes_dingtalk}\n\n'
+                '**页数**\n\n'
+                '- {pages}\n\n'
+                '**加急**\n\n'
+                '- {urgent}\n\n'
+                '**分配**\n\n'
+                '- {authorname} -> @{reviewer_at}\n\n'
+            ),
+        ),
+        'wxwork': (
+            Template(''),
+            Template(
+                '- [报告分配审核] -\n\n'
+                '项目编号\n'
+                '{codes_wxwork}\n'
+                '页数\n'
+                '· {pages}\n'
+                '加急\n'
+                '· {urgent}\n'
+                '分配\n'
+                '· {authorname} -> {reviewername}'
+            ),
+        ),
+    },
+    'finish': {
+        'mail': (
+            Template('[报告完成审核] {codes}'),
+            Template(
+                '项目名称：\r\n'
+                '{names_mail}\r\n'
+                '委托单位：\r\n'
+                '  - {company}\r\n'
+                '编写人：{authorname}\r\n'
+                '审核人：{reviewername}\r\n'
+                '页数：{pages}\r\n'
+                '加急：{urgent}\r\n'
+                '提交时间：{start}\r\n'
+                '完成时间：{end}'
+            ),
+        ),
+        'dingtalk': (
+            Template('报告完成审核'),
+            Template(
+                '**项目编号（完成审核）**\n\n'
+                '{codes_dingtalk}\n\n'
+                '**交还**\n\n'
+                '- @{author_at} <- {reviewername}\n\n'
+            ),
+        ),
+        'wxwork': (
+            Template(''),
+            Template(
+                '- [报告完成审核] -\n\n'
+                '项目编号\n'
+                '{codes_wxwork}\n'
+                '交还\n'
+                '· {authorname} <- {reviewername}'
+            ),
+        ),
+    },
+}
+# 告警信息的格式：{通知方式: (开头, 每行前缀, 结尾)}，邮件不包含告警信息
+WARNINGS: dict[str, tuple[str, str, str]] = {
+    'dingtalk': ('> ###### Warnings:\n\n', '> ###### - ', '\n\n'),
+    'wxwork': ('\n\nWarnings:\n', '· ', ''),
+}
+CHANNELS = ('mail', 'dingtalk', 'wxwork')
+
+
+def build_context(record: CurrentRecord | HistoryRecord, warnings: list[str], author: UserItem | None = None, reviewer: UserItem | None = None) -> Notify_Context:
+    ''' 生成渲染通知所需的全部字段，用户信息由调用方预先查询
 
     Args:
         record: 对象结果记录
-        warnings: 处理过程中产生的告警信息
+        warnings: 处理过程中产生的告警信息（渲染时读取，可在渲染前追加）
+        author: 编写人信息，用于钉钉@手机号
+        reviewer: 审核人信息，用于钉钉@手机号
 
     Returns:
-        {'subject': (str), 'content': (str)}
+        Notify_Context
     '''
     logger = logging.getLogger(__name__)
     logger.debug('args: %s', {'record': record, 'warnings': warnings})
 
-    # 邮件内容
-    ret: Built_Message = {'subject': '', 'content': ''}
-    urgent = '是' if record['urgent'] else '否'
-    ret['subject'] = '[报告完成审核] {}'.format('+'.join(record['names']))
-    ret['content'] = (
-        '项目名称：\r\n'
-        '{}\r\n'
-        '委托单位：\r\n'
-        '  - {}\r\n'
-        '编写人：{}\r\n'
-        '审核人：{}\r\n'
-        '页数：{}\r\n'
-        '加急：{}\r\n'
-        '提交时间：{}\r\n'
-        '完成时间：{}'.format(
-            '\r\n'.join(['  - {}：{}'.format(key, value)
-                        for key, value in record['names'].items()]),
-            record['company'],
-            record['authorname'],
-            record['reviewername'],
-            record['pages'],
-            urgent,
-            datetime.datetime.fromtimestamp(
-                record['start']).strftime("%Y-%m-%d %H:%M"),
-            datetime.datetime.fromtimestamp(
-                record['end']).strftime("%Y-%m-%d %H:%M")
-        )
-    )
-
+    ret: Notify_Context = {
+        'codes': '+'.join(record['names']),
+        'names_mail': '\r\n'.join([f"  - {key}：{value}" for key, value in record['names'].items()]),
+        'codes_dingtalk': '\n'.join(['- ' + code for code in record['names']]),
+        'codes_wxwork': '\n'.join(['· ' + code for code in record['names']]),
+        'company': str(record['company']),
+        'authorname': record['authorname'],
+        'reviewername': record['reviewername'],
+        'author_at': author['phone'] if author else record['authorname'],
+        'reviewer_at': reviewer['phone'] if reviewer else record['reviewername'],
+        'pages': str(record['pages']),
+        'urgent': '是' if record['urgent'] else '否',
+        'start': datetime.datetime.fromtimestamp(record['start']).strftime('%Y-%m-%d %H:%M'),
+        'end': datetime.datetime.fromtimestamp(record['end']).strftime('%Y-%m-%d %H:%M') if record['end'] else '',
+        'warnings': warnings,
+    }
     logger.debug('return: %s', ret)
     return ret
 
 
-def build_finish_dingtalk(record: HistoryRecord, warnings: list[str]) -> Built_Message:
-    ''' 根据传入的参数，生成钉钉通知内容
+def render(event: Literal['submit', 'finish'], context: Notify_Context, channels: tuple[str, ...] = CHANNELS) -> dict[str, Built_Message]:
+    ''' 使用同一个context渲染各通知方式的内容
 
     Args:
-        record: 对象结果记录
-        warnings: 处理过程中产生的告警信息
+        event: 分配审核（submit）或完成审核（finish）
+        context: build_context的结果
+        channels: 需要渲染的通知方式
 
     Returns:
-        {'subject': (str), 'content': (str)}
+        {通知方式: Built_Message}
     '''
     logger = logging.getLogger(__name__)
-    logger.debug('args: %s', {'record': record, 'warnings': warnings})
-
-    # 钉钉通知内容
-    ret: Built_Message = {'subject': '报告完成审核', 'content': ''}
-    user = mysql.t_user.fetch(record['authorid'])
-    ret['content'] = (
-        '**项目编号（完成审核）**\n\n'
-        '{}\n\n'
-        '**交还**\n\n'
-        '- @{} <- {}\n\n'.format(
-            '\n'.join(['- ' + code for code in record['names']]),
-            user['phone'] if user else record['authorname'],
-            record['reviewername']
-        )
-    )
-    if warnings:
-        ret['content'] += (
-            '> ###### Warnings:\n\n' +
-            '\n'.join(['> ###### - ' + warning for warning in warnings]) + '\n\n'
-        )
-
-    logger.debug('return: %s', ret)
-    return ret
-
-
-def build_finish_wxwork(record: HistoryRecord, warnings: list[str]) -> Built_Message:
-    ''' 根据传入的参数，生成企业微信通知内容
-
-    Args:
-        record: 对象结果记录
-        warnings: 处理过程中产生的告警信息
-
-    Returns:
-        Built_Message
-    '''
-    logger = logging.getLogger(__name__)
-    logger.debug('args: %s', {'record': record, 'warnings': warnings})
-
-    # 企业微信通知内容
-    ret: Built_Message = {'subject': '', 'content': ''}
-    ret['content'] = (
-        '- [报告完成审核] -\n\n'
-        '项目编号\n'
-        '{}\n'
-        '交还\n'
-        '· {} <- {}'.format(
-            '\n'.join(['· ' + code for code in record['names']]),
-            record['authorname'],
-            record['reviewername']
-        )
-    )
-    if warnings:
-        ret['content'] += (
-            '\n\nWarnings:\n' +
-            '\n'.join(['· ' + warning for warning in warnings])
-        )
 
+    ret: dict[str, Built_Message] = {}
+    for channel in channels:
+        subject, content = TEMPLATES[event][channel]
+        ret[channel] = {'subject': subject.render(context), 'content': content.render(context)}
+        if channel in WARNINGS and context['warnings']:
+            start, prefix, end = WARNINGS[channel]
+            ret[channel]['content'] += (
+                start + '\n'.join([prefix + warning for warning in context['warnings']]) + end
+            )
     logger.debug('return: %s', ret)
     return ret
 
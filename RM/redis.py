@@ -1,8 +1,11 @@
 # -*- coding: UTF-8 -*-
-from typing import Literal
+from typing import Callable, Iterator, Literal
 import logging
+import json
+import time
 import redis
 import socket
+import uuid
 
 
 class RedisStream:
@@ -27,7 +30,7 @@ class RedisStream:
         if not self._r.ping():
             raise ValueError("Cannot init redis.")
         logger.info("Redis configration (%s) confirmed.", host)
-        for key in ["receive", "read", "resend"]:
+        for key in ["receive", "read", "resend", "maintain", "outbox", "document"]:
             try:
                 groups = self._r.xinfo_groups(name=key)
                 for group in groups:
@@ -46,7 +49,7 @@ class RedisStream:
     def add(
         self,
         source: str,
-        name: Literal["receive", "read", "resend"],
+        name: Literal["receive", "read", "resend", "maintain", "outbox", "document"],
         fields: dict = None,
     ) -> str:
         """在Stream中插入一条指令
@@ -74,7 +77,7 @@ class RedisStream:
         entries = self._r.xreadgroup(
             groupname="worker",
             consumername=socket.gethostname(),
-            streams={"receive": ">", "read": ">", "resend": ">"},
+            streams={"receive": ">", "read": ">", "resend": ">", "maintain": ">"},
             count=1,
             block=60000,
         )
@@ -86,21 +89,195 @@ class RedisStream:
         logger.debug("entries: %s", entries)
         return entries
 
-    def ack(self, name: Literal["receive", "read", "resend"], ids: list[str]) -> int:
+    def ack(
+        self,
+        name: Literal["receive", "read", "resend", "maintain", "outbox", "document"],
+        ids: list[str],
+        delete: bool = False,
+    ) -> int:
         """从PEL中去除消息
 
         Args:
             name: 键名
             ids: 消息ID
+            delete: 是否同时从Stream中删除消息
 
         Returns:
             成功去除的消息数量
         """
         logger = logging.getLogger(__name__)
-        count = self._r.xack(name, "worker", ids)
+        if isinstance(ids, str):
+            ids = [ids]
+        count = self._r.xack(name, "worker", *ids)
+        if delete:
+            self._r.xdel(name, *ids)
         logger.debug("count: %s", count)
         return count
 
+    def read_outbox(self, block: int = 5000) -> list[tuple[str, dict]]:
+        """读取outbox中待发送的邮件，优先认领超过10分钟未确认的消息（发送进程异常退出时遗留）
+
+        Args:
+            block: 阻塞等待时间（毫秒）
+
+        Returns:
+            [(entry id, fields)]
+        """
+        logger = logging.getLogger(__name__)
+        consumer = socket.gethostname()
+        # > XAUTOCLAIM outbox worker consumer 600000 0-0 COUNT 10
+        # 1) "0-0"
+        # 2) 1) 1) "1-0"
+        #       2) 1) "message"
+        #          2) "..."
+        # 3) (empty array)
+        claimed = self._r.xautoclaim(
+            "outbox", "worker", consumer, min_idle_time=600000, count=10
+        )
+        entries = [entry for entry in claimed[1] if entry[1]]
+        if entries:
+            logger.info("claimed %s pending entries", len(entries))
+        else:
+            ret = self._r.xreadgroup(
+                groupname="worker",
+                consumername=consumer,
+                streams={"outbox": ">"},
+                count=10,
+                block=block,
+            )
+            entries = ret[0][1] if ret else []
+        logger.debug("entries: %s", entries)
+        return entries
+
+    def retry_later(self, name: Literal["outbox"], fields: dict, delay: float):
+        """将消息放入延迟集合，{delay}秒后由promote_due重新插入Stream
+
+        Args:
+            name: 键名
+            fields: 消息内容
+            delay: 延迟时间（秒）
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("args: %s", {"name": name, "fields": fields, "delay": delay})
+        self._r.zadd(
+            f"{name}:retry",
+            {json.dumps(fields, ensure_ascii=False): time.time() + delay},
+        )
+
+    def promote_due(self, name: Literal["outbox"]) -> int:
+        """将延迟集合中已到期的消息重新插入Stream
+
+        Args:
+            name: 键名
+
+        Returns:
+            重新插入的消息数量
+        """
+        logger = logging.getLogger(__name__)
+        count = 0
+        for member in self._r.zrangebyscore(f"{name}:retry", 0, time.time()):
+            # 多个进程同时处理时，仅由成功移除成员的进程插入
+            if self._r.zrem(f"{name}:retry", member):
+                self._r.xadd(name, json.loads(member))
+                count += 1
+        if count:
+            logger.debug("promoted %s entries", count)
+        return count
+
+    def dead_letter(self, name: Literal["outbox"], fields: dict) -> str:
+        """将多次处理失败的消息移入死信Stream（保留最近约1000条）
+
+        Args:
+            name: 键名
+            fields: 消息内容
+
+        Returns:
+            entry id
+        """
+        logger = logging.getLogger(__name__)
+        entry_id = self._r.xadd(f"{name}:dead", fields, maxlen=1000, approximate=True)
+        logger.debug("entry_id: %s", entry_id)
+        return entry_id
+
+    def list_dead(self, name: Literal["outbox"], count: int = 100) -> list[dict]:
+        """按时间倒序列出死信
+
+        Args:
+            name: 键名
+            count: 最大数量
+
+        Returns:
+            [{'id': entry id, **fields}]
+        """
+        return [
+            {"id": entry_id, **fields}
+            for entry_id, fields in self._r.xrevrange(f"{name}:dead", count=count)
+        ]
+
+    def call(
+        self, name: Literal["document"], fields: dict, timeout: int = 360
+    ) -> dict:
+        """在Stream中插入一个任务，并阻塞等待处理方通过reply返回结果
+
+        Args:
+            name: 键名
+            fields: 任务参数
+            timeout: 等待时间（秒）
+
+        Returns:
+            处理结果
+
+        Raises:
+            TimeoutError: 如果超时未返回结果
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("args: %s", {"name": name, "fields": fields})
+        reply_key = f"{name}:reply:{uuid.uuid4().hex}"
+        entry_id = self._r.xadd(name, {**fields, "reply": reply_key})
+        logger.debug("entry_id: %s", entry_id)
+        ret = self._r.blpop(reply_key, timeout=timeout)
+        if not ret:
+            raise TimeoutError(f"{name} job timed out ({entry_id})")
+        logger.debug("reply: %s", ret[1])
+        return json.loads(ret[1])
+
+    def read_jobs(
+        self, name: Literal["document"], count: int = 1, block: int = 60000
+    ) -> list[tuple[str, dict]]:
+        """以阻塞方式读取任务
+
+        Args:
+            name: 键名
+            count: 最大数量
+            block: 阻塞等待时间（毫秒）
+
+        Returns:
+            [(entry id, fields)]
+        """
+        logger = logging.getLogger(__name__)
+        ret = self._r.xreadgroup(
+            groupname="worker",
+            consumername=socket.gethostname(),
+            streams={name: ">"},
+            count=count,
+            block=block,
+        )
+        entries = ret[0][1] if ret else []
+        logger.debug("entries: %s", entries)
+        return entries
+
+    def reply(self, reply_key: str, result: dict):
+        """返回任务结果，结果保留10分钟
+
+        Args:
+            reply_key: 任务中的reply字段
+            result: 处理结果
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("args: %s", {"reply_key": reply_key, "result": result})
+        self._r.rpush(reply_key, json.dumps(result, ensure_ascii=False))
+        self._r.expire(reply_key, 600)
+
     def trim(self):
         """修剪Stream长度至10"""
         logger = logging.getLogger(__name__)
@@ -109,3 +286,217 @@ class RedisStream:
         )
         logger.debug("read original len: %s", self._r.xtrim(name="read", maxlen=10))
         logger.debug("resend original len: %s", self._r.xtrim(name="resend", maxlen=10))
+        logger.debug(
+            "maintain original len: %s", self._r.xtrim(name="maintain", maxlen=10)
+        )
+
+    def track_progress(self, entry_id: str, owner: str):
+        """记录指令的发起用户，进度初始为queued，保留1小时
+
+        Args:
+            entry_id: 指令的entry id
+            owner: 发起指令的用户ID
+        """
+        key = f"progress:{entry_id}"
+        event = {"state": "queued", "detail": "", "timestamp": time.time()}
+        self._r.hset(key, "owner", owner)
+        # Worker可能已开始处理，不覆盖已有进度
+        self._r.hsetnx(key, "event", json.dumps(event, ensure_ascii=False))
+        self._r.expire(key, 3600)
+
+    def progress_owner(self, entry_id: str) -> str:
+        """获取指令的发起用户，未记录时返回空字符串
+
+        Args:
+            entry_id: 指令的entry id
+        """
+        return self._r.hget(f"progress:{entry_id}", "owner") or ""
+
+    def publish_progress(
+        self,
+        entry_id: str,
+        state: Literal["extracting", "archiving", "sending", "done", "error"],
+        detail: str = "",
+    ):
+        """发布指令的处理进度，同时保存最新进度供后续订阅方读取
+
+        Args:
+            entry_id: 指令的entry id
+            state: 进度
+            detail: 说明
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("args: %s", {"entry_id": entry_id, "state": state})
+        key = f"progress:{entry_id}"
+        event = json.dumps(
+            {"state": state, "detail": detail, "timestamp": time.time()},
+            ensure_ascii=False,
+        )
+        self._r.hset(key, "event", event)
+        self._r.expire(key, 3600)
+        self._r.publish(key, event)
+
+    def listen_progress(
+        self, entry_id: str, timeout: int = 600, heartbeat: int = 15
+    ) -> Iterator[dict | None]:
+        """订阅指令的处理进度，先返回已保存的最新进度，至done/error或超时后结束
+
+        Args:
+            entry_id: 指令的entry id
+            timeout: 最长订阅时间（秒）
+            heartbeat: 无新进度时每隔{heartbeat}秒返回一次None，用于保持连接
+
+        Yields:
+            {'state': (str), 'detail': (str), 'timestamp': (float)} | None
+        """
+        key = f"progress:{entry_id}"
+        pubsub = self._r.pubsub(ignore_subscribe_messages=True)
+        # 先订阅再读取最新进度，避免遗漏两者之间发布的进度
+        pubsub.subscribe(key)
+        try:
+            last = self._r.hget(key, "event")
+            if last:
+                event = json.loads(last)
+                yield event
+                if event["state"] in ["done", "error"]:
+                    return
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                started = time.monotonic()
+                message = pubsub.get_message(timeout=heartbeat)
+                if not message:
+                    # 订阅确认等被忽略的消息会立即返回None，仅在等待超时后返回心跳
+                    if time.monotonic() - started >= heartbeat:
+                        yield None
+                    continue
+                event = json.loads(message["data"])
+                yield event
+                if event["state"] in ["done", "error"]:
+                    return
+        finally:
+            pubsub.close()
+
+    def version(self, name: str) -> str:
+        """获取数据版本
+
+        Args:
+            name: 版本名
+        """
+        return self._r.get(f"version:{name}") or "0"
+
+    def bump(self, name: str) -> int:
+        """递增数据版本，使依赖该版本的缓存失效
+
+        Args:
+            name: 版本名
+
+        Returns:
+            新版本
+        """
+        logger = logging.getLogger(__name__)
+        version = self._r.incr(f"version:{name}")
+        logger.debug("%s version: %s", name, version)
+        return version
+
+    def token_broker(self, name: str, margin: int = 600) -> "TokenBroker":
+        """获取跨进程共享的access_token缓存
+
+        Args:
+            name: 缓存名，如wxwork:{corpid}:{agentid}
+            margin: 提前刷新的时间（秒）
+        """
+        return TokenBroker(self._r, name, margin)
+
+
+# 仅在锁仍属于自身时释放
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class TokenBroker:
+    """跨进程共享的access_token缓存，保存在Redis的token:{name}中
+
+    token剩余有效期不足{margin}秒时，仅由取得刷新锁的进程请求新token，其余进程继续使用旧token
+    """
+
+    _r: redis.Redis = None
+    _name = ""
+    _margin = 600
+    _lock_ttl = 10
+
+    def __init__(self, r: redis.Redis, name: str, margin: int = 600, lock_ttl: int = 10):
+        """
+        Args:
+            r: Redis客户端
+            name: 缓存名
+            margin: 提前刷新的时间（秒）
+            lock_ttl: 刷新锁的有效期（秒）
+        """
+        self._r = r
+        self._name = name
+        self._margin = margin
+        self._lock_ttl = lock_ttl
+
+    def get(self, fetch: Callable[[], tuple[str, int]]) -> tuple[str, float]:
+        """获取token，需要刷新时调用fetch
+
+        Args:
+            fetch: 请求新token，返回(token, 有效期秒数)
+
+        Returns:
+            (token, 过期时间戳)
+
+        Raises:
+            TimeoutError: 如果等待其他进程刷新超时
+            * fetch抛出的异常
+        """
+        logger = logging.getLogger(__name__)
+        key = f"token:{self._name}"
+        deadline = time.time() + self._lock_ttl
+        while True:
+            token, expire = self._cached(key)
+            if expire - time.time() > self._margin:
+                return token, expire
+            owner = uuid.uuid4().hex
+            if self._r.set(f"{key}:lock", owner, nx=True, ex=self._lock_ttl):
+                try:
+                    # 取得锁后再次检查，避免重复刷新
+                    token, expire = self._cached(key)
+                    if expire - time.time() > self._margin:
+                        return token, expire
+                    token, expires_in = fetch()
+                    expire = time.time() + expires_in
+                    self._r.hset(key, mapping={"token": token, "expire": expire})
+                    self._r.expireat(key, int(expire))
+                    logger.info("refreshed token: %s", self._name)
+                    return token, expire
+                finally:
+                    self._r.eval(_RELEASE_LOCK, 1, f"{key}:lock", owner)
+            # 其他进程正在刷新，旧token仍有效时直接使用
+            if token and expire > time.time():
+                return token, expire
+            if time.time() > deadline:
+                raise TimeoutError(f"waiting for token refresh timed out ({self._name})")
+            time.sleep(0.1)
+
+    def invalidate(self, token: str):
+        """token被接口拒绝时清除缓存，下次get时刷新
+
+        Args:
+            token: 被拒绝的token（缓存已被其他进程刷新时不清除）
+        """
+        logger = logging.getLogger(__name__)
+        key = f"token:{self._name}"
+        if self._r.hget(key, "token") == token:
+            self._r.delete(key)
+            logger.info("invalidated token: %s", self._name)
+
+    def _cached(self, key: str) -> tuple[str, float]:
+        cached = self._r.hgetall(key)
+        if not cached:
+            return "", 0
+        return cached["token"], float(cached["expire"])
@@ -0,0 +1,320 @@
+# -*- coding: UTF-8 -*-
+""" 报告类型规则：项目编号格式、项目名称及委托单位的读取位置、XT13模板
+"""
+import os
+import re
+import json
+import copy
+import logging
+
+# 默认规则，可在conf/rules.json中覆盖或新增报告类型（按类型合并）
+# 读取方式（按列表顺序尝试，取第一个有效值）：
+#   cell: 读取指定表格的单元格，{"table", "row", "column"}均从1开始
+#   rows: 遍历指定表格的行，第一列包含labels中任一关键字时读取第二列
+#   paragraphs: 遍历前limit个段落，包含labels中任一关键字且其后为冒号时，读取段落并去除strip匹配的前缀
+#     （表格单元格也会出现在段落中，要求冒号以避免读到表格中的标签）
+DEFAULT_RULES = {
+    "pattern": "SHTEC20[0-9]{2}(?P<type>{types})[0-9]{4}([-_][0-9]+){0,1}",
+    "code_paragraphs": 5,
+    "types": {
+        "DSYS": {
+            # 从基本信息表中读取
+            "name": [{"strategy": "cell", "table": 2, "row": 2, "column": 2}],
+            "company": [{"strategy": "cell", "table": 2, "row": 5, "column": 2}],
+            "template": "RD-XT13测评报告审核、签发意见单-DSYS.docx",
+        },
+        "PRO": {
+            "name": [{"strategy": "cell", "table": 1, "row": 1, "column": 2}],
+            "company": [{"strategy": "cell", "table": 1, "row": 2, "column": 2}],
+            "template": "RD-XT13测评报告审核、签发意见单-PROPST.docx",
+        },
+        "PST": {
+            "name": [{"strategy": "cell", "table": 1, "row": 1, "column": 2}],
+            "company": [{"strategy": "cell", "table": 1, "row": 2, "column": 2}],
+            "template": "RD-XT13测评报告审核、签发意见单-PROPST.docx",
+        },
+        "PER": {
+            "name": [{"strategy": "cell", "table": 1, "row": 1, "column": 2}],
+            "company": [{"strategy": "cell", "table": 1, "row": 2, "column": 2}],
+            "template": "RD-XT13测评报告审核、签发意见单-PER.docx",
+        },
+        "PCT": {
+            "name": [{"strategy": "cell", "table": 1, "row": 1, "column": 2}],
+            "company": [{"strategy": "cell", "table": 1, "row": 2, "column": 2}],
+            "template": "",
+        },
+        "SOF": {
+            # 遍历第一页的行读取
+            "name": [
+                {
+                    "strategy": "paragraphs",
+                    "labels": ["名称"],
+                    "strip": "^.*名称(:|：)",
+                    "limit": 30,
+                }
+            ],
+            "company": [
+                {
+                    "strategy": "paragraphs",
+                    "labels": ["委托单位"],
+                    "strip": "^.*单位(:|：)",
+                    "limit": 30,
+                }
+            ],
+            "template": "RD-XT13测评报告审核、签发意见单-SOF.docx",
+        },
+        "FUN": {
+            "name": [
+                {
+                    "strategy": "paragraphs",
+                    "labels": ["名称"],
+                    "strip": "^.*名称(:|：)",
+                    "limit": 30,
+                }
+            ],
+            "company": [
+                {
+                    "strategy": "paragraphs",
+                    "labels": ["委托单位"],
+                    "strip": "^.*单位(:|：)",
+                    "limit": 30,
+                }
+            ],
+            "template": "RD-XT13测评报告审核、签发意见单-FUN.docx",
+        },
+        "SRV": {
+            # 先尝试读第一个表格的行，再读段落
+            "name": [
+                {
+                    "strategy": "rows",
+                    "table": 1,
+                    "labels": ["项目名称", "报告名称", "系统名称"],
+                },
+                {
+                    "strategy": "paragraphs",
+                    "labels": ["项目名称", "报告名称", "系统名称"],
+                    "strip": "^.*名称(:|：)",
+                    "limit": 30,
+                },
+            ],
+            "company": [
+                {"strategy": "rows", "table": 1, "labels": ["委托单位", "被测单位"]},
+                {
+                    "strategy": "paragraphs",
+                    "labels": ["委托单位", "被测单位"],
+                    "strip": "^.*单位(:|：)",
+                    "limit": 30,
+                },
+            ],
+            "template": "RD-XT13测评报告审核、签发意见单-SRV.docx",
+        },
+    },
+}
+
+
+class Reader:
+    """word文档的缓存读取器，每个段落、单元格只通过COM读取一次"""
+
+    _document = None
+
+    def __init__(self, document):
+        """
+        Args:
+            document: win32com打开的Document对象
+        """
+        self._document = document
+        self._paragraphs: dict[int, str] = {}
+        self._cells: dict[tuple[int, int, int], str] = {}
+        self._rows: dict[int, int] = {}
+        self._paragraph_count = None
+        self._table_count = None
+
+    def paragraph(self, index: int) -> str:
+        """读取第{index}个段落（从1开始），超出范围时返回空字符串"""
+        if self._paragraph_count is None:
+            self._paragraph_count = self._document.Paragraphs.Count
+        if index > self._paragraph_count:
+            return ""
+        if index not in self._paragraphs:
+            self._paragraphs[index] = self._document.Paragraphs(index).Range.Text
+        return self._paragraphs[index]
+
+    def rows(self, table: int) -> int:
+        """读取第{table}个表格的行数，表格不存在时返回0"""
+        if self._table_count is None:
+            self._table_count = self._document.Tables.Count
+        if table > self._table_count:
+            return 0
+        if table not in self._rows:
+            self._rows[table] = self._document.Tables(table).Rows.Count
+        return self._rows[table]
+
+    def cell(self, table: int, row: int, column: int) -> str:
+        """读取第{table}个表格的单元格，不存在时返回空字符串"""
+        if row > self.rows(table):
+            return ""
+        key = (table, row, column)
+        if key not in self._cells:
+            try:
+                self._cells[key] = (
+                    self._document.Tables(table).Cell(row, column).Range.Text
+                )
+            except Exception:
+                # 合并单元格等情况下Cell()会抛出异常
+                self._cells[key] = ""
+        return self._cells[key]
+
+
+class Rules:
+    """预编译的报告类型规则"""
+
+    _pattern: re.Pattern = None
+    _code_paragraphs = 5
+    _types = {}
+
+    def __init__(self, rules: dict):
+        """编译规则
+
+        Args:
+            rules: 格式同DEFAULT_RULES
+
+        Raises:
+            ValueError: 如果规则无效
+        """
+        logger = logging.getLogger(__name__)
+        try:
+            # 较长的类型优先匹配
+            types = sorted(rules["types"], key=len, reverse=True)
+            self._pattern = re.compile(
+                rules["pattern"].replace(
+                    "{types}", "|".join([re.escape(item) for item in types])
+                )
+            )
+            self._code_paragraphs = int(rules.get("code_paragraphs", 5))
+            self._types = {}
+            for report_type, rule in rules["types"].items():
+                self._types[report_type] = {
+                    "name": [_compile(item) for item in rule.get("name", [])],
+                    "company": [_compile(item) for item in rule.get("company", [])],
+                    "template": rule.get("template", ""),
+                }
+        except (KeyError, TypeError, re.error) as err:
+            raise ValueError(f"invalid rules: {err}") from err
+        logger.debug("types: %s", list(self._types))
+
+    def match(self, text: str) -> str:
+        """在{text}中搜索项目编号
+
+        Returns:
+            项目编号，未找到时返回空字符串
+        """
+        re_result = self._pattern.search(text)
+        return re_result.group() if re_result else ""
+
+    def report_type(self, code: str) -> str:
+        """获取项目编号对应的报告类型，不匹配时返回空字符串"""
+        re_result = self._pattern.search(code)
+        return re_result.group("type") if re_result else ""
+
+    def find_code(self, reader: Reader) -> str:
+        """在文档的前几个段落中搜索项目编号
+
+        Returns:
+            项目编号，未找到时返回空字符串
+        """
+        for i in range(self._code_paragraphs):
+            code = self.match(reader.paragraph(i + 1))
+            if code:
+                return code
+        return ""
+
+    def extract(self, reader: Reader, code: str) -> tuple[str, str]:
+        """按报告类型读取项目名称和委托单位
+
+        Returns:
+            (项目名称, 委托单位)，均已去除换行符和空格
+        """
+        rule = self._types.get(self.report_type(code))
+        if not rule:
+            return "", ""
+        return (
+            _clean(_execute(reader, rule["name"])),
+            _clean(_execute(reader, rule["company"])),
+        )
+
+    def template(self, code: str) -> str:
+        """获取项目编号对应的XT13模板文件名，无模板时返回空字符串"""
+        rule = self._types.get(self.report_type(code))
+        return rule["template"] if rule else ""
+
+
+def load(path: str = "") -> Rules:
+    """加载规则，{path}存在时按报告类型合并到默认规则中
+
+    Args:
+        path: 规则文件（JSON）
+
+    Returns:
+        Rules
+
+    Raises:
+        ValueError: 如果规则无效
+    """
+    logger = logging.getLogger(__name__)
+    rules = copy.deepcopy(DEFAULT_RULES)
+    if path and os.path.isfile(path):
+        with open(path, encoding="utf-8") as f:
+            custom = json.load(f)
+        rules["types"].update(custom.pop("types", {}))
+        rules.update(custom)
+        logger.info('rules loaded from "%s"', path)
+    return Rules(rules)
+
+
+def _compile(strategy: dict) -> dict:
+    """预编译单个读取方式"""
+    ret = dict(strategy)
+    if ret["strategy"] not in ["cell", "rows", "paragraphs"]:
+        raise ValueError(f"invalid strategy: {ret['strategy']}")
+    if ret["strategy"] == "paragraphs":
+        ret["strip"] = re.compile(ret.get("strip", ""))
+        ret["label"] = re.compile(
+            "({}) *(:|：)".format("|".join([re.escape(item) for item in ret["labels"]]))
+        )
+        ret.setdefault("limit", 30)
+    if ret["strategy"] == "rows":
+        ret.setdefault("column", 2)
+    return ret
+
+
+def _execute(reader: Reader, strategies: list[dict]) -> str:
+    """依次执行读取方式，返回第一个有效值"""
+    for strategy in strategies:
+        value = ""
+        match strategy["strategy"]:
+            case "cell":
+                value = reader.cell(
+                    strategy["table"], strategy["row"], strategy["column"]
+                )
+            case "rows":
+                for i in range(reader.rows(strategy["table"])):
+                    label = reader.cell(strategy["table"], i + 1, 1)
+                    if any([item in label for item in strategy["labels"]]):
+                        value = reader.cell(
+                            strategy["table"], i + 1, strategy["column"]
+                        )
+                        break
+            case "paragraphs":
+                for i in range(strategy["limit"]):
+                    paragraph = reader.paragraph(i + 1).strip()
+                    if strategy["label"].search(paragraph):
+                        value = strategy["strip"].sub("", paragraph)
+                        break
+        if _clean(value):
+            return value
+    return ""
+
+
+def _clean(text: str) -> str:
+    """去除可能存在的换行符"""
+    return re.sub("(\r|\n|\x07| *)", "", text)
@@ -0,0 +1,611 @@
+# -*- coding: UTF-8 -*-
+""" storage目录的文件操作
+"""
+import os
+import errno
+import shutil
+import logging
+import sqlite3
+import json
+import hashlib
+import tarfile
+import tempfile
+import threading
+import datetime
+from typing import Literal
+from walkdir import filtered_walk, file_paths
+from .types import *
+
+
+def promote(
+    src: str,
+    dst: str,
+    included_files: list[str] | None = None,
+    excluded_files: list[str] | None = None,
+) -> Promoted:
+    """将{src}中匹配的文件（递归查找）平铺移动至{dst}，重名时覆盖
+
+    同一文件系统中直接重命名，不复制数据；跨设备时退回复制后删除源文件
+
+    Args:
+        src: 源目录
+        dst: 目标目录（需已存在）
+        included_files: 匹配的文件名模式，缺省时匹配全部文件
+        excluded_files: 排除的文件名模式
+
+    Returns:
+        Promoted
+    """
+    logger = logging.getLogger(__name__)
+    logger.debug(
+        "args: %s",
+        {
+            "src": src,
+            "dst": dst,
+            "included_files": included_files,
+            "excluded_files": excluded_files,
+        },
+    )
+    ret: Promoted = {"files": [], "moved": 0, "copied": 0}
+    for file_path in list(
+        file_paths(
+            filtered_walk(
+                src,
+                included_files=included_files,
+                excluded_files=excluded_files,
+            )
+        )
+    ):
+        target_path = os.path.join(dst, os.path.basename(file_path))
+        size = os.path.getsize(file_path)
+        try:
+            os.replace(file_path, target_path)
+            ret["moved"] += size
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+            shutil.copy2(file_path, target_path)
+            os.remove(file_path)
+            ret["copied"] += size
+        if target_path not in ret["files"]:
+            ret["files"].append(target_path)
+        logger.info('promoted "%s"', os.path.basename(file_path))
+    logger.info(
+        "moved: %.1fMB, copied: %.1fMB", ret["moved"] / 1048576, ret["copied"] / 1048576
+    )
+    logger.debug("return: %s", ret)
+    return ret
+
+
+class StorageIndex:
+    """项目目录索引（sqlite），记录temp/archive中各项目编号对应的目录，可通过扫描磁盘重建"""
+
+    _path = ""
+    _conn: sqlite3.Connection = None
+
+    def __init__(self, path: str):
+        """打开或新建索引
+
+        Args:
+            path: 索引文件路径（如storage/index.db）
+        """
+        logger = logging.getLogger(__name__)
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                "path TEXT PRIMARY KEY, area TEXT NOT NULL, codes TEXT NOT NULL, "
+                "user TEXT NOT NULL DEFAULT '', timestamp REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_area_codes ON dirs (area, codes, timestamp)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS access ("
+                "codes TEXT PRIMARY KEY, timestamp REAL NOT NULL)"
+            )
+        logger.info('storage index "%s" opened.', path)
+
+    def add(
+        self,
+        area: Literal["temp", "archive"],
+        path: str,
+        codes: str,
+        user: str = "",
+        timestamp: float | None = None,
+    ):
+        """记录目录，同一路径重复记录时覆盖
+
+        Args:
+            area: temp/archive
+            path: 目录路径
+            codes: 项目编号（多个编号以+连接）
+            user: 提交人
+            timestamp: 时间戳，缺省时为当前时间
+        """
+        logger = logging.getLogger(__name__)
+        if timestamp is None:
+            timestamp = datetime.datetime.now().timestamp()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "REPLACE INTO dirs (path, area, codes, user, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (path, area, codes, user, timestamp),
+            )
+        logger.debug("indexed (%s) %s", area, path)
+
+    def remove(self, path: str):
+        """删除目录记录"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+
+    def find(self, area: Literal["temp", "archive"], codes: str) -> list[str]:
+        """查找项目编号对应的所有目录，按时间戳升序
+
+        Args:
+            area: temp/archive
+            codes: 项目编号
+
+        Returns:
+            目录路径列表
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM dirs WHERE area = ? AND codes = ? ORDER BY timestamp",
+                (area, codes),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def latest(self, area: Literal["temp", "archive"], codes: str) -> str | None:
+        """查找项目编号对应的最新目录，跳过并清除已不存在的记录
+
+        Args:
+            area: temp/archive
+            codes: 项目编号
+
+        Returns:
+            目录路径，无记录时返回None
+        """
+        for path in reversed(self.find(area, codes)):
+            if os.path.isdir(path):
+                return path
+            self.remove(path)
+        return None
+
+    def touch(self, codes: str, timestamp: float | None = None):
+        """记录项目的访问时间（归档、重发），用于判断冷数据
+
+        Args:
+            codes: 项目编号
+            timestamp: 时间戳，缺省时为当前时间
+        """
+        if timestamp is None:
+            timestamp = datetime.datetime.now().timestamp()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "REPLACE INTO access (codes, timestamp) VALUES (?, ?)",
+                (codes, timestamp),
+            )
+
+    def accessed(self, codes: str) -> float | None:
+        """项目的最后访问时间，无记录时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT timestamp FROM access WHERE codes = ?", (codes,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def count(self) -> int:
+        """记录数量"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]
+
+    def rebuild(self, storage: str) -> int:
+        """清空目录索引并扫描storage/temp和storage/archive重建（保留访问时间）
+
+        temp中的目录名为{timestamp}_{user}_{codes}；archive中的目录名为{codes}，时间戳取修改时间
+
+        Args:
+            storage: 数据文件夹
+
+        Returns:
+            记录数量
+        """
+        logger = logging.getLogger(__name__)
+        rows = []
+        for area in ["temp", "archive"]:
+            area_path = os.path.join(storage, area)
+            if not os.path.isdir(area_path):
+                continue
+            with os.scandir(area_path) as it:
+                for entry in it:
+                    if not entry.is_dir():
+                        continue
+                    if area == "temp":
+                        parts = entry.name.split("_", 2)
+                        try:
+                            timestamp = float(parts[0])
+                        except ValueError:
+                            continue
+                        if len(parts) != 3:
+                            continue
+                        rows.append(
+                            (entry.path, area, parts[2], parts[1], timestamp)
+                        )
+                    else:
+                        rows.append(
+                            (entry.path, area, entry.name, "", entry.stat().st_mtime)
+                        )
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM dirs")
+            self._conn.executemany(
+                "INSERT INTO dirs (path, area, codes, user, timestamp) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        logger.info("storage index rebuilt (%s dirs).", len(rows))
+        return len(rows)
+
+
+class BlobStore:
+    """按内容寻址的归档存储：文件按sha256存放在storage/blobs中，每个项目保存一份清单（manifest）"""
+
+    _blobs_path = ""
+    _manifests_path = ""
+
+    def __init__(self, storage: str):
+        """
+        Args:
+            storage: 数据文件夹（使用其中的blobs和manifests目录）
+        """
+        self._blobs_path = os.path.join(storage, "blobs")
+        self._manifests_path = os.path.join(storage, "manifests")
+        for check_dir in [self._blobs_path, self._manifests_path]:
+            if not os.path.isdir(check_dir):
+                os.mkdir(check_dir)
+
+    def commit(self, work_path: str, codes: str) -> Manifest:
+        """将{work_path}中的文件存入blobs（已有相同内容时直接丢弃），并写入{codes}的清单
+
+        文件移动至blobs后，{work_path}中仅剩空目录
+
+        Args:
+            work_path: 项目目录
+            codes: 项目编号
+
+        Returns:
+            Manifest
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("args: %s", {"work_path": work_path, "codes": codes})
+        previous = self.manifest(codes)
+        manifest: Manifest = {
+            "codes": codes,
+            "timestamp": datetime.datetime.now().timestamp(),
+            "files": [],
+            "tier": "hot",
+            "bundle": "",
+        }
+        stored = 0
+        for file_path in list(file_paths(filtered_walk(work_path))):
+            digest, size, new = self._store(file_path)
+            stored += size if new else 0
+            manifest["files"].append(
+                {"name": os.path.basename(file_path), "hash": digest, "size": size}
+            )
+        self._write(manifest)
+        # 重新归档时删除旧的冷存储包
+        if previous and previous.get("bundle") and os.path.isfile(previous["bundle"]):
+            os.remove(previous["bundle"])
+        logger.info(
+            'committed "%s" (%s files, %.1fMB new)',
+            codes,
+            len(manifest["files"]),
+            stored / 1048576,
+        )
+        return manifest
+
+    def adopt(self, archive_path: str, limit: int = 50) -> list[tuple[str, float]]:
+        """将旧版归档目录（{archive_path}/{codes}）导入blobs并删除原目录，由存储维护任务增量执行
+
+        已有清单（重新归档过）或包含子目录的项目跳过，保留原目录
+
+        Args:
+            archive_path: 旧版归档文件夹（storage/archive）
+            limit: 每次最多导入的项目数量
+
+        Returns:
+            [(项目编号, 原目录的修改时间)]
+        """
+        logger = logging.getLogger(__name__)
+        ret = []
+        if not os.path.isdir(archive_path):
+            return ret
+        with os.scandir(archive_path) as it:
+            entries = sorted(
+                [entry for entry in it if entry.is_dir()],
+                key=lambda entry: entry.stat().st_mtime,
+            )
+        for entry in entries:
+            if len(ret) >= limit:
+                break
+            if self.manifest(entry.name):
+                logger.debug('skipped "%s": manifest exists', entry.name)
+                continue
+            with os.scandir(entry.path) as it:
+                if any([item.is_dir() for item in it]):
+                    logger.warning('skipped "%s": nested directories', entry.name)
+                    continue
+            mtime = entry.stat().st_mtime
+            self.commit(entry.path, entry.name)
+            shutil.rmtree(entry.path)
+            ret.append((entry.name, mtime))
+        if ret:
+            logger.info("adopted %s archive dirs", len(ret))
+        return ret
+
+    def freeze(self, codes: str, bundle_dir: str) -> int:
+        """将{codes}的文件压缩为{bundle_dir}/{codes}.tar.xz，清单标记为冷存储
+
+        冷存储项目不再引用blobs中的文件，由gc释放空间
+
+        Args:
+            codes: 项目编号
+            bundle_dir: 冷存储目录（可位于其他磁盘）
+
+        Returns:
+            压缩包大小（字节）
+
+        Raises:
+            FileNotFoundError: 如果清单不存在
+        """
+        logger = logging.getLogger(__name__)
+        manifest = self.manifest(codes)
+        if not manifest:
+            raise FileNotFoundError(f"no manifest for {codes}")
+        if manifest.get("tier", "hot") == "cold":
+            return os.path.getsize(manifest["bundle"])
+        bundle_path = os.path.join(bundle_dir, f"{codes}.tar.xz")
+        with tarfile.open(bundle_path + ".tmp", "w:xz") as tar:
+            for item in manifest["files"]:
+                tar.add(self._blob_path(item["hash"]), arcname=item["name"])
+        os.replace(bundle_path + ".tmp", bundle_path)
+        manifest["tier"] = "cold"
+        manifest["bundle"] = bundle_path
+        self._write(manifest)
+        size = os.path.getsize(bundle_path)
+        logger.info('froze "%s" (%.1fMB)', codes, size / 1048576)
+        return size
+
+    def thaw(self, codes: str):
+        """从冷存储包中还原{codes}的文件至blobs，清单恢复为热存储
+
+        Raises:
+            FileNotFoundError: 如果清单或冷存储包不存在
+        """
+        logger = logging.getLogger(__name__)
+        manifest = self.manifest(codes)
+        if not manifest:
+            raise FileNotFoundError(f"no manifest for {codes}")
+        if manifest.get("tier", "hot") != "cold":
+            return
+        temp_path = tempfile.mkdtemp(dir=self._blobs_path, prefix=".thaw_")
+        try:
+            with tarfile.open(manifest["bundle"], "r:xz") as tar:
+                for item in manifest["files"]:
+                    # 仅按清单中的文件名读取，不使用extractall
+                    member = tar.extractfile(item["name"])
+                    file_path = os.path.join(temp_path, item["hash"])
+                    with open(file_path, "wb") as f:
+                        shutil.copyfileobj(member, f)
+                    digest, _, _ = self._store(file_path)
+                    if digest != item["hash"]:
+                        raise ValueError(f"corrupted bundle: {manifest['bundle']}")
+        finally:
+            shutil.rmtree(temp_path, ignore_errors=True)
+        bundle_path = manifest["bundle"]
+        manifest["tier"] = "hot"
+        manifest["bundle"] = ""
+        self._write(manifest)
+        os.remove(bundle_path)
+        logger.info('thawed "%s"', codes)
+
+    def manifests(self) -> list[Manifest]:
+        """列出所有清单"""
+        ret = []
+        for name in os.listdir(self._manifests_path):
+            if name.endswith(".json"):
+                with open(
+                    os.path.join(self._manifests_path, name), encoding="utf-8"
+                ) as f:
+                    ret.append(json.load(f))
+        return ret
+
+    def manifest(self, codes: str) -> Manifest | None:
+        """读取{codes}的清单，不存在时返回None"""
+        manifest_path = self._manifest_path(codes)
+        if not os.path.isfile(manifest_path):
+            return None
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def checkout(self, codes: str, target_path: str) -> list[str]:
+        """按清单将文件还原至{target_path}（需已存在），同一文件系统中使用硬链接
+
+        还原的文件仅供读取（如打包发送），不应修改；冷存储项目先自动还原为热存储
+
+        Args:
+            codes: 项目编号
+            target_path: 目标目录
+
+        Returns:
+            还原的文件路径
+
+        Raises:
+            FileNotFoundError: 如果清单或文件不存在
+        """
+        logger = logging.getLogger(__name__)
+        manifest = self.manifest(codes)
+        if not manifest:
+            raise FileNotFoundError(f"no manifest for {codes}")
+        if manifest.get("tier", "hot") == "cold":
+            self.thaw(codes)
+        ret = []
+        for item in manifest["files"]:
+            blob_path = self._blob_path(item["hash"])
+            file_path = os.path.join(target_path, item["name"])
+            try:
+                os.link(blob_path, file_path)
+            except OSError:
+                shutil.copy(blob_path, file_path)
+            ret.append(file_path)
+        logger.info('checked out "%s" (%s files)', codes, len(ret))
+        return ret
+
+    def gc(self, grace: int = 3600) -> tuple[int, int]:
+        """删除未被任何热存储清单引用的文件
+
+        Args:
+            grace: 跳过最近{grace}秒内写入的文件，避免与进行中的commit冲突
+
+        Returns:
+            (删除的文件数量, 释放的字节数)
+        """
+        logger = logging.getLogger(__name__)
+        referenced = set()
+        for manifest in self.manifests():
+            if manifest.get("tier", "hot") == "hot":
+                referenced.update([item["hash"] for item in manifest["files"]])
+        count = 0
+        reclaimed = 0
+        deadline = datetime.datetime.now().timestamp() - grace
+        for blob_path in list(
+            file_paths(filtered_walk(self._blobs_path, excluded_dirs=[".thaw_*"]))
+        ):
+            if os.path.basename(blob_path) in referenced:
+                continue
+            stat = os.stat(blob_path)
+            if stat.st_mtime > deadline:
+                continue
+            os.remove(blob_path)
+            count += 1
+            reclaimed += stat.st_size
+        logger.info("gc: %s blobs, %.1fMB", count, reclaimed / 1048576)
+        return count, reclaimed
+
+    def _store(self, file_path: str) -> tuple[str, int, bool]:
+        """将文件移入blobs，已有相同内容时直接删除
+
+        Returns:
+            (sha256, 文件大小, 是否新写入)
+        """
+        digest = _sha256(file_path)
+        blob_path = self._blob_path(digest)
+        size = os.path.getsize(file_path)
+        if os.path.exists(blob_path):
+            # 刷新修改时间，避免被并发的gc视为过期
+            os.utime(blob_path)
+            os.remove(file_path)
+            return digest, size, False
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            os.replace(file_path, blob_path)
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+            shutil.copy2(file_path, blob_path)
+            os.remove(file_path)
+        return digest, size, True
+
+    def _write(self, manifest: Manifest):
+        """写入清单，先写临时文件再替换，保证清单完整"""
+        manifest_path = self._manifest_path(manifest["codes"])
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self._blobs_path, digest[:2], digest)
+
+    def _manifest_path(self, codes: str) -> str:
+        return os.path.join(self._manifests_path, f"{codes}.json")
+
+
+def _sha256(file_path: str) -> str:
+    """计算文件的sha256"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1048576), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def sweep(
+    storage: str,
+    index: StorageIndex,
+    active_codes: set[str],
+    max_age: int = 14 * 86400,
+    quota: int = 0,
+) -> Swept:
+    """清理storage/temp和storage/checkout中的孤立目录
+
+    孤立目录包括：未提交成功的邮件目录（{timestamp}_{user}_）、项目已不在current中的提交审核目录、
+    重发时遗留的还原目录。超过{max_age}秒的孤立目录直接删除；temp总大小超过{quota}时，
+    按最后修改时间从旧到新继续删除孤立目录，直至低于配额
+
+    Args:
+        storage: 数据文件夹
+        index: 目录索引
+        active_codes: current中所有项目的codes
+        max_age: 孤立目录的保留时间（秒）
+        quota: temp的配额（字节），为0时不限制
+
+    Returns:
+        Swept
+    """
+    logger = logging.getLogger(__name__)
+    logger.debug(
+        "args: %s", {"active_codes": active_codes, "max_age": max_age, "quota": quota}
+    )
+    ret: Swept = {"removed": [], "reclaimed": 0, "usage": 0}
+    now = datetime.datetime.now().timestamp()
+    orphans = []
+    for area in ["temp", "checkout"]:
+        area_path = os.path.join(storage, area)
+        if not os.path.isdir(area_path):
+            continue
+        with os.scandir(area_path) as it:
+            for entry in it:
+                if not entry.is_dir():
+                    continue
+                size = _du(entry.path)
+                ret["usage"] += size
+                parts = entry.name.split("_", 2)
+                if area == "temp" and len(parts) == 3 and parts[2] in active_codes:
+                    continue
+                orphans.append((entry.stat().st_mtime, entry.path, size))
+    # 先删除过期目录，再按LRU满足配额
+    orphans.sort()
+    for mtime, path, size in orphans:
+        if mtime < now - max_age or (quota and ret["usage"] > quota):
+            shutil.rmtree(path, ignore_errors=True)
+            index.remove(path)
+            ret["removed"].append(path)
+            ret["reclaimed"] += size
+            ret["usage"] -= size
+            logger.info('removed "%s" (%.1fMB)', os.path.basename(path), size / 1048576)
+    if quota and ret["usage"] > quota:
+        logger.warning(
+            "temp usage %.1fMB still exceeds quota %.1fMB",
+            ret["usage"] / 1048576,
+            quota / 1048576,
+        )
+    logger.debug("return: %s", ret)
+    return ret
+
+
+def _du(path: str) -> int:
+    """目录总大小（字节）"""
+    return sum(
+        [os.path.getsize(file_path) for file_path in file_paths(filtered_walk(path))]
+    )
@@ -37,6 +37,10 @@ class CurrentRecord(BaseRecord):
     end: None
 
 
+class MineRecord(CurrentRecord):
+    role: Literal['author', 'reviewer']
+
+
 class HistoryRecord(BaseRecord):
     id: int
     end: int
@@ -63,12 +67,83 @@ class Parsed_Mail(TypedDict):
     temp_path: str
 
 
+class Outgoing_Mail(TypedDict):
+    recipient: str
+    subject: str
+    content: str
+    attachments: list[str]
+    needs_cc: bool
+
+
+# delivery
+class Delivery_Part(TypedDict):
+    attachments: list[str]
+    path: str
+
+
+class Delivery(TypedDict):
+    parts: list[Delivery_Part]
+    links: list[str]
+
+
+# storage
+class Promoted(TypedDict):
+    files: list[str]
+    moved: int
+    copied: int
+
+
+class Swept(TypedDict):
+    removed: list[str]
+    reclaimed: int
+    usage: int
+
+
+class Manifest_File(TypedDict):
+    name: str
+    hash: str
+    size: int
+
+
+class Manifest(TypedDict):
+    codes: str
+    timestamp: float
+    files: list[Manifest_File]
+    tier: Literal["hot", "cold"]
+    bundle: str
+
+
 # notification
 class Built_Message(TypedDict):
     subject: str
     content: str
 
 
+class Notify_Context(TypedDict):
+    codes: str
+    names_mail: str
+    codes_dingtalk: str
+    codes_wxwork: str
+    company: str
+    authorname: str
+    reviewername: str
+    author_at: str
+    reviewer_at: str
+    pages: str
+    urgent: str
+    start: str
+    end: str
+    warnings: list[str]
+
+
+class Message_Log(TypedDict):
+    sender: Literal['mail', 'wxwork', 'dingtalk']
+    receiver: str
+    subject: str
+    content: str
+    result: str
+
+
 # validator
 class Content(TypedDict):
     timestamp: int
@@ -95,6 +170,14 @@ class Checked_Mail_Attachment(TypedDict):
     attachment: Attachment
 
 
+# command
+class Mail_Command(TypedDict):
+    sender: str
+    urgent: bool
+    members: list[str]
+    force: str
+
+
 # wxwork
 class GETTOKEN_RESPONSE(TypedDict):
     errcode: int
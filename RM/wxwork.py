@@ -2,10 +2,18 @@
 import logging
 import json
 import datetime
-import requests
+import time
 from . import mysql
+from .http import HTTPClient, TokenBucket
+from .redis import TokenBroker
 from .types import *
 
+# message/send的发送频率：每秒补充0.5次，最多连续发送20次
+MESSAGE_RATE = 0.5
+MESSAGE_BURST = 20
+# message/send单次最多指定1000个成员
+MAX_TOUSER = 1000
+
 
 class WXWork:
     ''' WXWork的封装客户端，实现发送text消息的功能
@@ -17,8 +25,12 @@ class WXWork:
     _access_token: str = ''
     _access_token_expire = datetime.datetime.fromtimestamp(0)
     _admin_userid: str = ''
+    _http: HTTPClient = None
+    _base_url: str = 'https://qyapi.weixin.qq.com'
+    _tokens: TokenBroker | None = None
+    _bucket: TokenBucket = None
 
-    def __init__(self, corpid: str, agentid: int, secret: str, admin_userid: str = ''):
+    def __init__(self, corpid: str, agentid: int, secret: str, admin_userid: str = '', http: HTTPClient | None = None, base_url: str = '', tokens: TokenBroker | None = None):
         ''' 初始化wxwork的配置
 
         Args:
@@ -26,31 +38,34 @@ class WXWork:
             agentid: 应用ID
             secret: 应用secret
             admin_userid: 单独通知的管理员
+            http: 共用的HTTP客户端，缺省时新建
+            base_url: API地址，缺省为https://qyapi.weixin.qq.com（测试时可替换为stub服务）
+            tokens: 跨进程共享的access_token缓存，缺省时仅在进程内缓存
 
         Raises:
             ValueError: 如果参数无效
         '''
         logger = logging.getLogger(__name__)
 
-        session = requests.session()
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={corpid}&corpsecret={secret}"
-        r1: GETTOKEN_RESPONSE = session.get(url).json()
-        logger.debug('gettoken response: %s', r1)
-        if r1['errcode']:
-            raise ValueError(f"Cannot init wxwork: {r1['errmsg']}.")
-        self._access_token = r1['access_token']
-        self._access_token_expire = datetime.datetime.now() + \
-            datetime.timedelta(seconds=r1['expires_in'] - 600)
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/agent/get?access_token={self._access_token}&agentid={agentid}"
-        r2: AGENT_GET_RESPONSE = session.get(url).json()
+        self._http = http if http else HTTPClient()
+        if base_url:
+            self._base_url = base_url.rstrip('/')
+        self._corpid = corpid
+        self._secret = secret
+        self._tokens = tokens
+        self._bucket = TokenBucket(MESSAGE_RATE, MESSAGE_BURST)
+        try:
+            self._load_access_token()
+        except RuntimeError as err:
+            raise ValueError(f"Cannot init wxwork: {err}.")
+        r2: AGENT_GET_RESPONSE = self._http.get_json(
+            self._base_url + '/cgi-bin/agent/get', params={'access_token': self._access_token, 'agentid': agentid})
         logger.debug('agent/get response: %s', r2)
         if r2['errcode']:
             raise ValueError(f"Cannot init wxwork: {r2['errmsg']}.")
         logger.info('agent_name: %s', r2['name'])
         self._enabled = True
-        self._corpid = corpid
         self._agentid = agentid
-        self._secret = secret
         if admin_userid:
             self._admin_userid = admin_userid
             logger.info('admin_userid: %s', admin_userid)
@@ -62,27 +77,54 @@ class WXWork:
 
         if datetime.datetime.now() < self._access_token_expire:
             return
-        session = requests.session()
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={self._corpid}&corpsecret={self._secret}"
         for _ in range(3):
             try:
-                r: GETTOKEN_RESPONSE = session.get(url).json()
-                logger.debug('gettoken response: %s', r)
-                if r['errcode']:
-                    logger.warning('gettoken error: %s', r['errmsg'])
-                    continue
-                if self._access_token != r['access_token']:
-                    logger.info('refreshed access_token')
-                    self._access_token = r['access_token']
-                    self._access_token_expire = datetime.datetime.now() + \
-                        datetime.timedelta(seconds=r['expires_in'] - 600)
+                self._load_access_token()
                 return
             except:
                 logger.warning('gettoken error', exc_info=True)
+
+    def _gettoken(self) -> tuple[str, int]:
+        ''' 请求新的access_token
+
+        https://developer.work.weixin.qq.com/document/path/91039
+
+        Returns:
+            (access_token, 有效期秒数)
+
+        Raises:
+            RuntimeError: 如果接口返回错误
+        '''
+        logger = logging.getLogger(__name__)
+        r: GETTOKEN_RESPONSE = self._http.get_json(
+            self._base_url + '/cgi-bin/gettoken', params={'corpid': self._corpid, 'corpsecret': self._secret})
+        logger.debug('gettoken response: %s', r)
+        if r['errcode']:
+            raise RuntimeError(r['errmsg'])
+        return r['access_token'], r['expires_in']
+
+    def _load_access_token(self):
+        ''' 从共享缓存（或直接请求）获取access_token，提前10分钟视为过期
+        '''
+        logger = logging.getLogger(__name__)
+        if self._tokens:
+            access_token, expire = self._tokens.get(self._gettoken)
         else:
-            pass
+            access_token, expires_in = self._gettoken()
+            expire = time.time() + expires_in
+        if self._access_token != access_token:
+            logger.info('refreshed access_token')
+            self._access_token = access_token
+        self._access_token_expire = datetime.datetime.fromtimestamp(expire - 600)
+
+    def _invalidate_access_token(self):
+        ''' access_token被接口拒绝时，清除缓存并在下次调用时刷新
+        '''
+        if self._tokens:
+            self._tokens.invalidate(self._access_token)
+        self._access_token_expire = datetime.datetime.fromtimestamp(0)
 
-    def send_text(self, content: str, to: list[str], to_debug: bool = False, to_stdout: bool = False):
+    def send_text(self, content: str, to: list[str], to_debug: bool = False, to_stdout: bool = False, log: bool = True) -> Message_Log | None:
         ''' 向列表中的用户发送text
         
         https://developer.work.weixin.qq.com/document/path/90236#%E6%96%87%E6%9C%AC%E6%B6%88%E6%81%AF
@@ -92,6 +134,10 @@ class WXWork:
             to: 发送对象的userid列表
             to_debug: 是否将通知强制发送至管理员
             to_stdout: 是否将通知重定向到stdout
+            log: 是否写入log_message；为False时由调用方批量写入
+
+        Returns:
+            发送日志；未发送时返回None
         '''
         logger = logging.getLogger(__name__)
         logger.debug('args: %s', {
@@ -104,29 +150,79 @@ class WXWork:
             logger.warning('redirect to stdout')
             return
 
+        ret = self._message_send(content, self._admin_userid if to_debug else '|'.join(to))
+        if log:
+            mysql.t_log.add_message(**ret)
+        return ret
+
+    def send_text_bulk(self, messages: list[tuple[str, list[str]]], to_stdout: bool = False, log: bool = True) -> list[Message_Log]:
+        ''' 批量发送text，内容相同的消息合并为一次发送，发送日志一次写入
+
+        Args:
+            messages: [(通知内容, 发送对象的userid列表)]
+            to_stdout: 是否将通知重定向到stdout
+            log: 是否写入log_message；为False时由调用方批量写入
+
+        Returns:
+            发送日志列表
+        '''
+        logger = logging.getLogger(__name__)
+        logger.debug('args: %s', {'messages': messages, 'to_stdout': to_stdout})
+
+        if not self._enabled or to_stdout:
+            logger.warning('redirect to stdout')
+            return []
+
+        # 按内容合并发送对象（保持首次出现的顺序）
+        groups: dict[str, list[str]] = {}
+        for content, to in messages:
+            userids = groups.setdefault(content, [])
+            userids.extend([userid for userid in to if userid not in userids])
+        ret: list[Message_Log] = []
+        for content, userids in groups.items():
+            for i in range(0, len(userids), MAX_TOUSER):
+                ret.append(self._message_send(content, '|'.join(userids[i:i + MAX_TOUSER])))
+        logger.info('sent %s messages in %s requests', len(messages), len(ret))
+        if log:
+            mysql.t_log.add_messages(ret)
+        return ret
+
+    def _message_send(self, content: str, touser: str) -> Message_Log:
+        ''' 调用message/send（受令牌桶限流）
+
+        Args:
+            content: 通知内容
+            touser: 发送对象，以|分隔
+
+        Returns:
+            发送日志
+        '''
+        logger = logging.getLogger(__name__)
         self.refresh_access_token()
+        self._bucket.acquire()
         r: MESSAGE_SEND_RESPONSE = {}
         try:
-            url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={self._access_token}"
-            r = requests.post(url, json={
-                'touser': self._admin_userid if to_debug else '|'.join(to),
+            r = self._http.post_json(self._base_url + '/cgi-bin/message/send', params={'access_token': self._access_token}, json={
+                'touser': touser,
                 'msgtype': 'text',
                 'agentid': self._agentid,
                 'text': {'content': content}
-            }).json()
+            })
             logger.debug('message/send response: %s', r)
             if r['errcode']:
-                logger.error('auth/getuserinfo error: %s', r['errmsg'])
+                logger.error('message/send error: %s', r['errmsg'])
+            # 40014: access_token无效 / 42001: access_token已过期
+            if r['errcode'] in (40014, 42001):
+                self._invalidate_access_token()
         except:
-            logger.error('auth/getuserinfo error', exc_info=True)
-        finally:
-            mysql.t_log.add_message(
-                'wxwork',
-                self._admin_userid if to_debug else '|'.join(to),
-                '',
-                content,
-                json.dumps(r),
-            )
+            logger.error('message/send error', exc_info=True)
+        return {
+            'sender': 'wxwork',
+            'receiver': touser,
+            'subject': '',
+            'content': content,
+            'result': json.dumps(r),
+        }
 
     def get_redirect(self, host: str) -> str:
         ''' 获取OAuth跳转链接
@@ -161,9 +257,11 @@ class WXWork:
         logger.debug('args: %s', {'code': code})
 
         self.refresh_access_token()
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/auth/getuserinfo?access_token={self._access_token}&code={code}"
-        r: GETUSERINFO_RESPONSE = requests.get(url).json()
+        r: GETUSERINFO_RESPONSE = self._http.get_json(
+            self._base_url + '/cgi-bin/auth/getuserinfo', params={'access_token': self._access_token, 'code': code})
         logger.debug('auth/getuserinfo response: %s', r)
+        if r['errcode'] in (40014, 42001):
+            self._invalidate_access_token()
         if r['errcode']:
             logger.error('auth/getuserinfo error: %s', r['errmsg'])
             raise RuntimeError('Cannot get user info.')
@@ -0,0 +1,189 @@
+# -*- coding: UTF-8 -*-
+""" 文档服务：在独立进程中执行基于COM的文档操作（读取文档、读取XT13、加密）
+
+worker配置[document] remote=true后，通过Redis Stream（document）提交任务。
+每个任务在进程池的子进程中执行，执行时间不超过timeout及客户端的截止时间。
+超时后终止整个进程池并结束子进程启动的Word，避免卡住的Word弹窗阻塞邮件处理。
+"""
+import os
+import csv
+import logging
+import logging.config
+import multiprocessing
+import subprocess
+import time
+from time import sleep
+
+from RM.docjob import execute, time_limit
+from RM.redis import RedisStream
+
+
+def init(config):
+    # ---外部存储---
+    global storage
+    storage = config.get("path", "storage", fallback="storage")
+
+    # ---logger---
+    logging.config.dictConfig(
+        {
+            "version": 1,
+            "formatters": {
+                "main": {
+                    "format": "%(asctime)s - %(levelname)s - %(processName)s/%(name)s/%(funcName)s:%(lineno)d -> %(message)s",
+                    "datefmt": "%Y-%m-%d %H:%M:%S",
+                },
+            },
+            "handlers": {
+                "console": {
+                    "class": "logging.StreamHandler",
+                    "formatter": "main",
+                    "level": "DEBUG",
+                    "stream": "ext://sys.stdout",
+                },
+            },
+            "loggers": {
+                "": {
+                    "level": config.get("log", "level", fallback="INFO").upper(),
+                    "propagate": False,
+                    "handlers": ["console"],
+                },
+            },
+        }
+    )
+
+    # ---redis---
+    global stream
+    stream = RedisStream(
+        host=config.get("redis", "host", fallback="127.0.0.1"),
+        password=config.get("redis", "pass", fallback="rm"),
+    )
+
+    # ---进程池---
+    global concurrency, recycle, timeout
+    concurrency = config.getint("docservice", "concurrency", fallback=2)
+    recycle = config.getint("docservice", "recycle", fallback=20)
+    timeout = config.getint("docservice", "timeout", fallback=300)
+
+
+def new_pool() -> multiprocessing.Pool:
+    """新建进程池，子进程执行{recycle}个任务后重启"""
+    return multiprocessing.Pool(processes=concurrency, maxtasksperchild=recycle)
+
+
+def word_pids() -> set[int]:
+    """当前运行的WINWORD.EXE进程ID"""
+    logger = logging.getLogger(__name__)
+    try:
+        output = subprocess.run(
+            ["tasklist", "/FI", "IMAGENAME eq WINWORD.EXE", "/FO", "CSV", "/NH"],
+            capture_output=True,
+            text=True,
+            timeout=30,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        logger.warning("tasklist failed", exc_info=True)
+        return set()
+    return {
+        int(row[1]) for row in csv.reader(output.splitlines()) if len(row) > 1 and row[1].isdigit()
+    }
+
+
+def close_pool(pool: multiprocessing.Pool, excludes: set[int]):
+    """终止进程池，并结束子进程启动的Word
+
+    子进程被强制终止时无法执行Word.Quit()，且卡住的Word也无法响应Quit，
+    因此直接结束服务启动后新出现的WINWORD.EXE（文档服务应部署在专用的主机上）
+
+    Args:
+        pool: 进程池
+        excludes: 服务启动前已存在的Word进程ID
+    """
+    logger = logging.getLogger(__name__)
+    pool.terminate()
+    pool.join()
+    for pid in word_pids() - excludes:
+        logger.warning("killing WINWORD.EXE (%s)", pid)
+        subprocess.run(["taskkill", "/F", "/PID", str(pid)], capture_output=True)
+
+
+def serve():
+    """文档服务入口，每次最多读取{concurrency}个任务并行执行"""
+    logger = logging.getLogger(__name__)
+    excludes = word_pids()
+    pool = new_pool()
+    try:
+        while True:
+            try:
+                entries = stream.read_jobs("document", count=concurrency)
+            except Exception:
+                logger.error("stream.read_jobs() failed", exc_info=True)
+                sleep(60)
+                continue
+            jobs = []
+            for entry_id, fields in entries:
+                logger.info("job (%s): %s", entry_id, fields.get("operation"))
+                limit = time_limit(fields, timeout)
+                if limit <= 0:
+                    # 客户端已超时，不再执行
+                    logger.warning("job (%s) expired", entry_id)
+                    stream.ack("document", entry_id, delete=True)
+                    continue
+                jobs.append(
+                    (
+                        entry_id,
+                        fields,
+                        limit,
+                        time.monotonic() + limit,
+                        pool.apply_async(
+                            execute,
+                            (
+                                storage,
+                                fields.get("operation", ""),
+                                [path for path in fields.get("paths", "").split("\n") if path],
+                            ),
+                        ),
+                    )
+                )
+            hung = False
+            for entry_id, fields, limit, deadline, result in jobs:
+                ret = {"err": "", "data": None}
+                try:
+                    ret["data"] = result.get(timeout=max(deadline - time.monotonic(), 0))
+                except multiprocessing.TimeoutError:
+                    logger.error("job (%s) timed out", entry_id)
+                    ret["err"] = f"timed out ({int(limit)}s)"
+                    hung = True
+                except Exception as err:
+                    logger.error("job (%s) failed", entry_id, exc_info=True)
+                    ret["err"] = str(err)
+                try:
+                    if "reply" in fields:
+                        stream.reply(fields["reply"], ret)
+                finally:
+                    stream.ack("document", entry_id, delete=True)
+            # 存在超时任务时，子进程可能卡在Word中，重建进程池
+            if hung:
+                logger.warning("recycling pool")
+                close_pool(pool, excludes)
+                pool = new_pool()
+    finally:
+        close_pool(pool, excludes)
+
+
+if __name__ == "__main__":
+    from configparser import ConfigParser
+
+    config = ConfigParser()
+    config.read(os.path.join("conf", "RM.conf"), encoding="UTF-8")
+    init(config)
+
+    import socket
+
+    logger = logging.getLogger("main")
+    logger.warning(
+        'Document service "%s" initiated (concurrency: %s, timeout: %ss).',
+        socket.gethostname(),
+        concurrency,
+        timeout,
+    )
+    serve()
@@ -1,8 +1,10 @@
 # -*- coding: UTF-8 -*-
 from functools import wraps
 
-from flask import Flask, request, g, abort
+from flask import Flask, Response, request, g, abort, send_file, make_response
+from flask import stream_with_context
 from flask_jwt_extended import create_access_token
+from flask_jwt_extended import get_jwt
 from flask_jwt_extended import get_jwt_identity
 from flask_jwt_extended import verify_jwt_in_request
 from flask_jwt_extended import JWTManager
@@ -12,11 +14,15 @@ import os
 from configparser import ConfigParser
 import logging.config
 import ipaddress
+import json
 import datetime
 import chinese_calendar
 
 from RM import mysql
+from RM.cache import ResponseCache
+from RM.delivery import verify
 from RM.dingtalk import Dingtalk
+from RM.http import HTTPClient
 from RM.redis import RedisStream
 from RM.wxwork import WXWork
 
@@ -82,6 +88,19 @@ stream = RedisStream(
     host=config.get("redis", "host", fallback="127.0.0.1"),
     password=config.get("redis", "pass", fallback="rm"),
 )
+# ---响应缓存---
+# current、user表变更时（含Worker进程）递增数据版本，所有进程的缓存随之失效
+response_cache = ResponseCache(
+    lambda: stream.version("data"), ttl=config.getint("cache", "ttl", fallback=10)
+)
+mysql.on_change(lambda table: stream.bump("data"))
+# ---http---
+http_client = HTTPClient(
+    connect_timeout=config.getfloat("http", "connect_timeout", fallback=3.05),
+    read_timeout=config.getfloat("http", "read_timeout", fallback=10),
+    retries=config.getint("http", "retries", fallback=2),
+    pool_size=config.getint("http", "pool_size", fallback=10),
+)
 # ---dingtalk---
 dingtalk = Dingtalk(
     {
@@ -94,6 +113,7 @@ dingtalk = Dingtalk(
     },
     config.get("dingtalk", "attend", fallback=""),
     config.get("dingtalk", "interaction", fallback=""),
+    http_client,
 )
 # ---wxwork---
 wxwork = WXWork(
@@ -101,8 +121,22 @@ wxwork = WXWork(
     config.getint("wxwork", "agentid", fallback=0),
     config.get("wxwork", "secret", fallback=""),
     config.get("wxwork", "admin_userid", fallback=""),
+    http_client,
+    config.get("wxwork", "base_url", fallback=""),
+    stream.token_broker(
+        "wxwork:{}:{}".format(
+            config.get("wxwork", "corpid", fallback=""),
+            config.get("wxwork", "agentid", fallback="0"),
+        )
+    ),
 )
 
+# ---下载链接---
+storage = config.get("path", "storage", fallback="storage")
+link_secret = config.get("mail", "link_secret", fallback="")
+# ---管理员（可查看死信等包含所有用户数据的接口）---
+admin_userid = config.get("wxwork", "admin_userid", fallback="")
+
 del config
 
 
@@ -110,7 +144,7 @@ def do_attend():
     """任务提醒入口，功能包括：
 
     1. 向主通知群发送打卡提示，包含当前任务、分配队列和交互入口
-    2. 向企业微信发送任务提醒
+    2. 向企业微信发送任务提醒（内容相同的提醒合并发送）
     """
     # 准备通知所需数据
     currents = mysql.t_current.search(page_size=9999)["current"]
@@ -148,7 +182,8 @@ def do_attend():
     )
     dingtalk.send_action_card(part1 + "\n\n---\n\n" + part2, to_stdout=debug)
 
-    # 微信个人通知
+    # 微信个人通知：内容相同的通知合并为一次请求
+    messages = []
     for reviewer in queue:
         # 顺位在3以后且没有项目的，跳过通知
         if reviewer["priority"] > 3 and reviewer["current"] == 0:
@@ -168,7 +203,9 @@ def do_attend():
             "（跳过一篇）" if reviewer["skipped"] == 1 else "",
             reviewer["current"],
         )
-        wxwork.send_text(content, to=[reviewer["id"]], to_stdout=debug)
+        messages.append((content, [reviewer["id"]]))
+    if messages:
+        wxwork.send_text_bulk(messages, to_stdout=debug)
 
 
 @app.before_request
@@ -210,11 +247,14 @@ def handle_Exception(err):
     return g.ret, 500
 
 
-def jwt_required():
+def jwt_required(locations: list[str] | None = None):
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            verify_jwt_in_request(optional=app.config["DEBUG"])
+            verify_jwt_in_request(optional=app.config["DEBUG"], locations=locations)
+            # 订阅进度的短期令牌不能用于其他接口
+            if "entry" in get_jwt() and request.endpoint != "progress":
+                abort(400, "Invalid token")
             g.user_id = get_jwt_identity()
             param = {}
             try:
@@ -222,6 +262,8 @@ def jwt_required():
                 param.update(request.json)
             except:
                 pass
+            # 不记录通过query string传入的令牌
+            param.pop(app.config["JWT_QUERY_STRING_NAME"], None)
             mysql.t_log.add_manage(
                 g.client_ip,
                 g.user_id,
@@ -236,11 +278,55 @@ def jwt_required():
     return wrapper
 
 
+def track_progress(entry_id: str):
+    """记录指令的发起用户，返回entry id及仅用于订阅该指令进度的短期令牌
+
+    EventSource无法设置请求头，令牌需通过?jwt=传入，因此不复用登录令牌
+    """
+    stream.track_progress(entry_id, g.user_id)
+    g.ret["data"]["entryid"] = entry_id
+    g.ret["data"]["progresstoken"] = create_access_token(
+        identity=g.user_id,
+        expires_delta=datetime.timedelta(minutes=10),
+        additional_claims={"entry": entry_id},
+    )
+
+
+def cached_response():
+    """缓存接口返回值（按路径、用户和请求参数区分），支持ETag/304，需在jwt_required之后使用"""
+
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            ret, etag = response_cache.get(
+                (request.path, g.user_id, request.get_data(as_text=True)),
+                lambda: fn(*args, **kwargs),
+            )
+            if request.if_none_match.contains(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(ret)
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+
+        return decorator
+
+    return wrapper
+
+
+def get_queue() -> list:
+    """获取分配队列（缓存）"""
+    return response_cache.get(
+        ("queue",), lambda: mysql.t_user.pop(count=9999, hide_busy=False)
+    )[0]
+
+
 @app.route("/api/auth", methods=["POST"])
 def auth():
     code = request.json.get("code", "")
     user_id = wxwork.get_userid(code)
-    queue = mysql.t_user.pop(count=9999, hide_busy=False)
+    queue = get_queue()
     for reviewer in queue:
         if reviewer["id"] == user_id:
             g.ret["data"]["user"] = reviewer
@@ -300,11 +386,30 @@ def cron():
                 do_attend()
                 mysql.t_user.reset_status()
                 stream.trim()
+            # 存储维护不受工作日限制
+            stream.add(source="cron", name="maintain")
         case _:
             abort(400, "Inappropriate argument: type")
     return g.ret
 
 
+@app.route("/utils/download/<token>")
+def download(token: str):
+    # 令牌由worker在附件超过邮件大小限制时签发，仅允许访问storage/download中的文件
+    relpath = verify(token, link_secret)
+    if not relpath:
+        abort(400, "Invalid token")
+    download_path = os.path.realpath(os.path.join(storage, "download"))
+    file_path = os.path.realpath(os.path.join(storage, relpath))
+    if (
+        os.path.commonpath([download_path, file_path]) != download_path
+        or not os.path.isfile(file_path)
+    ):
+        abort(400, "File expired")
+    app.logger.info('download "%s" from %s', relpath, g.client_ip)
+    return send_file(file_path, as_attachment=True)
+
+
 @app.route("/api/mail", methods=["POST"])
 @jwt_required()
 def mail():
@@ -322,7 +427,7 @@ def mail():
             "finish": finish_text if len(finish_text) >= 5 else "[完成审核]",
         },
     )
-    g.ret["data"]["entryid"] = entry_id
+    track_progress(entry_id)
     return g.ret
 
 
@@ -339,7 +444,7 @@ def resend_history():
             "redirect": g.user_id,
         },
     )
-    g.ret["data"]["entryid"] = entry_id
+    track_progress(entry_id)
     return g.ret
 
 
@@ -355,7 +460,41 @@ def resend_current():
             "id": request.json["id"],
         },
     )
-    g.ret["data"]["entryid"] = entry_id
+    track_progress(entry_id)
+    return g.ret
+
+
+@app.route("/api/progress/<entry_id>")
+@jwt_required(locations=["headers", "query_string"])
+def progress(entry_id: str):
+    # 仅接受track_progress签发的、绑定该指令的短期令牌
+    if get_jwt().get("entry") != entry_id or stream.progress_owner(entry_id) != g.user_id:
+        abort(400, "Inappropriate argument: entryid")
+
+    def generate():
+        for event in stream.listen_progress(entry_id):
+            if event:
+                yield f"event: progress\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            else:
+                yield ": keepalive\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/outbox/dead", methods=["POST"])
+@jwt_required()
+def list_dead_mail():
+    # 死信包含所有用户的收件人及邮件内容，仅管理员可查看
+    if not g.user_id or g.user_id != admin_userid:
+        abort(400, "Permission denied")
+    count = request.json.get("count", 100)
+    if not isinstance(count, int) or count <= 0:
+        abort(400, "Inappropriate argument: count")
+    g.ret["data"]["dead"] = stream.list_dead("outbox", count)
     return g.ret
 
 
@@ -393,20 +532,9 @@ def search_history():
 
 @app.route("/api/current/list", methods=["POST"])
 @jwt_required()
+@cached_response()
 def list_current():
-    g.ret["data"] = {"current": [], "total": 0}
-    ret = mysql.t_current.search(
-        page_size=9999,
-        authorid=g.user_id,
-    )
-    g.ret["data"]["current"].extend(ret["current"])
-    g.ret["data"]["total"] += ret["total"]
-    ret = mysql.t_current.search(
-        page_size=9999,
-        reviewerid=g.user_id,
-    )
-    g.ret["data"]["current"].extend(ret["current"])
-    g.ret["data"]["total"] += ret["total"]
+    g.ret["data"] = mysql.t_current.search_mine(g.user_id)
     return g.ret
 
 
@@ -468,6 +596,7 @@ def delete_current():
 
 @app.route("/api/user/list", methods=["POST"])
 @jwt_required()
+@cached_response()
 def list_user():
     kwargs = {}
     if request.json.get("isReviewer") == True:
@@ -501,8 +630,9 @@ def search_user():
 
 @app.route("/api/queue/list", methods=["POST"])
 @jwt_required()
+@cached_response()
 def list_queue():
-    g.ret["data"]["queue"] = mysql.t_user.pop(count=9999, hide_busy=False)
+    g.ret["data"]["queue"] = get_queue()
     for item in g.ret["data"]["queue"]:
         del item["phone"]
         del item["email"]
@@ -511,8 +641,9 @@ def list_queue():
 
 @app.route("/api/user/info", methods=["POST"])
 @jwt_required()
+@cached_response()
 def user_info():
-    queue = mysql.t_user.pop(count=9999, hide_busy=False)
+    queue = get_queue()
     for reviewer in queue:
         if reviewer["id"] == g.user_id:
             g.ret["data"]["user"] = reviewer
@@ -3,6 +3,7 @@ CREATE TABLE `user` (
   `id` VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '邮箱username',
   `name` VARCHAR(40) DEFAULT '' COMMENT '姓名',
   `phone` VARCHAR(20) DEFAULT '' COMMENT '钉钉绑定电话号码',
+  `email` VARCHAR(100) DEFAULT '' COMMENT '邮箱',
   `role` TINYINT(1) NOT NULL DEFAULT 0 COMMENT '0非审核人/1审核人',
   `pages` SMALLINT NOT NULL DEFAULT 0 COMMENT '已审核页数',
   `available` TINYINT(1) NOT NULL DEFAULT 0 COMMENT '0禁用/1启用',
@@ -20,7 +21,9 @@ CREATE TABLE `current` (
   `urgent` TINYINT(1) NOT NULL DEFAULT 0 COMMENT '是否加急',
   `authorid` VARCHAR(20) DEFAULT '' COMMENT '作者ID',
   `reviewerid` VARCHAR(20) DEFAULT '' COMMENT '审核人ID',
-  `start` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '提交的时间戳'
+  `start` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '提交的时间戳',
+  KEY `idx_current_authorid` (`authorid`),
+  KEY `idx_current_reviewerid` (`reviewerid`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 
@@ -65,3 +68,23 @@ CREATE TABLE `log_manage` (
   `param` JSON,
   `result` JSON
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+
+DROP TABLE IF EXISTS `log_message`;
+CREATE TABLE `log_message` (
+  `id` INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  `time` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  `sender` VARCHAR(20) DEFAULT '',
+  `receiver` TEXT,
+  `subject` TEXT,
+  `content` TEXT,
+  `result` TEXT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+
+DROP TABLE IF EXISTS `user_alias`;
+CREATE TABLE `user_alias` (
+  `email` VARCHAR(100) NOT NULL PRIMARY KEY COMMENT '转发邮箱',
+  `user_id` VARCHAR(20) NOT NULL COMMENT '对应的用户ID',
+  INDEX `idx_user_alias_user_id` (`user_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,97 @@
+''' 测试共用的Redis替身，仅实现RedisStream及TokenBroker用到的命令
+'''
+import time
+from unittest import mock
+from RM.redis import RedisStream
+
+
+class FakePubSub:
+    ''' 与ignore_subscribe_messages=True时一致：订阅确认被忽略，首次读取立即返回None
+    '''
+
+    def __init__(self, r):
+        self.r = r
+        self.confirming = False
+
+    def subscribe(self, channel):
+        self.r.subscribed.append(channel)
+        self.confirming = True
+
+    def get_message(self, timeout=None):
+        if self.confirming:
+            self.confirming = False
+            return None
+        if self.r.messages:
+            return {'type': 'message', 'data': self.r.messages.pop(0)}
+        time.sleep(timeout or 0)
+        return None
+
+    def close(self):
+        self.r.subscribed.clear()
+
+
+class FakeRedis:
+    ''' 以dict保存数据，与decode_responses=True时一致，hash中的值均为字符串
+    '''
+
+    def __init__(self):
+        self.data = {}
+        self.messages = []
+        self.subscribed = []
+
+    def ping(self):
+        return True
+
+    def xinfo_groups(self, name):
+        return [{'name': 'worker'}]
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        return 1 if self.data.pop(key, None) is not None else 0
+
+    def expire(self, key, seconds):
+        pass
+
+    def expireat(self, key, when):
+        pass
+
+    def eval(self, script, numkeys, key, owner):
+        # 仅支持TokenBroker的释放锁脚本
+        return self.delete(key) if self.data.get(key) == owner else 0
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        self.data.setdefault(key, {}).update({k: str(v) for k, v in items.items()})
+
+    def hsetnx(self, key, field, value):
+        self.data.setdefault(key, {}).setdefault(field, str(value))
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def publish(self, channel, message):
+        if channel in self.subscribed:
+            self.messages.append(message)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+
+def fake_stream() -> RedisStream:
+    ''' 使用FakeRedis初始化RedisStream（经过正常的__init__流程）
+    '''
+    with mock.patch('RM.redis.redis.Redis', return_value=FakeRedis()):
+        return RedisStream('127.0.0.1')
@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+from RM.alert import Alerter, fingerprint
+
+
+class TestAlerter(unittest.TestCase):
+    def setUp(self):
+        self.dingtalk = mock.Mock()
+        self.wxwork = mock.Mock()
+        with mock.patch('RM.alert.threading.Thread'):
+            self.alerter = Alerter(self.dingtalk, self.wxwork, window=60, cooldown=300)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('handle_submit', ValueError('"A1" not found (1)')),
+            fingerprint('handle_submit', ValueError('"B2" not found (23)')))
+        self.assertNotEqual(
+            fingerprint('handle_submit', ValueError('not found')),
+            fingerprint('handle_finish', ValueError('not found')))
+
+    def test_coalesce(self):
+        self.alerter.report('handle_submit', ConnectionError('MySQL down'), 'user01')
+        self.assertTrue(self.alerter._wakeup.is_set())
+        self.alerter._wakeup.clear()
+        self.alerter.flush()
+        self.dingtalk.send_markdown.assert_called_once()
+        self.assertEqual(self.wxwork.send_text.call_args[0][0], '(user01) MySQL down')
+        # cooldown内重复的错误不立即发送，合并为摘要
+        for user_id in ['user01', 'user02', 'user01']:
+            self.alerter.report('handle_submit', ConnectionError('MySQL down'), user_id)
+        self.assertFalse(self.alerter._wakeup.is_set())
+        self.alerter.flush()
+        self.assertEqual(
+            self.wxwork.send_text.call_args[0][0], '(user01,user02) MySQL down [handle_submit x3]')
+        self.alerter.flush()
+        self.assertEqual(self.wxwork.send_text.call_count, 2)
+
+    def test_channel_failure(self):
+        self.dingtalk.send_markdown.side_effect = RuntimeError('dingtalk down')
+        self.alerter.report('do_mail', KeyError('user_id'))
+        self.alerter.flush()
+        self.wxwork.send_text.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
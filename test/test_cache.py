@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+from RM import mysql
+from RM.cache import ResponseCache
+from RM.mysql.client import changed
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.version = '1'
+        self.cache = ResponseCache(lambda: self.version, ttl=60, max_entries=2)
+        self.loader = mock.Mock(side_effect=lambda: {'queue': [{'id': 'user01', 'phone': '1'}]})
+
+    def test_version(self):
+        ret, etag = self.cache.get(('queue',), self.loader)
+        # 返回副本，调用方修改不影响缓存
+        del ret['queue'][0]['phone']
+        ret, etag2 = self.cache.get(('queue',), self.loader)
+        self.assertIn('phone', ret['queue'][0])
+        self.assertEqual(etag, etag2)
+        self.assertEqual(self.loader.call_count, 1)
+        # 数据版本变化后重新加载
+        self.version = '2'
+        self.cache.get(('queue',), self.loader)
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_ttl_and_eviction(self):
+        with mock.patch('RM.cache.time.monotonic', return_value=0):
+            self.cache.get(('a',), self.loader)
+        with mock.patch('RM.cache.time.monotonic', return_value=61):
+            self.cache.get(('a',), self.loader)
+        self.assertEqual(self.loader.call_count, 2)
+        self.cache.get(('b',), self.loader)
+        self.cache.get(('c',), self.loader)
+        self.assertListEqual(list(self.cache._entries), [('b',), ('c',)])
+
+    def test_loader_error(self):
+        self.loader.side_effect = ValueError('invalid arg')
+        with self.assertRaises(ValueError):
+            self.cache.get(('a',), self.loader)
+        self.assertEqual(len(self.cache._entries), 0)
+
+
+class TestChanged(unittest.TestCase):
+    @mock.patch('RM.mysql.var.listeners', [])
+    def test_listener(self):
+        tables = []
+        mysql.on_change(mock.Mock(side_effect=ConnectionError('redis down')))
+        mysql.on_change(tables.append)
+        # 监听函数的异常不影响后续监听函数及调用方
+        changed('current')
+        self.assertListEqual(tables, ['current'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from RM import command
+
+
+class TestCommand(unittest.TestCase):
+    def test_subject(self):
+        self.assertEqual(command.parse_subject('[提交审核]'), '')
+        self.assertEqual(command.parse_subject('[提交审核]  --sender  user02'), 'user02')
+        self.assertEqual(command.parse_subject('[提交审核] -s user02'), 'user02')
+        self.assertEqual(command.parse_subject('[提交审核] --sender=user02'), 'user02')
+        self.assertEqual(command.parse_subject('[提交审核] -suser02'), 'user02')
+        self.assertEqual(command.parse_subject('[提交审核] --sender'), '')
+        self.assertEqual(command.parse_subject('[提交审核] --sender -x'), '')
+        # 重复时以最后一个为准
+        self.assertEqual(command.parse_subject('-s user01 [提交审核] -s user02'), 'user02')
+
+    def test_content(self):
+        content = '\n'.join([
+            '您好：',
+            '加急：是',
+            '组员 user02，r0a3,  user04、',
+            '指定  r0a5',
+            '无效指令',
+        ])
+        self.assertDictEqual(command.parse('[提交审核]', content), {
+            'sender': '', 'urgent': True, 'members': ['user02', 'r0a3', 'user04'], 'force': 'r0a5'
+        })
+
+    def test_repeated(self):
+        content = '加急 1\n组员 user02\n加急 否\n组员 user03\n指定 '
+        self.assertDictEqual(command.parse('[提交审核]', content), {
+            'sender': '', 'urgent': False, 'members': ['user03'], 'force': ''
+        })
+
+    def test_parse_many(self):
+        result = command.parse_many([
+            ('[提交审核] --sender user02', '加急 1'),
+            ('[完成审核]', ''),
+        ])
+        self.assertListEqual([item['sender'] for item in result], ['user02', ''])
+        self.assertListEqual([item['urgent'] for item in result], [True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
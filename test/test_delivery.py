@@ -0,0 +1,80 @@
+import unittest
+import os
+import tempfile
+from RM.archive import Archive
+from RM.delivery import Planner, sign, verify
+
+
+class FakeArchive(Archive):
+    ''' 压缩替身，按分卷大小写入{name}.partN.rar
+    '''
+
+    def __init__(self, fail_volume: bool = False):
+        self.fail_volume = fail_volume
+
+    def archive(self, src, archive_path, volume=0):
+        size = sum([os.path.getsize(os.path.join(src, name)) for name in os.listdir(src)])
+        if not volume:
+            with open(archive_path, 'wb') as fp:
+                fp.write(b'0' * size)
+            return True
+        if self.fail_volume:
+            return False
+        name = archive_path[:-len('.rar')]
+        for idx in range(0, size, volume):
+            with open(f'{name}.part{idx // volume + 1}.rar', 'wb') as fp:
+                fp.write(b'0' * min(volume, size - idx))
+        return True
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.storage = self.temp_dir.name
+        self.work_path = os.path.join(self.storage, 'work')
+        os.mkdir(self.work_path)
+        with open(os.path.join(self.work_path, 'test.docx'), 'wb') as fp:
+            fp.write(b'0' * 2500)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_plan_single(self):
+        planner = Planner(FakeArchive(), self.storage, size_limit=10000)
+        ret = planner.plan(self.work_path, 'code', [])
+        self.assertEqual(len(ret['parts']), 1)
+        self.assertEqual(os.path.basename(ret['parts'][0]['attachments'][0]), 'code.rar')
+        self.assertListEqual(ret['links'], [])
+
+    def test_plan_split(self):
+        planner = Planner(FakeArchive(), self.storage, size_limit=1000)
+        ret = planner.plan(self.work_path, 'code', [])
+        self.assertListEqual(
+            [os.path.basename(part['attachments'][0]) for part in ret['parts']],
+            ['code.part1.rar', 'code.part2.rar', 'code.part3.rar'],
+        )
+        for part in ret['parts']:
+            self.assertTrue(os.path.isdir(part['path']))
+
+    def test_plan_link(self):
+        planner = Planner(FakeArchive(fail_volume=True), self.storage, size_limit=1000,
+                          link_url='https://rm.example.com/utils/download/', link_secret='secret')
+        warnings = []
+        ret = planner.plan(self.work_path, 'code', warnings)
+        self.assertListEqual(ret['parts'], [{'attachments': [], 'path': ''}])
+        self.assertEqual(len(ret['links']), 1)
+        self.assertIn('分卷失败："code"', warnings)
+        token = ret['links'][0].rsplit('/', 1)[1]
+        relpath = verify(token, 'secret')
+        self.assertTrue(os.path.isfile(os.path.join(self.storage, relpath)))
+
+    def test_verify(self):
+        token = sign(os.path.join('download', 'code.rar'), 32503651200, 'secret')
+        self.assertEqual(verify(token, 'secret'), 'download/code.rar')
+        self.assertIsNone(verify(token, 'other'))
+        self.assertIsNone(verify(token[1:], 'secret'))
+        self.assertIsNone(verify(sign('download/code.rar', 1, 'secret'), 'secret'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import time
+from unittest import mock
+from RM.dispatcher import Dispatcher
+
+
+def fake_send(channel, delay):
+    time.sleep(delay)
+    return {'sender': channel, 'receiver': 'user01', 'subject': '', 'content': 'content', 'result': '{}'}
+
+
+@mock.patch('RM.dispatcher.mysql.t_log.add_messages')
+class TestDispatcher(unittest.TestCase):
+    def test_concurrent(self, add_messages):
+        batch = Dispatcher().batch()
+        start = time.monotonic()
+        batch.submit('dingtalk', fake_send, 'dingtalk', 0.2)
+        batch.submit('wxwork', fake_send, 'wxwork', 0.2)
+        batch.submit('mail', lambda: None)
+        ret = batch.wait()
+        self.assertLess(time.monotonic() - start, 0.35)
+        self.assertListEqual(sorted(ret), ['dingtalk', 'mail', 'wxwork'])
+        # 发送日志合并为一次写入
+        add_messages.assert_called_once()
+        self.assertEqual(len(add_messages.call_args[0][0]), 2)
+
+    def test_timeout_and_error(self, add_messages):
+        batch = Dispatcher(timeouts={'wxwork': 0.1}).batch()
+        batch.submit('wxwork', fake_send, 'wxwork', 0.5)
+        batch.submit('dingtalk', fake_send, 'dingtalk', 'invalid')
+        ret = batch.wait()
+        self.assertIsInstance(ret['wxwork'][0], TimeoutError)
+        self.assertIsInstance(ret['dingtalk'][0], TypeError)
+        add_messages.assert_called_once_with([])
+
+
+if __name__ == '__main__':
+    unittest.main()
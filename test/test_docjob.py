@@ -0,0 +1,75 @@
+import unittest
+import os
+import time
+import tempfile
+from unittest import mock
+from RM.docjob import DocumentClient, execute, time_limit
+from RM.redis import RedisStream
+
+
+class FakeStream(RedisStream):
+    ''' 在本进程中直接执行任务的RedisStream替身
+    '''
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.calls = []
+
+    def call(self, name, fields, timeout=360):
+        self.calls.append(fields)
+        try:
+            return {'err': '', 'data': execute(self.storage, fields['operation'], fields['paths'].split('\n'))}
+        except Exception as err:
+            return {'err': str(err), 'data': None}
+
+
+class TestDocumentClient(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.storage = self.temp_dir.name
+        self.client = DocumentClient(FakeStream(self.storage), self.storage)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @mock.patch('RM.document.read_XT13')
+    def test_relative_paths(self, read_XT13):
+        read_XT13.return_value = {'pages': 0, 'company': '', 'names': {}}
+        work_path = os.path.join(self.storage, 'temp', 'work')
+        self.client.read_XT13(work_path)
+        self.assertEqual(self.client._stream.calls[0]['paths'], 'temp/work')
+        read_XT13.assert_called_with(os.path.realpath(work_path))
+
+    @mock.patch('RM.document.encrypt_batch')
+    def test_encrypt_batch(self, encrypt_batch):
+        paths = [os.path.join(os.path.realpath(self.storage), 'archive', name) for name in ['a.docx', 'b.docx']]
+        encrypt_batch.return_value = {paths[0]: True, paths[1]: False}
+        self.assertDictEqual(self.client.encrypt_batch(paths), {paths[0]: True, paths[1]: False})
+
+    def test_outside_storage(self):
+        with self.assertRaises(ValueError):
+            self.client.read_document(os.path.dirname(self.storage))
+        with self.assertRaises(ValueError):
+            execute(self.storage, 'read_document', ['../other'])
+        with self.assertRaises(ValueError):
+            execute(self.storage, 'remove', ['temp'])
+
+    @mock.patch('RM.document.read_document', side_effect=RuntimeError('Word dialog'))
+    def test_remote_error(self, read_document):
+        with self.assertRaises(RuntimeError):
+            self.client.read_document(os.path.join(self.storage, 'temp'))
+
+    @mock.patch('RM.document.read_document')
+    def test_time_limit(self, read_document):
+        read_document.return_value = {'pages': 0, 'company': '', 'names': {}}
+        self.client.read_document(os.path.join(self.storage, 'temp'))
+        # 执行时间上限不超过文档服务超时，并在客户端截止时间前留出回复时间
+        fields = self.client._stream.calls[0]
+        self.assertEqual(time_limit(fields, 300), 300)
+        self.assertAlmostEqual(time_limit(fields, 400), 355, delta=1)
+        self.assertLessEqual(time_limit({'deadline': str(time.time() - 1)}, 300), 0)
+        self.assertEqual(time_limit({}, 300), 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
 import os
+import tempfile
+from docx import Document
 from RM import document
 
 
@@ -82,11 +84,31 @@ class TestDocument(unittest.TestCase):
             expected
         )
 
+    def test_gen_XT13_batch(self):
+        names = {'SHTEC2022PRO0264': '沪台通<云平台>', 'SHTEC2022PST0184': '沪台通云平台'}
+        with tempfile.TemporaryDirectory() as target_dir:
+            document.gen_XT13_batch('测试', names, target_dir)
+            for code, name in names.items():
+                generated = Document(os.path.join(
+                    target_dir, f'RD-XT13测评报告审核、签发意见单{code}.docx'))
+                self.assertIn(code, generated.paragraphs[0].text)
+                self.assertEqual(generated.tables[0].cell(1, 1).text, name)
+                self.assertEqual(generated.tables[0].cell(2, 1).text, '测试')
+        # 模板只解析一次
+        self.assertIn('RD-XT13测评报告审核、签发意见单-PROPST.docx', document._templates)
+
     def test_encrypt(self):
         with self.assertNoLogs('', level='WARNING') as cm:
             document.encrypt(os.path.join(
                 os.getcwd(), 'storage', 'document', 'test_win32.doc'))
 
+    def test_encrypt_batch(self):
+        document_path = os.path.join(os.getcwd(), 'storage', 'document', 'test_win32.doc')
+        with self.assertNoLogs('', level='WARNING') as cm:
+            ret = document.encrypt_batch([document_path, document_path], recycle=1)
+        self.assertDictEqual(ret, {document_path: True})
+        self.assertFalse(document.encrypt(document_path + '.missing'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,168 @@
+import unittest
+import json
+import threading
+import time
+import requests
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from unittest import mock
+from RM.http import HTTPClient, TokenBucket
+from RM.redis import TokenBroker
+from RM.wxwork import WXWork
+from test.fakes import FakeRedis
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        server.ports.add(self.client_address[1])
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/flaky':
+            server.hits += 1
+            if server.hits <= 2:
+                return self.reply({'errmsg': 'busy'}, 503)
+            return self.reply({'errcode': 0})
+        if url.path == '/cgi-bin/gettoken':
+            server.tokens += 1
+            return self.reply({'errcode': 0, 'access_token': 'token', 'expires_in': 7200})
+        if url.path == '/cgi-bin/agent/get':
+            return self.reply({'errcode': 0, 'name': 'RM'})
+        if url.path == '/cgi-bin/auth/getuserinfo':
+            return self.reply({'errcode': 0, 'userid': query['code'][0]})
+        self.reply({'errcode': 404}, 404)
+
+    def do_POST(self):
+        self.server.ports.add(self.client_address[1])
+        length = int(self.headers['Content-Length'])
+        self.server.posted.append((self.path, json.loads(self.rfile.read(length))))
+        self.reply({'errcode': 0, 'errmsg': 'ok'})
+
+
+class TestHTTPClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.hits = 0
+        self.server.tokens = 0
+        self.server.ports = set()
+        self.server.posted = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_metrics(self):
+        client = HTTPClient(self.base_url, retries=2, backoff=0.01)
+        self.assertEqual(client.get_json('/flaky')['errcode'], 0)
+        self.assertEqual(self.server.hits, 3)
+        metrics = client.metrics()['GET /flaky']
+        self.assertEqual(metrics['count'], 1)
+        self.assertEqual(metrics['retries'], 2)
+        self.assertEqual(metrics['errors'], 0)
+        # 重试次数用尽后返回最后一次响应
+        self.server.hits = 0
+        client = HTTPClient(self.base_url, retries=1, backoff=0.01)
+        self.assertEqual(client.request('GET', '/flaky').status_code, 503)
+        self.assertEqual(client.metrics()['GET /flaky']['errors'], 1)
+
+    def test_timeout(self):
+        client = HTTPClient(self.base_url, retries=0)
+        with mock.patch.object(client._session, 'request', side_effect=requests.exceptions.ReadTimeout()) as request:
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                client.request('POST', '/cgi-bin/message/send')
+            # POST读取超时时不重试
+            request.assert_called_once()
+            self.assertEqual(request.call_args.kwargs['timeout'], (3.05, 10))
+
+    @mock.patch('RM.wxwork.mysql.t_log.add_message')
+    def test_wxwork_keep_alive(self, add_message):
+        wxwork = WXWork('corpid', 1, 'secret', 'admin', HTTPClient(), self.base_url)
+        self.assertEqual(wxwork.get_userid('user01'), 'user01')
+        for i in range(3):
+            ret = wxwork.send_text(f'content{i}', ['user01', 'user02'])
+            self.assertEqual(json.loads(ret['result'])['errcode'], 0)
+        self.assertEqual(len(self.server.posted), 3)
+        self.assertEqual(self.server.posted[0][1]['touser'], 'user01|user02')
+        self.assertEqual(add_message.call_count, 3)
+        # 全部请求复用同一连接
+        self.assertEqual(len(self.server.ports), 1)
+
+
+    @mock.patch('RM.wxwork.mysql.t_log.add_messages')
+    def test_wxwork_bulk(self, add_messages):
+        wxwork = WXWork('corpid', 1, 'secret', http=HTTPClient(), base_url=self.base_url)
+        ret = wxwork.send_text_bulk([
+            ('queue', ['user01']), ('queue', ['user02', 'user01']), ('other', ['user03'])
+        ])
+        self.assertListEqual(
+            [(path.split('?')[0], body['touser']) for path, body in self.server.posted],
+            [('/cgi-bin/message/send', 'user01|user02'), ('/cgi-bin/message/send', 'user03')])
+        self.assertEqual(len(ret), 2)
+        add_messages.assert_called_once_with(ret)
+
+    def test_shared_token(self):
+        r = FakeRedis()
+        wxwork1 = WXWork('corpid', 1, 'secret', http=HTTPClient(), base_url=self.base_url, tokens=TokenBroker(r, 'wxwork:corpid:1'))
+        wxwork2 = WXWork('corpid', 1, 'secret', http=HTTPClient(), base_url=self.base_url, tokens=TokenBroker(r, 'wxwork:corpid:1'))
+        self.assertEqual(self.server.tokens, 1)
+        self.assertEqual(wxwork2._access_token, 'token')
+        # 被接口拒绝后清除共享缓存，下次调用时刷新
+        wxwork2._invalidate_access_token()
+        self.assertNotIn('token:wxwork:corpid:1', r.data)
+        wxwork2.refresh_access_token()
+        self.assertEqual(self.server.tokens, 2)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_acquire(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertAlmostEqual(bucket.acquire(), 0.1, delta=0.02)
+
+
+class TestTokenBroker(unittest.TestCase):
+    def test_refresh_margin(self):
+        r = FakeRedis()
+        broker = TokenBroker(r, 'test', margin=600)
+        fetch = mock.Mock(side_effect=[('token1', 700), ('token2', 7200)])
+        self.assertEqual(broker.get(fetch)[0], 'token1')
+        self.assertEqual(broker.get(fetch)[0], 'token1')
+        # 剩余有效期不足margin时提前刷新
+        r.data['token:test']['expire'] = str(float(r.data['token:test']['expire']) - 200)
+        self.assertEqual(broker.get(fetch)[0], 'token2')
+        self.assertEqual(fetch.call_count, 2)
+        self.assertNotIn('token:test:lock', r.data)
+
+    def test_refresh_in_progress(self):
+        r = FakeRedis()
+        broker = TokenBroker(r, 'test', margin=600, lock_ttl=1)
+        fetch = mock.Mock(return_value=('token2', 7200))
+        # 其他进程持有刷新锁时，使用仍有效的旧token
+        r.hset('token:test', mapping={'token': 'token1', 'expire': time.time() + 300})
+        r.set('token:test:lock', 'other')
+        self.assertEqual(broker.get(fetch)[0], 'token1')
+        fetch.assert_not_called()
+        # 旧token已过期时等待刷新，超时后抛出异常
+        r.hset('token:test', mapping={'expire': time.time() - 1})
+        with self.assertRaises(TimeoutError):
+            broker.get(fetch)
+
+
+if __name__ == '__main__':
+    unittest.main()
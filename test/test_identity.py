@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+from RM import identity
+
+
+REVIEWERS = [
+    {'id': 'user01', 'name': 'r0a1', 'phone': '', 'email': 'user01@example.com', 'role': 1, 'status': 0},
+    {'id': 'user02', 'name': 'r0a2', 'phone': '', 'email': 'user02@example.com', 'role': 1, 'status': 0},
+    {'id': 'user03', 'name': '张三', 'phone': '', 'email': 'user03@example.com', 'role': 1, 'status': 0},
+]
+
+
+class TestResolver(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('RM.mysql.t_user.search', return_value=REVIEWERS)
+        self.search = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.resolver = identity.Resolver()
+
+    def test_reviewer(self):
+        self.assertEqual(self.resolver.reviewer('user02'), 'user02')
+        self.assertEqual(self.resolver.reviewer('张三'), 'user03')
+        self.assertEqual(self.resolver.reviewer(' r0a1 '), 'user01')
+        # 部分匹配仅在唯一时有效
+        self.assertEqual(self.resolver.reviewer('张'), 'user03')
+        self.assertEqual(self.resolver.reviewer('r0a'), '')
+        self.assertEqual(self.resolver.reviewer('user04'), '')
+        self.assertEqual(self.resolver.reviewer(''), '')
+        self.search.assert_called_once_with(only_reviewer=True)
+
+    def test_invalidate(self):
+        self.resolver.reviewer('user01')
+        self.resolver.invalidate('current')
+        self.resolver.reviewer('user01')
+        self.assertEqual(self.search.call_count, 1)
+        self.resolver.invalidate('user')
+        self.resolver.reviewer('user01')
+        self.assertEqual(self.search.call_count, 2)
+
+    def test_ttl(self):
+        resolver = identity.Resolver(ttl=0)
+        resolver.reviewer('user01')
+        resolver.reviewer('user01')
+        self.assertEqual(self.search.call_count, 2)
+
+    def test_sender(self):
+        with mock.patch('RM.mysql.t_user.fetch_by_email', return_value=REVIEWERS[0]) as fetch_by_email:
+            self.assertEqual(self.resolver.sender('User01 <USER01@example.com>')['id'], 'user01')
+            fetch_by_email.assert_called_once_with('user01@example.com')
+            self.assertIsNone(self.resolver.sender(''))
+            self.assertEqual(fetch_by_email.call_count, 1)
+        with mock.patch('RM.mysql.t_user.fetch', return_value=REVIEWERS[1]) as fetch:
+            self.assertEqual(self.resolver.sender('user01@example.com', 'user02')['id'], 'user02')
+            fetch.assert_called_once_with('user02')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,301 @@
+import unittest
+import os
+import imaplib
+import smtplib
+import tempfile
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+from email.utils import format_datetime
+from datetime import datetime, timezone
+from unittest import mock
+from RM.mail import Mail
+
+
+def make_eml(from_: str, subject: str, content: str) -> bytes:
+    message = EmailMessage()
+    message['From'] = from_
+    message['To'] = 'rm@example.com'
+    message['Subject'] = subject
+    message['Date'] = format_datetime(datetime(2023, 3, 23, 15, 24, 17, tzinfo=timezone.utc))
+    message.set_content(content)
+    message.add_attachment(b'testtest', maintype='application',
+                           subtype='octet-stream', filename='test.rar')
+    return message.as_bytes().replace(b'\n', b'\r\n')
+
+
+class FakeIMAP:
+    ''' 本地IMAP替身，实现Mail用到的命令
+    '''
+    error = imaplib.IMAP4.error
+    mailbox: dict[bytes, bytes] = {}
+    idle_lines: list[bytes] = []
+
+    def __init__(self, host, port, timeout=None):
+        self.literal = None
+        self.capabilities = ('IMAP4REV1', 'IDLE')
+        self.tagged_commands = {}
+        self.deleted = []
+        self.fetched = []
+        self.sock = mock.MagicMock()
+        self._lines = []
+        self._tag = 0
+
+    def login(self, user, password):
+        return 'OK', [b'LOGIN completed']
+
+    def select(self, mailbox='INBOX'):
+        return 'OK', [str(len(self.mailbox)).encode()]
+
+    def uid(self, command, *args):
+        if command == 'SEARCH':
+            keyword = self.literal.decode('utf-8')
+            self.literal = None
+            domain = args[args.index('FROM') + 1]
+            uids = []
+            for uid, raw in self.mailbox.items():
+                message = message_from_bytes(raw, policy=policy.default)
+                if keyword in message['Subject'] and domain in message['From']:
+                    uids.append(uid)
+            return 'OK', [b' '.join(uids)]
+        if command == 'FETCH':
+            self.fetched.append(args[0])
+            return 'OK', [(b'1 (UID %s RFC822)' % args[0], self.mailbox[args[0]]), b')']
+        if command == 'STORE':
+            self.deleted.append(args[0])
+            return 'OK', []
+        raise ValueError(command)
+
+    def expunge(self):
+        for uid in self.deleted:
+            self.mailbox.pop(uid, None)
+        return 'OK', []
+
+    def logout(self):
+        return 'BYE', []
+
+    def shutdown(self):
+        pass
+
+    def _new_tag(self):
+        self._tag += 1
+        tag = b'TEST%d' % self._tag
+        self.tagged_commands[tag] = None
+        return tag
+
+    def send(self, data):
+        if data.endswith(b' IDLE\r\n'):
+            self._lines = [b'+ idling\r\n'] + list(self.idle_lines)
+        elif data == b'DONE\r\n':
+            self._lines.append(b'TEST%d OK IDLE terminated\r\n' % self._tag)
+
+    def readline(self):
+        if not self._lines:
+            raise TimeoutError('timed out')
+        return self._lines.pop(0)
+
+
+@mock.patch('RM.mail.imaplib.IMAP4', FakeIMAP)
+@mock.patch('RM.mail.zmail.server')
+class TestMailIMAP(unittest.TestCase):
+    def setUp(self):
+        FakeIMAP.mailbox = {
+            b'1': make_eml('user01@example.com', '[提交审核] test', '加急 1'),
+            b'2': make_eml('user02@other.com', '[提交审核] test', ''),
+            b'3': make_eml('user03@example.com', 'irrelevant', ''),
+            b'4': make_eml('user04@example.com', '[完成审核]', ''),
+        }
+        FakeIMAP.idle_lines = []
+
+    def test_receive(self, server):
+        mail = Mail(imap_config={'host': 'localhost'})
+        with tempfile.TemporaryDirectory() as work_path:
+            parsed_mails = mail.receive(
+                work_path, {'submit': '[提交审核]', 'finish': '[完成审核]'})
+            self.assertEqual(
+                [(item['operator'], item['from_']) for item in parsed_mails],
+                [('submit', 'user01@example.com'), ('finish', 'user04@example.com')],
+            )
+            self.assertEqual(parsed_mails[0]['content'].strip(), '加急 1')
+            self.assertTrue(os.path.basename(
+                parsed_mails[0]['temp_path']).endswith('_user01_'))
+            self.assertTrue(os.path.exists(os.path.join(
+                parsed_mails[0]['temp_path'], 'submit.eml')))
+            with open(os.path.join(parsed_mails[0]['temp_path'], 'attachments', 'test.rar'), 'rb') as fp:
+                self.assertEqual(fp.read(), b'testtest')
+        # 仅删除已处理的邮件
+        self.assertListEqual(sorted(FakeIMAP.mailbox), [b'2', b'3'])
+
+    def test_wait_exists(self, server):
+        FakeIMAP.idle_lines = [b'* 5 EXISTS\r\n']
+        mail = Mail(imap_config={'host': 'localhost'})
+        self.assertTrue(mail.wait(timeout=1))
+        self.assertIsNotNone(mail._imap_idle)
+
+    def test_wait_timeout(self, server):
+        mail = Mail(imap_config={'host': 'localhost'})
+        self.assertFalse(mail.wait(timeout=1))
+        self.assertIsNone(mail._imap_idle)
+
+    def test_wait_disabled(self, server):
+        mail = Mail()
+        self.assertFalse(mail.idle_able())
+        with self.assertRaises(RuntimeError):
+            mail.wait()
+
+
+class FakeSMTP:
+    ''' 本地SMTP替身，记录登录次数和已发送的邮件
+    '''
+    logins = 0
+    sent: list = []
+    disconnect_once = False
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        FakeSMTP.logins += 1
+
+    def noop(self):
+        return 250, b'OK'
+
+    def send_message(self, message, to_addrs=None):
+        if FakeSMTP.disconnect_once:
+            FakeSMTP.disconnect_once = False
+            raise smtplib.SMTPServerDisconnected('lost')
+        FakeSMTP.sent.append((message, to_addrs))
+
+    def quit(self):
+        pass
+
+
+@mock.patch('RM.mail.mysql.t_log.add_messages')
+@mock.patch('RM.mail.smtplib.SMTP', FakeSMTP)
+@mock.patch('RM.mail.zmail.server')
+class TestMailSMTP(unittest.TestCase):
+    def setUp(self):
+        FakeSMTP.logins = 0
+        FakeSMTP.sent = []
+        FakeSMTP.disconnect_once = False
+
+    def test_send_batch_one_session(self, server, add_messages):
+        mail = Mail(default_cc='manager')
+        with tempfile.TemporaryDirectory() as work_path:
+            with open(os.path.join(work_path, 'test.rar'), 'wb') as fp:
+                fp.write(b'testtest')
+            ret = mail.send_batch([
+                {'recipient': f'user0{idx}@example.com', 'subject': f'subject{idx}', 'content': 'content',
+                 'attachments': [os.path.join(work_path, 'test.rar')], 'needs_cc': idx == 2}
+                for idx in range(3)
+            ])
+        self.assertListEqual(ret, ['', '', ''])
+        self.assertEqual(FakeSMTP.logins, 1)
+        self.assertEqual(len(FakeSMTP.sent), 3)
+        self.assertListEqual(FakeSMTP.sent[2][1], ['user02@example.com', 'manager@example.com'])
+        # 发送日志一次写入
+        add_messages.assert_called_once()
+        self.assertListEqual([item['receiver'] for item in add_messages.call_args.args[0]],
+                             ['user00@example.com', 'user01@example.com', 'user02@example.com'])
+
+    def test_send_reconnect(self, server, add_messages):
+        mail = Mail()
+        mail.send('user01@example.com', 'subject', 'content')
+        FakeSMTP.disconnect_once = True
+        mail.send('user01@example.com', 'subject', 'content')
+        self.assertEqual(FakeSMTP.logins, 2)
+        self.assertEqual(len(FakeSMTP.sent), 2)
+        add_messages.assert_called_with([{
+            'sender': 'mail', 'receiver': 'user01@example.com', 'subject': 'subject', 'content': 'content', 'result': ''
+        }])
+
+    def test_send_stdout(self, server, add_messages):
+        mail = Mail()
+        mail.send('user01@example.com', 'subject', 'content', to_stdout=True)
+        self.assertEqual(FakeSMTP.logins, 0)
+        add_messages.assert_not_called()
+
+    def test_send_without_log(self, server, add_messages):
+        mail = Mail()
+        # 由调用方（dispatcher）批量写入发送日志
+        logs = mail.send('user01@example.com', 'subject', 'content', log=False)
+        self.assertListEqual([item['result'] for item in logs], [''])
+        add_messages.assert_not_called()
+
+
+class FakeOutbox:
+    ''' outbox替身，模拟RedisStream中与发件队列相关的接口
+    '''
+
+    def __init__(self):
+        self.entries = []
+        self.retry = []
+        self.dead = []
+        self.acked = []
+
+    def add(self, source, name, fields=None):
+        fields['source'] = source
+        self.entries.append((str(len(self.entries)), {k: str(v) for k, v in fields.items()}))
+        return self.entries[-1][0]
+
+    def promote_due(self, name):
+        for fields, _ in self.retry:
+            self.add(fields['source'], name, fields)
+        self.retry = []
+
+    def read_outbox(self):
+        entries, self.entries = self.entries, []
+        return entries
+
+    def retry_later(self, name, fields, delay):
+        self.retry.append((fields, delay))
+
+    def dead_letter(self, name, fields):
+        self.dead.append(fields)
+
+    def ack(self, name, ids, delete=False):
+        self.acked.extend(ids)
+
+
+@mock.patch('RM.mail.mysql.t_log.add_messages')
+@mock.patch('RM.mail.smtplib.SMTP', FakeSMTP)
+@mock.patch('RM.mail.zmail.server')
+class TestMailOutbox(unittest.TestCase):
+    def setUp(self):
+        FakeSMTP.logins = 0
+        FakeSMTP.sent = []
+        FakeSMTP.disconnect_once = False
+
+    def test_outbox_send(self, server, add_messages):
+        outbox = FakeOutbox()
+        mail = Mail()
+        mail.enable_outbox(outbox)
+        with tempfile.TemporaryDirectory() as work_path:
+            outbox_path = os.path.join(work_path, 'outbox')
+            os.mkdir(outbox_path)
+            mail.send('user01@example.com', 'subject', 'content', cleanup=[outbox_path])
+            self.assertEqual(len(FakeSMTP.sent), 0)
+            self.assertEqual(mail.process_outbox(), 1)
+            self.assertEqual(len(FakeSMTP.sent), 1)
+            self.assertFalse(os.path.exists(outbox_path))
+        self.assertListEqual(outbox.acked, ['0'])
+
+    def test_outbox_retry_and_dead(self, server, add_messages):
+        outbox = FakeOutbox()
+        mail = Mail()
+        mail.enable_outbox(outbox, max_attempts=2, backoff=10)
+        mail.send('user01@example.com', 'subject', 'content', attachments=['missing.rar'])
+        mail.process_outbox()
+        self.assertEqual(outbox.retry[0][1], 10)
+        self.assertEqual(outbox.retry[0][0]['attempts'], 1)
+        mail.process_outbox()
+        self.assertEqual(len(outbox.retry), 0)
+        self.assertEqual(outbox.dead[0]['attempts'], 2)
+        self.assertIn('missing.rar', outbox.dead[0]['error'])
+        self.assertEqual(add_messages.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
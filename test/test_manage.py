@@ -0,0 +1,85 @@
+import unittest
+from unittest import mock
+from flask_jwt_extended import create_access_token
+from test.fakes import fake_stream
+
+
+def load_manage():
+    ''' 在不连接MySQL、Redis及外部接口的情况下导入manage
+    '''
+    stream = fake_stream()
+    with mock.patch('RM.mysql.init'), \
+            mock.patch('RM.redis.RedisStream', return_value=stream), \
+            mock.patch('RM.dingtalk.Dingtalk'), \
+            mock.patch('RM.wxwork.WXWork'):
+        import manage
+    return manage
+
+
+class TestManage(unittest.TestCase):
+    def setUp(self):
+        self.manage = load_manage()
+        self.client = self.manage.app.test_client()
+        self.add_manage = mock.Mock()
+        for patcher in [
+            mock.patch('RM.mysql.t_log.add_manage', self.add_manage),
+            mock.patch.object(self.manage, 'admin_userid', 'admin'),
+            mock.patch.object(self.manage.stream, 'list_dead', return_value=[{'id': '1-0', 'to': 'user01@example.com'}]),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def token(self, user_id):
+        with self.manage.app.app_context():
+            return create_access_token(user_id)
+
+    def test_dead_mail(self):
+        response = self.client.post(
+            '/api/outbox/dead', json={}, headers={'Authorization': f"Bearer {self.token('admin')}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['data']['dead'][0]['id'], '1-0')
+        # 非管理员无法查看其他用户的邮件
+        response = self.client.post(
+            '/api/outbox/dead', json={}, headers={'Authorization': f"Bearer {self.token('user01')}"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['err'], 'Permission denied')
+        self.assertNotIn('dead', response.json['data'])
+
+    @mock.patch('manage.stream.add', return_value='1-0')
+    @mock.patch('manage.stream.listen_progress', return_value=iter([{'state': 'done', 'detail': ''}]))
+    def test_progress_token(self, listen_progress, add):
+        session = self.token('user01')
+        ret = self.client.post('/api/mail', json={}, headers={'Authorization': f'Bearer {session}'}).json
+        self.assertEqual(ret['data']['entryid'], '1-0')
+        progress_token = ret['data']['progresstoken']
+        # 登录令牌不能用于订阅进度，进度令牌也不能用于其他接口
+        response = self.client.get(f'/api/progress/1-0?jwt={session}')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/mail', json={}, headers={'Authorization': f'Bearer {progress_token}'})
+        self.assertEqual(response.json['err'], 'Invalid token')
+        response = self.client.get(f'/api/progress/1-0?jwt={progress_token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('"state": "done"', response.get_data(as_text=True))
+        # 令牌不写入日志
+        for call in self.add_manage.call_args_list:
+            self.assertNotIn('jwt', call.args[4])
+
+    @mock.patch('RM.mysql.t_current.search', return_value={'current': []})
+    @mock.patch('RM.mysql.t_history.pop', return_value={'end': 9999999999})
+    @mock.patch('RM.mysql.t_user.pop')
+    def test_attend(self, pop, history_pop, current_search):
+        pop.return_value = [
+            {'id': 'user01', 'name': 'r0a1', 'priority': 1, 'pages_diff': 0, 'status': 0, 'skipped': 0, 'current': 0},
+            {'id': 'user02', 'name': 'r0a2', 'priority': 2, 'pages_diff': 10, 'status': 1, 'skipped': 0, 'current': 1},
+            {'id': 'user03', 'name': 'r0a3', 'priority': 4, 'pages_diff': 20, 'status': 0, 'skipped': 0, 'current': 0},
+        ]
+        self.manage.do_attend()
+        # 每位审核人仅收到自己的提醒
+        messages = self.manage.wxwork.send_text_bulk.call_args.args[0]
+        self.assertListEqual([to for _, to in messages], [['user01'], ['user02']])
+        self.assertEqual(messages[1][0], '- [审核队列] -\n\n你的顺位: 2 (+10页)\n你的状态: 不审加急\n当前任务: 1')
+        self.assertNotIn('r0a1', messages[1][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
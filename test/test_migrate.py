@@ -0,0 +1,101 @@
+import unittest
+from RM.mysql import migrate
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+
+    def execute(self, sql, params=()):
+        sql = ' '.join(sql.split())
+        self.db.executed.append(sql)
+        if sql.startswith('SELECT GET_LOCK') or sql.startswith('SELECT RELEASE_LOCK'):
+            self.result = [(1,)]
+        elif sql.startswith('SELECT IFNULL(MAX(version)'):
+            self.result = [(max(self.db.versions, default=0),)]
+        elif sql.startswith('INSERT INTO schema_version'):
+            self.db.versions.append(params[0])
+        elif 'information_schema.statistics' in sql:
+            self.result = [(int(params in self.db.indexes),)]
+        elif 'information_schema.columns' in sql:
+            self.result = [(len([column for column in params[1:] if (params[0], column) in self.db.columns]),)]
+        elif sql.startswith('ALTER TABLE'):
+            table, name = [part.strip('`') for part in sql.split()[2:6:3]]
+            if 'ADD COLUMN' in sql:
+                self.db.columns.add((table, name))
+            else:
+                self.db.indexes.add((table, name))
+        elif sql.startswith('CREATE TABLE IF NOT EXISTS log_message'):
+            self.db.columns.add(('log_message', 'time'))
+        elif sql.startswith('EXPLAIN'):
+            table = sql.split(' FROM ')[1].split()[0]
+            keys = ','.join([name for t, name in self.db.indexes if t == table]) or None
+            self.result = [{'table': table, 'possible_keys': keys, 'key': None}]
+        else:
+            self.result = []
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+        self.versions = []
+        self.indexes = {('current', 'idx_current_authorid')}
+        # 旧版数据库：缺少user.email及log_message表
+        self.columns = set()
+        for step in migrate.MIGRATIONS[0][2]:
+            if step[0] == 'index' and step[1] != 'log_message':
+                self.columns.update([(step[1], column) for column in step[3] if column != 'email'])
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+
+class TestMigrate(unittest.TestCase):
+    def test_upgrade(self):
+        cnx = FakeConnection()
+        self.assertListEqual(migrate.check(cnx), [
+            't_current.search_mine(reviewer)', 't_history.search(authorid)',
+            't_history.search(reviewerid)', 't_user.fetch_by_email', 't_user.pop'])
+        self.assertEqual(migrate.upgrade(cnx), 2)
+        altered = [sql for sql in cnx.executed if sql.startswith('ALTER TABLE')]
+        # 补充缺少的列和表后创建所有索引，已存在的索引跳过
+        self.assertEqual(len([sql for sql in altered if 'ADD COLUMN' in sql]), 1)
+        self.assertEqual(len([sql for sql in altered if 'ADD INDEX' in sql]), 9)
+        self.assertIn(('user', 'idx_user_email'), cnx.indexes)
+        self.assertIn(('log_message', 'idx_log_message_time'), cnx.indexes)
+        self.assertEqual(len([sql for sql in cnx.executed if sql.startswith('CREATE TABLE IF NOT EXISTS user_alias')]), 1)
+        self.assertListEqual(migrate.check(cnx), [])
+        # 重复执行时不再修改
+        cnx.executed.clear()
+        self.assertEqual(migrate.upgrade(cnx), 2)
+        self.assertFalse([sql for sql in cnx.executed if sql.startswith('ALTER TABLE')])
+        self.assertListEqual(cnx.versions, [1, 2])
+
+    def test_missing_columns(self):
+        cnx = FakeConnection()
+        cnx.columns.discard(('history', 'end'))
+        # 索引的列不存在时迁移失败，版本不被记录，下次启动时重试
+        with self.assertRaises(RuntimeError):
+            migrate.upgrade(cnx)
+        self.assertListEqual(cnx.versions, [])
+        self.assertTrue(cnx.executed[-1].startswith('SELECT RELEASE_LOCK'))
+        cnx.columns.add(('history', 'end'))
+        self.assertEqual(migrate.upgrade(cnx), 2)
+        self.assertIn(('history', 'idx_history_end'), cnx.indexes)
+
+
+if __name__ == '__main__':
+    unittest.main()
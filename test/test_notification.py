@@ -0,0 +1,35 @@
+import unittest
+from RM import notification
+
+RECORD = {
+    'id': 1, 'authorid': 'user01', 'authorname': '张三', 'reviewerid': 'user02', 'reviewername': '李四',
+    'start': 1700000000, 'end': 1700100000, 'pages': 12, 'urgent': False, 'company': '某公司',
+    'names': {'A1': '项目一', 'B2': '项目二'},
+}
+
+
+class TestNotification(unittest.TestCase):
+    def test_render(self):
+        warnings = []
+        context = notification.build_context(RECORD, warnings, author={'phone': '13800000000'})
+        messages = notification.render('finish', context)
+        self.assertEqual(messages['mail']['subject'], '[报告完成审核] A1+B2')
+        self.assertIn('  - A1：项目一\r\n  - B2：项目二\r\n', messages['mail']['content'])
+        self.assertIn('- @13800000000 <- 李四', messages['dingtalk']['content'])
+        self.assertTrue(messages['wxwork']['content'].endswith('· 张三 <- 李四'))
+        # 渲染时读取context中的warnings
+        warnings.append('加密失败："a.docx"')
+        messages = notification.render('finish', context, ('mail', 'wxwork'))
+        self.assertListEqual(sorted(messages), ['mail', 'wxwork'])
+        self.assertTrue(messages['wxwork']['content'].endswith('\n\nWarnings:\n· 加密失败："a.docx"'))
+        self.assertNotIn('Warnings', messages['mail']['content'])
+
+    def test_without_user(self):
+        context = notification.build_context({**RECORD, 'id': 'x', 'end': None}, [])
+        messages = notification.render('submit', context)
+        self.assertIn('- 张三 -> @李四', messages['dingtalk']['content'])
+        self.assertEqual(messages['wxwork']['subject'], '')
+
+
+if __name__ == '__main__':
+    unittest.main()
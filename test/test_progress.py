@@ -0,0 +1,44 @@
+import unittest
+from test.fakes import fake_stream
+
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        self.stream = fake_stream()
+
+    def test_track(self):
+        self.stream.publish_progress('1-0', 'extracting')
+        # Worker已开始处理时不覆盖进度
+        self.stream.track_progress('1-0', 'user01')
+        self.assertEqual(self.stream.progress_owner('1-0'), 'user01')
+        self.assertEqual(self.stream.progress_owner('2-0'), '')
+        events = self.stream.listen_progress('1-0', timeout=0)
+        self.assertEqual(next(events)['state'], 'extracting')
+
+    def test_listen(self):
+        self.stream.track_progress('1-0', 'user01')
+        events = self.stream.listen_progress('1-0', timeout=60, heartbeat=0)
+        self.assertEqual(next(events)['state'], 'queued')
+        self.assertIsNone(next(events))
+        self.stream.publish_progress('1-0', 'sending', 'A+B')
+        self.stream.publish_progress('1-0', 'done')
+        self.assertEqual(next(events)['detail'], 'A+B')
+        self.assertEqual(next(events)['state'], 'done')
+        with self.assertRaises(StopIteration):
+            next(events)
+        self.assertListEqual(self.stream._r.subscribed, [])
+        # 已结束的指令仅返回最新进度
+        self.assertListEqual(
+            [event['state'] for event in self.stream.listen_progress('1-0')], ['done'])
+
+    def test_no_initial_heartbeat(self):
+        self.stream.track_progress('1-0', 'user01')
+        events = self.stream.listen_progress('1-0', timeout=60, heartbeat=60)
+        self.assertEqual(next(events)['state'], 'queued')
+        # 订阅确认不应产生心跳
+        self.stream.publish_progress('1-0', 'done')
+        self.assertEqual(next(events)['state'], 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import os
+import json
+import tempfile
+from RM import rules
+
+
+class FakeRange:
+    def __init__(self, text):
+        self.Text = text
+
+
+class FakeItems:
+    ''' 模拟COM集合，调用时返回元素并计数
+    '''
+
+    def __init__(self, items, counter):
+        self._items = items
+        self._counter = counter
+        self.Count = len(items)
+
+    def __call__(self, index):
+        self._counter.append(index)
+        return self._items[index - 1]
+
+
+class FakeTable:
+    def __init__(self, rows: list[list[str]], counter):
+        self._rows = rows
+        self._counter = counter
+        self.Rows = FakeItems(rows, [])
+
+    def Cell(self, row, column):
+        self._counter.append((row, column))
+        return type('Cell', (), {'Range': FakeRange(self._rows[row - 1][column - 1] + '\r\x07')})
+
+
+class FakeDocument:
+    ''' 模拟win32com打开的Document，记录段落和单元格的读取次数
+    '''
+
+    def __init__(self, paragraphs: list[str], tables: list[list[list[str]]]):
+        self.paragraph_reads = []
+        self.cell_reads = []
+        self.Paragraphs = FakeItems(
+            [type('Paragraph', (), {'Range': FakeRange(text + '\r')}) for text in paragraphs],
+            self.paragraph_reads,
+        )
+        self.Tables = FakeItems(
+            [FakeTable(rows, self.cell_reads) for rows in tables], [])
+
+
+class TestRules(unittest.TestCase):
+    def setUp(self):
+        self.rules = rules.load()
+
+    def test_match(self):
+        self.assertEqual(self.rules.match('报告编号：SHTEC2022PRO0264-1'), 'SHTEC2022PRO0264-1')
+        self.assertEqual(self.rules.match('SHTEC2022XXX0264'), '')
+        self.assertEqual(self.rules.report_type('SHTEC2021DSYS0685'), 'DSYS')
+
+    def test_extract_cell(self):
+        document = FakeDocument(
+            ['', 'SHTEC2022PRO0264'],
+            [[['项目名称', '沪台通 云平台'], ['委托单位', '中共上海市委台湾工作办公室']]],
+        )
+        reader = rules.Reader(document)
+        code = self.rules.find_code(reader)
+        self.assertEqual(code, 'SHTEC2022PRO0264')
+        self.assertTupleEqual(
+            self.rules.extract(reader, code), ('沪台通云平台', '中共上海市委台湾工作办公室'))
+
+    def test_extract_paragraphs(self):
+        document = FakeDocument(
+            ['SHTEC2022FUN0012', '系统名称：浦东新区数字档案馆系统', '委托单位：上海市浦东新区档案局'], [])
+        reader = rules.Reader(document)
+        self.assertTupleEqual(
+            self.rules.extract(reader, self.rules.find_code(reader)),
+            ('浦东新区数字档案馆系统', '上海市浦东新区档案局'),
+        )
+        # 每个段落只读取一次
+        self.assertEqual(len(document.paragraph_reads), len(set(document.paragraph_reads)))
+
+    def test_extract_rows_once(self):
+        document = FakeDocument(
+            ['SHTEC2022SRV0037'],
+            [[['报告名称', '优待证信息预采集系统'], ['被测单位', '上海市退役军人事务局'], ['其他', '']]],
+        )
+        reader = rules.Reader(document)
+        self.assertTupleEqual(
+            self.rules.extract(reader, 'SHTEC2022SRV0037'),
+            ('优待证信息预采集系统', '上海市退役军人事务局'),
+        )
+        self.assertEqual(len(document.cell_reads), len(set(document.cell_reads)))
+
+    def test_extract_rows_in_paragraphs(self):
+        # word的Paragraphs中也包含表格单元格，标签单元格不能作为段落结果
+        document = FakeDocument(
+            ['SHTEC2022SRV0037', '报告名称\x07', '优待证信息预采集系统\x07', '被测单位\x07', '上海市退役军人事务局\x07'],
+            [[['报告名称', '优待证信息预采集系统'], ['被测单位', '上海市退役军人事务局']]],
+        )
+        self.assertTupleEqual(
+            self.rules.extract(rules.Reader(document), 'SHTEC2022SRV0037'),
+            ('优待证信息预采集系统', '上海市退役军人事务局'),
+        )
+        # 无表格时从带冒号的段落中读取
+        document = FakeDocument(
+            ['SHTEC2022SRV0037', '报告名称', '报告名称：优待证信息预采集系统', '被测单位：上海市退役军人事务局'], [])
+        self.assertTupleEqual(
+            self.rules.extract(rules.Reader(document), 'SHTEC2022SRV0037'),
+            ('优待证信息预采集系统', '上海市退役军人事务局'),
+        )
+
+    def test_template(self):
+        self.assertEqual(self.rules.template('SHTEC2022PST0184'),
+                         'RD-XT13测评报告审核、签发意见单-PROPST.docx')
+        self.assertEqual(self.rules.template('SHTEC2022PCT0001'), '')
+
+    def test_load_custom(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'rules.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'types': {'APP': {
+                    'name': [{'strategy': 'cell', 'table': 1, 'row': 1, 'column': 2}],
+                    'template': 'APP.docx',
+                }}}, f)
+            custom = rules.load(path)
+        self.assertEqual(custom.match('SHTEC2023APP0001'), 'SHTEC2023APP0001')
+        self.assertEqual(custom.template('SHTEC2023APP0001'), 'APP.docx')
+        self.assertEqual(custom.match('SHTEC2023DSYS0001'), 'SHTEC2023DSYS0001')
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            rules.Rules({'pattern': '(', 'types': {}})
+        with self.assertRaises(ValueError):
+            rules.Rules({'pattern': '{types}', 'types': {'A': {'name': [{'strategy': 'xpath'}]}}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import unittest
+import os
+import errno
+import time
+import tempfile
+from unittest import mock
+from RM import storage
+
+
+class TestPromote(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.temp_dir.name, 'src')
+        self.dst = os.path.join(self.temp_dir.name, 'dst')
+        os.makedirs(os.path.join(self.src, 'sub'))
+        os.mkdir(self.dst)
+        for name, size in [('a.docx', 10), (os.path.join('sub', 'b.rar'), 20), ('~$a.docx', 1), ('c.eml', 5)]:
+            with open(os.path.join(self.src, name), 'wb') as fp:
+                fp.write(b'0' * size)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_promote_rename(self):
+        ret = storage.promote(self.src, self.dst, ['*.docx', '*.rar'], ['~$*'])
+        self.assertEqual(ret['moved'], 30)
+        self.assertEqual(ret['copied'], 0)
+        self.assertListEqual(sorted(os.listdir(self.dst)), ['a.docx', 'b.rar'])
+        self.assertFalse(os.path.exists(os.path.join(self.src, 'a.docx')))
+        self.assertTrue(os.path.exists(os.path.join(self.src, 'c.eml')))
+
+    def test_promote_cross_device(self):
+        with mock.patch('RM.storage.os.replace', side_effect=OSError(errno.EXDEV, 'cross-device')):
+            ret = storage.promote(self.src, self.dst, ['*.docx'], ['~$*'])
+        self.assertEqual(ret['copied'], 10)
+        self.assertEqual(ret['moved'], 0)
+        self.assertTrue(os.path.exists(os.path.join(self.dst, 'a.docx')))
+        self.assertFalse(os.path.exists(os.path.join(self.src, 'a.docx')))
+
+
+class TestStorageIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.storage = self.temp_dir.name
+        for name in ['1700000000.1_user01_A+B', '1700000100.2_user02_A+B', '1700000200.3_user01_C', '1700000300.4_user03_']:
+            os.makedirs(os.path.join(self.storage, 'temp', name))
+        os.makedirs(os.path.join(self.storage, 'archive', 'A+B'))
+        self.index = storage.StorageIndex(os.path.join(self.storage, 'index.db'))
+
+    def tearDown(self):
+        self.index._conn.close()
+        self.temp_dir.cleanup()
+
+    def test_rebuild_latest(self):
+        self.assertEqual(self.index.rebuild(self.storage), 5)
+        self.assertEqual(
+            os.path.basename(self.index.latest('temp', 'A+B')), '1700000100.2_user02_A+B')
+        self.assertEqual(len(self.index.find('temp', 'A+B')), 2)
+        self.assertEqual(
+            self.index.latest('archive', 'A+B'), os.path.join(self.storage, 'archive', 'A+B'))
+        self.assertIsNone(self.index.latest('archive', 'C'))
+
+    def test_latest_skips_missing(self):
+        self.index.rebuild(self.storage)
+        path = os.path.join(self.storage, 'temp', '1700000400.5_user01_A+B')
+        self.index.add('temp', path, 'A+B', 'user01', 1700000400.5)
+        self.assertEqual(
+            os.path.basename(self.index.latest('temp', 'A+B')), '1700000100.2_user02_A+B')
+        self.assertNotIn(path, self.index.find('temp', 'A+B'))
+
+    def test_touch(self):
+        self.assertIsNone(self.index.accessed('A+B'))
+        self.index.touch('A+B', 1700000000)
+        self.index.rebuild(self.storage)
+        self.assertEqual(self.index.accessed('A+B'), 1700000000)
+
+
+class TestBlobStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.storage = self.temp_dir.name
+        self.blobs = storage.BlobStore(self.storage)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_project(self, codes, files):
+        work_path = os.path.join(self.storage, codes)
+        os.mkdir(work_path)
+        for name, content in files.items():
+            with open(os.path.join(work_path, name), 'wb') as fp:
+                fp.write(content)
+        return work_path
+
+    def test_commit_dedup_checkout(self):
+        self.blobs.commit(self.make_project('A', {'a.docx': b'report', 'XT13.docx': b'shared'}), 'A')
+        manifest = self.blobs.commit(self.make_project('B', {'b.docx': b'other', 'XT13.docx': b'shared'}), 'B')
+        self.assertEqual(len(manifest['files']), 2)
+        blob_count = sum([len(files) for _, _, files in os.walk(os.path.join(self.storage, 'blobs'))])
+        self.assertEqual(blob_count, 3)
+        target_path = os.path.join(self.storage, 'checkout')
+        os.mkdir(target_path)
+        self.blobs.checkout('A', target_path)
+        with open(os.path.join(target_path, 'a.docx'), 'rb') as fp:
+            self.assertEqual(fp.read(), b'report')
+        with self.assertRaises(FileNotFoundError):
+            self.blobs.checkout('C', target_path)
+
+    def test_gc(self):
+        self.blobs.commit(self.make_project('A', {'a.docx': b'old'}), 'A')
+        self.blobs.commit(self.make_project('A2', {'a.docx': b'new'}), 'A')
+        self.assertEqual(self.blobs.gc(grace=3600), (0, 0))
+        self.assertEqual(self.blobs.gc(grace=-1), (1, 3))
+        self.assertEqual(self.blobs.manifest('A')['files'][0]['size'], 3)
+
+    def test_freeze_thaw(self):
+        self.blobs.commit(self.make_project('A', {'a.docx': b'report', 'XT13.docx': b'shared'}), 'A')
+        self.blobs.commit(self.make_project('B', {'XT13.docx': b'shared'}), 'B')
+        cold_path = os.path.join(self.storage, 'cold')
+        os.mkdir(cold_path)
+        self.blobs.freeze('A', cold_path)
+        self.assertEqual(self.blobs.manifest('A')['tier'], 'cold')
+        # 仅释放冷存储项目独占的文件
+        self.assertEqual(self.blobs.gc(grace=-1), (1, 6))
+        target_path = os.path.join(self.storage, 'checkout')
+        os.mkdir(target_path)
+        self.blobs.checkout('A', target_path)
+        with open(os.path.join(target_path, 'a.docx'), 'rb') as fp:
+            self.assertEqual(fp.read(), b'report')
+        self.assertEqual(self.blobs.manifest('A')['tier'], 'hot')
+        self.assertListEqual(os.listdir(cold_path), [])
+
+    def test_adopt(self):
+        archive_path = os.path.join(self.storage, 'archive')
+        for codes in ['A', 'B', 'C']:
+            os.makedirs(os.path.join(archive_path, codes))
+            with open(os.path.join(archive_path, codes, 'a.docx'), 'wb') as fp:
+                fp.write(codes.encode())
+        os.mkdir(os.path.join(archive_path, 'B', 'sub'))
+        self.blobs.commit(self.make_project('C2', {'c.docx': b'new'}), 'C')
+        mtime = time.time() - 100 * 86400
+        os.utime(os.path.join(archive_path, 'A'), (mtime, mtime))
+        # 包含子目录及已有清单的项目跳过
+        self.assertListEqual(self.blobs.adopt(archive_path), [('A', mtime)])
+        self.assertListEqual(sorted(os.listdir(archive_path)), ['B', 'C'])
+        self.assertEqual(self.blobs.manifest('A')['files'][0]['size'], 1)
+        self.assertEqual(self.blobs.manifest('C')['files'][0]['name'], 'c.docx')
+        self.assertListEqual(self.blobs.adopt(archive_path), [])
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.storage = self.temp_dir.name
+        self.index = storage.StorageIndex(os.path.join(self.storage, 'index.db'))
+        for name, age, size in [
+            ('1_user01_', 30, 10),  # 处理失败的邮件，已过期
+            ('2_user01_A', 30, 20),  # 进行中的项目
+            ('3_user02_B', 2, 40),  # 已完成的项目，未过期
+            ('4_user03_', 1, 80),  # 处理失败的邮件，未过期
+        ]:
+            path = os.path.join(self.storage, 'temp', name)
+            os.makedirs(path)
+            with open(os.path.join(path, 'a.docx'), 'wb') as fp:
+                fp.write(b'0' * size)
+            mtime = time.time() - age * 86400
+            os.utime(path, (mtime, mtime))
+        self.index.rebuild(self.storage)
+
+    def tearDown(self):
+        self.index._conn.close()
+        self.temp_dir.cleanup()
+
+    def test_sweep_age(self):
+        ret = storage.sweep(self.storage, self.index, {'A'}, max_age=7 * 86400)
+        self.assertListEqual([os.path.basename(path) for path in ret['removed']], ['1_user01_'])
+        self.assertEqual(ret['reclaimed'], 10)
+        self.assertEqual(ret['usage'], 140)
+
+    def test_sweep_quota(self):
+        ret = storage.sweep(self.storage, self.index, {'A'}, max_age=7 * 86400, quota=100)
+        self.assertListEqual(
+            [os.path.basename(path) for path in ret['removed']], ['1_user01_', '3_user02_B'])
+        self.assertEqual(ret['usage'], 100)
+        self.assertListEqual(self.index.find('temp', 'B'), [])
+        self.assertTrue(os.path.isdir(os.path.join(self.storage, 'temp', '2_user01_A')))
+
+
+if __name__ == '__main__':
+    unittest.main()
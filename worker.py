@@ -3,16 +3,23 @@ import os
 import sys
 import logging
 import logging.config
+import atexit
 import shutil
 import datetime
 from time import sleep
-from walkdir import filtered_walk, file_paths, dir_paths
+from walkdir import filtered_walk, file_paths
 
 from RM import mysql, document, notification, validator
+from RM.alert import Alerter
 from RM.archive import Archive
+from RM.delivery import Planner
+from RM.docjob import DocumentClient
 from RM.dingtalk import Dingtalk
+from RM.dispatcher import Dispatcher
+from RM.http import HTTPClient
 from RM.mail import Mail
 from RM.redis import RedisStream
+from RM.storage import BlobStore, StorageIndex, promote, sweep
 from RM.wxwork import WXWork
 from RM.types import *
 
@@ -27,7 +34,8 @@ def init(config):
     storage = config.get("path", "storage", fallback="storage")
     # 自动创建目录结构
     for check_dir in [
-        os.path.join(storage, child_dir) for child_dir in ["temp", "archive"]
+        os.path.join(storage, child_dir)
+        for child_dir in ["temp", "archive", "outbox", "download", "checkout"]
     ]:
         if os.path.isdir(check_dir):
             continue
@@ -85,6 +93,26 @@ def init(config):
         dict_config["handlers"]["file"]["level"],
     )
 
+    # ---目录索引---
+    global index
+    index = StorageIndex(os.path.join(storage, "index.db"))
+    if not index.count():
+        index.rebuild(storage)
+
+    # ---归档存储---
+    global blobs, cold_days, cold_path, adopt_limit
+    blobs = BlobStore(storage)
+    cold_days = config.getint("storage", "cold_days", fallback=0)
+    adopt_limit = config.getint("storage", "adopt_limit", fallback=50)
+    cold_path = config.get("storage", "cold_path", fallback="") or os.path.join(
+        storage, "cold"
+    )
+    if cold_days and not os.path.isdir(cold_path):
+        os.makedirs(cold_path)
+    global temp_days, temp_quota
+    temp_days = config.getint("storage", "temp_days", fallback=14)
+    temp_quota = config.getint("storage", "temp_quota", fallback=0) * 1048576
+
     # ---mysql---
     mysql.init(
         user=config.get("mysql", "user", fallback="rm"),
@@ -100,6 +128,8 @@ def init(config):
         host=config.get("redis", "host", fallback="127.0.0.1"),
         password=config.get("redis", "pass", fallback="rm"),
     )
+    # current、user表变更时递增数据版本，使manage的响应缓存失效
+    mysql.on_change(lambda table: stream.bump("data"))
 
     # ---mail---
     global mail
@@ -119,12 +149,29 @@ def init(config):
         "ssl": config.getboolean("smtp", "ssl", fallback=False),
         "tls": config.getboolean("smtp", "tls", fallback=False),
     }
+    imap_config = None
+    if config.get("imap", "host", fallback=""):
+        imap_config = {
+            "username": config.get("imap", "user", fallback="rm@example.com"),
+            "password": config.get("imap", "pass", fallback="rm"),
+            "host": config.get("imap", "host", fallback="example.com"),
+            "port": config.getint("imap", "port", fallback=143),
+            "ssl": config.getboolean("imap", "ssl", fallback=False),
+            "tls": config.getboolean("imap", "tls", fallback=False),
+        }
     mail = Mail(
         pop3_config,
         smtp_config,
         config.get("mail", "domain", fallback="example.com"),
         config.get("mail", "manager", fallback=""),
+        imap_config,
     )
+    if config.getboolean("mail", "outbox", fallback=False):
+        mail.enable_outbox(
+            stream,
+            config.getint("mail", "outbox_attempts", fallback=5),
+            config.getint("mail", "outbox_backoff", fallback=30),
+        )
 
     # ---archive---
     global archive
@@ -138,6 +185,40 @@ def init(config):
     }
     archive = Archive(bin_path, config.get("archive", "pass", fallback=""))
 
+    # ---document---
+    # 配置文档服务时，COM操作（读取文档、加密）交由docservice.py执行
+    global docs
+    docs = document
+    if config.getboolean("document", "remote", fallback=False):
+        docs = DocumentClient(
+            stream, storage, config.getint("document", "timeout", fallback=360)
+        )
+
+    # ---notification---
+    global dispatcher
+    dispatcher = Dispatcher()
+
+    # ---delivery---
+    global planner
+    planner = Planner(
+        archive,
+        storage,
+        config.getint("mail", "size_limit", fallback=0) * 1048576,
+        config.getint("mail", "max_parts", fallback=5),
+        config.get("mail", "link_url", fallback=""),
+        config.get("mail", "link_secret", fallback=""),
+        config.getint("mail", "link_ttl", fallback=72),
+    )
+
+    # ---http---
+    global http_client
+    http_client = HTTPClient(
+        connect_timeout=config.getfloat("http", "connect_timeout", fallback=3.05),
+        read_timeout=config.getfloat("http", "read_timeout", fallback=10),
+        retries=config.getint("http", "retries", fallback=2),
+        pool_size=config.getint("http", "pool_size", fallback=10),
+    )
+
     # ---dingtalk---
     global dingtalk
     chatbot = {
@@ -153,6 +234,7 @@ def init(config):
         chatbot_debug,
         config.get("dingtalk", "attend", fallback=""),
         config.get("dingtalk", "interaction", fallback=""),
+        http_client,
     )
 
     # ---wxwork---
@@ -162,8 +244,115 @@ def init(config):
         config.getint("wxwork", "agentid", fallback=0),
         config.get("wxwork", "secret", fallback=""),
         config.get("wxwork", "admin_userid", fallback=""),
+        http_client,
+        config.get("wxwork", "base_url", fallback=""),
+        stream.token_broker(
+            "wxwork:{}:{}".format(
+                config.get("wxwork", "corpid", fallback=""),
+                config.get("wxwork", "agentid", fallback="0"),
+            )
+        ),
     )
 
+    # ---alert---
+    global alerter
+    alerter = Alerter(
+        dingtalk,
+        wxwork,
+        window=config.getint("alert", "window", fallback=60),
+        cooldown=config.getint("alert", "cooldown", fallback=300),
+        rate=config.getint("alert", "rate", fallback=2),
+        to_stdout=debug,
+    )
+    atexit.register(alerter.flush)
+
+
+# 当前处理中的指令（由用户发起时），用于推送处理进度
+progress_entry = ""
+
+
+def report_progress(state: str, detail: str = ""):
+    """向发起当前指令的用户推送处理进度（manage通过/api/progress转发）
+
+    Args:
+        state: extracting / archiving / sending / done / error
+        detail: 说明
+    """
+    logger = logging.getLogger(__name__)
+    if not progress_entry:
+        return
+    try:
+        stream.publish_progress(progress_entry, state, detail)
+    except Exception:
+        logger.warning("publish_progress failed", exc_info=True)
+
+
+def watch_mail():
+    """IMAP IDLE监听入口，新邮件到达时向receive中插入一条指令（source=imap）"""
+    logger = logging.getLogger(__name__)
+    while True:
+        try:
+            if mail.wait():
+                stream.add(source="imap", name="receive")
+        except Exception:
+            logger.error("mail.wait() failed", exc_info=True)
+            sleep(60)
+
+
+def run_sender():
+    """outbox发送入口，在后台线程中循环发送队列中的邮件"""
+    logger = logging.getLogger(__name__)
+    while True:
+        try:
+            mail.process_outbox(to_stdout=debug)
+        except Exception:
+            logger.error("mail.process_outbox() failed", exc_info=True)
+            sleep(60)
+
+
+def deliver(
+    recipient: str,
+    message: Built_Message,
+    delivery: Delivery,
+    needs_cc: bool = False,
+    log: bool = True,
+) -> list[Message_Log]:
+    """按投递规划发送邮件：分卷时逐封发送并在主题后追加(i/n)，使用下载链接时将链接附在正文后
+
+    Args:
+        recipient: 收件人
+        message: 邮件主题及正文
+        delivery: planner.plan()的返回
+        needs_cc: 是否抄送
+        log: 是否写入log_message；为False时由调用方（如dispatcher）批量写入
+
+    Returns:
+        发送日志
+    """
+    logger = logging.getLogger(__name__)
+    logger.debug("args: %s", {"recipient": recipient, "delivery": delivery})
+    content = message["content"]
+    if delivery["links"]:
+        content += "\n\n附件超过邮件大小限制，请在{}小时内下载：\n{}".format(
+            planner.link_ttl(), "\n".join(delivery["links"])
+        )
+    logs: list[Message_Log] = []
+    total = len(delivery["parts"])
+    for idx, part in enumerate(delivery["parts"], start=1):
+        logs += mail.send(
+            recipient,
+            message["subject"] + (f" ({idx}/{total})" if total > 1 else ""),
+            content,
+            part["attachments"],
+            to_stdout=debug,
+            needs_cc=needs_cc,
+            cleanup=[part["path"]] if part["path"] else None,
+            log=False,
+        )
+    if log and logs:
+        mysql.t_log.add_messages(logs)
+    return logs
+
 
 def do_mail(parsed_mail: Parsed_Mail):
     """邮件处理入口，功能包括：
@@ -186,6 +375,7 @@ def do_mail(parsed_mail: Parsed_Mail):
     #   未从附件中读取到有效文档
     # 错误时直接终止处理
     check_result = {"warnings": [], "content": {}, "attachment": {}}
+    report_progress("extracting", parsed_mail["subject"])
     try:
         ret = validator.check_mail_content(
             parsed_mail["from_"],
@@ -206,7 +396,9 @@ def do_mail(parsed_mail: Parsed_Mail):
             else:
                 os.remove(archive_path)
         #   未从附件中读取到有效文档
-        ret = validator.check_mail_attachment(attachments_path, parsed_mail["operator"])
+        ret = validator.check_mail_attachment(
+            attachments_path, parsed_mail["operator"], docs
+        )
         check_result["attachment"] = ret["attachment"]
         check_result["warnings"] += ret["warnings"]
     except Exception as err:
@@ -216,15 +408,7 @@ def do_mail(parsed_mail: Parsed_Mail):
             else "unknown"
         )
         logger.error("do_mail(%s) failed.", user_id, exc_info=True)
-        dingtalk.send_markdown(
-            "[RM] 处理异常", f"({user_id}) {err}", to_debug=True, to_stdout=debug
-        )
-        wxwork.send_text(
-            f"({user_id}) {err}",
-            [],
-            to_debug=True,
-            to_stdout=debug,
-        )
+        alerter.report("do_mail", err, user_id)
         raise
     else:
         # Step 2: 进行数据库操作、发送通知步骤
@@ -308,83 +492,64 @@ def handle_submit(
         logger.debug("record: %s", record)
         logger.info('(submit) "%s" -> "%s"', record["authorid"], record["reviewerid"])
         codes = "+".join(sorted(record["names"]))
-        # 生成XT13
-        for code, project_name in record["names"].items():
-            # 已有XT13时不再重复生成
-            if os.path.exists(
-                os.path.join(attachments_path, f"RD-XT13测评报告审核、签发意见单{code}.docx")
-            ):
-                continue
-            document.gen_XT13(
-                record["authorname"],
-                code,
-                project_name,
-                os.path.join(attachments_path, f"RD-XT13测评报告审核、签发意见单{code}.docx"),
-            )
+        report_progress("archiving", codes)
+        # 生成XT13，已有XT13时不再重复生成
+        document.gen_XT13_batch(record["authorname"], record["names"], attachments_path)
         # 清理文件并重命名文件夹
+        timestamp = datetime.datetime.now().timestamp()
         new_work_path = os.path.join(
             storage,
             "temp",
-            "{}_{}_{}".format(
-                datetime.datetime.now().timestamp(),
-                record["authorid"],
-                codes,
-            ),
+            "{}_{}_{}".format(timestamp, record["authorid"], codes),
         )
         logger.info("new work_path: %s", new_work_path)
         os.mkdir(new_work_path)
-        for file_path in file_paths(
-            filtered_walk(
-                attachments_path,
-                included_files=["*.doc", "*.docx", "*.rar", "*.zip", "*.7z"],
-                excluded_files=["~$*"],
-            )
-        ):
-            shutil.copy(file_path, new_work_path)
-            logger.info('copied "%s"', os.path.basename(file_path))
+        promote(
+            attachments_path,
+            new_work_path,
+            included_files=["*.doc", "*.docx", "*.rar", "*.zip", "*.7z"],
+            excluded_files=["~$*"],
+        )
+        index.add("temp", new_work_path, codes, record["authorid"], timestamp)
         shutil.rmtree(work_path)
-        # 发送邮件及通知
-        archive_path = os.path.join(new_work_path, f"{codes}.rar")
-        if not archive.archive(new_work_path, archive_path):
-            warnings.append(f'压缩失败："{os.path.basename(new_work_path)}"')
-            attachments = list(file_paths(filtered_walk(new_work_path)))
-        else:
-            attachments = [archive_path]
-        message = notification.build_submit_mail(record, warnings)
-        mail.send(
-            mysql.t_user.fetch(record["reviewerid"])["email"],
-            message["subject"],
-            message["content"],
-            attachments,
-            to_stdout=debug,
+        # 并发发送邮件及通知
+        report_progress("sending", codes)
+        delivery = planner.plan(new_work_path, codes, warnings)
+        reviewer = mysql.t_user.fetch(record["reviewerid"])
+        messages = notification.render(
+            "submit", notification.build_context(record, warnings, reviewer=reviewer)
         )
-        if os.path.exists(archive_path):
-            os.remove(archive_path)
-        message = notification.build_submit_dingtalk(record, warnings)
-        dingtalk.send_markdown(
-            message["subject"],
-            message["content"],
-            mysql.t_user.fetch(record["reviewerid"])["phone"],
+        batch = dispatcher.batch()
+        batch.submit(
+            "mail",
+            deliver,
+            reviewer["email"],
+            messages["mail"],
+            delivery,
+            log=False,
+        )
+        batch.submit(
+            "dingtalk",
+            dingtalk.send_markdown,
+            messages["dingtalk"]["subject"],
+            messages["dingtalk"]["content"],
+            reviewer["phone"],
             to_stdout=debug,
+            log=False,
         )
-        message = notification.build_submit_wxwork(record, warnings)
-        wxwork.send_text(
-            message["content"],
+        batch.submit(
+            "wxwork",
+            wxwork.send_text,
+            messages["wxwork"]["content"],
             [record["authorid"], record["reviewerid"]],
             to_stdout=debug,
+            log=False,
         )
+        batch.wait()
     except Exception as err:
         user_id = content["user_id"]
         logger.error("handle_submit(%s) failed.", user_id, exc_info=True)
-        dingtalk.send_markdown(
-            "[RM] 处理异常", f"({user_id}) {err}", to_debug=True, to_stdout=debug
-        )
-        wxwork.send_text(
-            f"({user_id}) {err}",
-            [],
-            to_debug=True,
-            to_stdout=debug,
-        )
+        alerter.report("handle_submit", err, user_id)
         raise
 
 
@@ -425,80 +590,79 @@ def handle_finish(
         logger.debug("record: %s", record)
         logger.info('(finish) "%s" <- "%s"', record["authorid"], record["reviewerid"])
         codes = "+".join(sorted(record["names"]))
+        report_progress("archiving", codes)
         # 将文件移动至archive中，重名时清除上一条记录
         new_work_path = os.path.join(storage, "archive", codes)
         logger.info("new work_path: %s", new_work_path)
         if os.path.isdir(new_work_path):
             shutil.rmtree(new_work_path)
         os.mkdir(new_work_path)
-        for file_path in file_paths(
-            filtered_walk(
-                attachments_path,
-                included_files=["*.doc", "*.docx", "*.rar", "*.zip", "*.7z"],
-                excluded_files=["~$*"],
-            )
-        ):
-            shutil.copy(file_path, new_work_path)
-            logger.info('copied "%s"', os.path.basename(file_path))
+        promote(
+            attachments_path,
+            new_work_path,
+            included_files=["*.doc", "*.docx", "*.rar", "*.zip", "*.7z"],
+            excluded_files=["~$*"],
+        )
+        index.add("archive", new_work_path, codes, record["authorid"])
         # 清理并同时删除temp中的提交审核记录
         shutil.rmtree(work_path)
-        for dir_path in dir_paths(
-            filtered_walk(
-                os.path.join(storage, "temp"),
-                included_dirs=["*" + codes],
-                depth=1,
-                min_depth=1,
-            )
-        ):
-            shutil.rmtree(dir_path)
-        # 发送邮件及通知
-        archive_path = os.path.join(new_work_path, f"{codes}.rar")
-        if not archive.archive(new_work_path, archive_path):
-            warnings.append(f'压缩失败："{os.path.basename(new_work_path)}"')
-            attachments = list(file_paths(filtered_walk(new_work_path)))
-        else:
-            attachments = [archive_path]
-        message = notification.build_finish_mail(record, warnings)
-        mail.send(
-            mysql.t_user.fetch(record["authorid"])["email"],
-            message["subject"],
-            message["content"],
-            attachments,
-            to_stdout=debug,
+        for dir_path in index.find("temp", codes):
+            shutil.rmtree(dir_path, ignore_errors=True)
+            index.remove(dir_path)
+        # 发送邮件的同时加密文件，钉钉及企业微信通知需包含加密结果
+        report_progress("sending", codes)
+        delivery = planner.plan(new_work_path, codes, warnings)
+        author = mysql.t_user.fetch(record["authorid"])
+        context = notification.build_context(record, warnings, author=author)
+        batch = dispatcher.batch()
+        batch.submit(
+            "mail",
+            deliver,
+            author["email"],
+            notification.render("finish", context, ("mail",))["mail"],
+            delivery,
             needs_cc=True,
+            log=False,
         )
-        if os.path.exists(archive_path):
-            os.remove(archive_path)
-        # 加密文件
-        for document_path in file_paths(
-            filtered_walk(new_work_path, included_files=["*.doc", "*.docx"])
-        ):
-            document.encrypt(document_path)
-        message = notification.build_finish_dingtalk(record, warnings)
-        dingtalk.send_markdown(
-            message["subject"],
-            message["content"],
-            mysql.t_user.fetch(record["authorid"])["phone"],
+        # 加密文件，使用同一个Word实例批量处理
+        for document_path, encrypted in docs.encrypt_batch(
+            list(
+                file_paths(
+                    filtered_walk(new_work_path, included_files=["*.doc", "*.docx"])
+                )
+            )
+        ).items():
+            if not encrypted:
+                warnings.append(f'加密失败："{os.path.basename(document_path)}"')
+        # 存入归档存储，相同内容的文件只保存一份
+        blobs.commit(new_work_path, codes)
+        shutil.rmtree(new_work_path)
+        index.remove(new_work_path)
+        index.touch(codes)
+        # 加密结果已追加至warnings，context中引用同一列表
+        messages = notification.render("finish", context, ("dingtalk", "wxwork"))
+        batch.submit(
+            "dingtalk",
+            dingtalk.send_markdown,
+            messages["dingtalk"]["subject"],
+            messages["dingtalk"]["content"],
+            author["phone"],
             to_stdout=debug,
+            log=False,
         )
-        message = notification.build_finish_wxwork(record, warnings)
-        wxwork.send_text(
-            message["content"],
+        batch.submit(
+            "wxwork",
+            wxwork.send_text,
+            messages["wxwork"]["content"],
             [record["authorid"], record["reviewerid"]],
             to_stdout=debug,
+            log=False,
         )
+        batch.wait()
     except Exception as err:
         user_id = content["user_id"]
         logger.error("handle_finish(%s) failed.", user_id, exc_info=True)
-        dingtalk.send_markdown(
-            "[RM] 处理异常", f"({user_id}) {err}", to_debug=True, to_stdout=debug
-        )
-        wxwork.send_text(
-            f"({user_id}) {err}",
-            [],
-            to_debug=True,
-            to_stdout=debug,
-        )
+        alerter.report("handle_finish", err, user_id)
         raise
 
 
@@ -524,30 +688,20 @@ def do_resend(id: str | int, redirect: str = ""):
         redirect = ""
 
     codes = "+".join(sorted(record["names"]))
-    # 搜索最新的文件记录
-    work_path = list(
-        dir_paths(
-            filtered_walk(
-                os.path.join(
-                    storage, "temp" if isinstance(record["id"], str) else "archive"
-                ),
-                included_dirs=[f"*{codes}"],
-                depth=1,
-                min_depth=1,
-            )
-        )
-    )[-1]
-    logger.info("found path: %s", work_path)
 
     # 对于current中获取的target，重发[分配审核]
     if isinstance(record["id"], str):
-        resend_notification = notification.build_submit_mail(record, [])
+        resend_notification = notification.render(
+            "submit", notification.build_context(record, []), ("mail",)
+        )["mail"]
         resend_notification["subject"] = "(resend) " + resend_notification["subject"]
         to = redirect if redirect else record["reviewerid"]
         logger.info('resending "%s" (分配审核) to "%s"', codes, to)
     # 对于history中获取的target，重发[完成审核]
     else:
-        resend_notification = notification.build_finish_mail(record, [])
+        resend_notification = notification.render(
+            "finish", notification.build_context(record, []), ("mail",)
+        )["mail"]
         resend_notification["subject"] = "(resend) " + resend_notification["subject"]
         to = redirect if redirect else record["authorid"]
         logger.info('resending "%s" (完成审核) to "%s"', codes, to)
@@ -555,21 +709,37 @@ def do_resend(id: str | int, redirect: str = ""):
     if not target_user:
         raise ValueError("invalid arg: redirect")
 
-    # 发送并清理临时文件
-    archive_path = os.path.join(work_path, f"{codes}.rar")
-    if not archive.archive(work_path, archive_path):
-        attachments = list(file_paths(filtered_walk(work_path)))
+    # 完成审核的项目从归档存储中还原；旧版归档目录及提交审核的项目从索引中查找最新的文件记录
+    report_progress("archiving", codes)
+    checkout_path = ""
+    if isinstance(record["id"], int) and blobs.manifest(codes):
+        checkout_path = os.path.join(
+            storage,
+            "checkout",
+            "{}_{}".format(datetime.datetime.now().timestamp(), codes),
+        )
+        os.mkdir(checkout_path)
+        blobs.checkout(codes, checkout_path)
+        index.touch(codes)
+        work_path = checkout_path
     else:
-        attachments = [archive_path]
-    mail.send(
-        target_user["email"],
-        resend_notification["subject"],
-        resend_notification["content"],
-        attachments,
-        to_stdout=debug,
-    )
-    if os.path.exists(archive_path):
-        os.remove(archive_path)
+        area = "temp" if isinstance(record["id"], str) else "archive"
+        work_path = index.latest(area, codes)
+        if not work_path:
+            index.rebuild(storage)
+            work_path = index.latest(area, codes)
+        if not work_path:
+            raise FileNotFoundError(f"no files for {codes}")
+    logger.info("found path: %s", work_path)
+
+    # 发送并清理临时文件
+    try:
+        delivery = planner.plan(work_path, codes, [])
+    finally:
+        if checkout_path:
+            shutil.rmtree(checkout_path)
+    report_progress("sending", codes)
+    deliver(target_user["email"], resend_notification, delivery)
 
     # 重发[完成审核]时，必要时通知原作者
     if isinstance(record["id"], int) and to != record["authorid"]:
@@ -580,6 +750,65 @@ def do_resend(id: str | int, redirect: str = ""):
         wxwork.send_text(msg, to=[record["authorid"]], to_stdout=debug)
 
 
+def do_maintain():
+    """存储维护入口（由attend定时任务触发），功能包括：
+
+    1. 清理temp中的孤立目录并检查配额，清理过期的下载链接
+    2. 将旧版归档目录导入归档存储，将超过{cold_days}天未访问的归档项目压缩至冷存储
+    3. 清理归档存储中未被引用的文件
+    """
+    logger = logging.getLogger(__name__)
+    active_codes = set(
+        [
+            "+".join(sorted(record["names"]))
+            for record in mysql.t_current.search(page_size=9999)["current"]
+        ]
+    )
+    swept = sweep(storage, index, active_codes, temp_days * 86400, temp_quota)
+    planner.purge()
+    if cold_days:
+        # 旧版归档目录先导入归档存储，访问时间取原目录的修改时间
+        archive_path = os.path.join(storage, "archive")
+        for codes, mtime in blobs.adopt(archive_path, adopt_limit):
+            index.remove(os.path.join(archive_path, codes))
+            if index.accessed(codes) is None:
+                index.touch(codes, mtime)
+        deadline = datetime.datetime.now().timestamp() - cold_days * 86400
+        for manifest in blobs.manifests():
+            if manifest.get("tier", "hot") != "hot":
+                continue
+            accessed = index.accessed(manifest["codes"]) or manifest["timestamp"]
+            if accessed < deadline:
+                try:
+                    blobs.freeze(manifest["codes"], cold_path)
+                except Exception:
+                    logger.warning(
+                        'freeze "%s" failed', manifest["codes"], exc_info=True
+                    )
+    count, reclaimed = blobs.gc()
+    logger.info("blobs reclaimed: %s (%.1fMB)", count, reclaimed / 1048576)
+    for key, item in http_client.metrics().items():
+        logger.info(
+            "http %s: count=%s errors=%s retries=%s avg=%.1fms max=%.1fms",
+            key,
+            item["count"],
+            item["errors"],
+            item["retries"],
+            item["total_ms"] / item["count"],
+            item["max_ms"],
+        )
+    if swept["removed"] or count:
+        wxwork.send_text(
+            "- [存储维护] -\n\n"
+            f"temp: 清理{len(swept['removed'])}个目录，释放{swept['reclaimed'] / 1048576:.1f}MB，"
+            f"当前占用{swept['usage'] / 1048576:.1f}MB\n"
+            f"blobs: 清理{count}个文件，释放{reclaimed / 1048576:.1f}MB",
+            [],
+            to_debug=True,
+            to_stdout=debug,
+        )
+
+
 if __name__ == "__main__":
     from configparser import ConfigParser
 
@@ -588,11 +817,23 @@ if __name__ == "__main__":
     init(config)
 
     import socket
+    import threading
 
     logger = logging.getLogger("main")
     logger.warning('Worker "%s" initiated.', socket.gethostname())
 
+    # 启用IMAP时，在后台线程中保持IDLE连接，实时触发邮件处理
+    if mail.idle_able():
+        threading.Thread(target=watch_mail, name="watch_mail", daemon=True).start()
+        logger.info("IMAP IDLE watcher started.")
+    # 启用outbox时，在后台线程中发送邮件，邮件处理不再等待SMTP
+    if config.getboolean("mail", "outbox", fallback=False):
+        threading.Thread(target=run_sender, name="run_sender", daemon=True).start()
+        logger.info("outbox sender started.")
+
     while True:
+        # 每轮等待前检查SMTP会话，保持长连接可用
+        mail.keepalive()
         # 默认阻塞当前进程，直到队列中出现可用的对象
         logger.debug("waiting stream")
         entries = []
@@ -612,6 +853,9 @@ if __name__ == "__main__":
                         message_fields,
                     )
                     text = f"- [任务结果] -\n\n信息: [邮件处理]完成\nID: {message_id}"
+                    failed = False
+                    if message_fields.get("source", "") not in ["cron", "imap"]:
+                        progress_entry = message_id
                     try:
                         keywords = {}
                         keywords["submit"] = message_fields.get("submit", "[提交审核]")
@@ -627,13 +871,20 @@ if __name__ == "__main__":
                             try:
                                 do_mail(parsed_mail)
                             except Exception as err:
+                                failed = True
                                 text += f"\n错误信息: {err}"
                     except Exception as err:
                         logger.error(err, exc_info=True)
+                        failed = True
                         text += f"\n错误信息: {err}"
                     finally:
+                        report_progress("error" if failed else "done", text)
+                        progress_entry = ""
                         stream.ack("receive", message_id)
-                        if message_fields.setdefault("source", "") != "cron":
+                        if message_fields.setdefault("source", "") not in [
+                            "cron",
+                            "imap",
+                        ]:
                             wxwork.send_text(text, [message_fields["source"]])
                         mysql.disconnect()
             elif stream_entries[0] == "read":
@@ -645,6 +896,9 @@ if __name__ == "__main__":
                         message_fields,
                     )
                     text = f"- [任务结果] -\n\n信息: [邮件处理(本地)]完成\n编号: {message_id}"
+                    failed = False
+                    if message_fields.get("source", "") != "cron":
+                        progress_entry = message_id
                     try:
                         temp_path = os.path.join(
                             storage,
@@ -657,8 +911,11 @@ if __name__ == "__main__":
                         do_mail(parsed_mail)
                     except Exception as err:
                         logger.error(err, exc_info=True)
+                        failed = True
                         text += f"\n错误信息: {err}"
                     finally:
+                        report_progress("error" if failed else "done", text)
+                        progress_entry = ""
                         stream.ack("read", message_id)
                         if message_fields.setdefault("source", "") != "cron":
                             wxwork.send_text(text, [message_fields["source"]])
@@ -672,6 +929,9 @@ if __name__ == "__main__":
                         message_fields,
                     )
                     text = f"- [任务结果] -\n\n信息: [重发邮件]完成\n编号: {message_id}"
+                    failed = False
+                    if message_fields.get("source", "") != "cron":
+                        progress_entry = message_id
                     try:
                         record_id = (
                             int(message_fields["id"])
@@ -681,11 +941,29 @@ if __name__ == "__main__":
                         do_resend(record_id, message_fields.setdefault("redirect", ""))
                     except Exception as err:
                         logger.error(err, exc_info=True)
+                        failed = True
                         text += f"\n错误信息: {err}"
                     finally:
+                        report_progress("error" if failed else "done", text)
+                        progress_entry = ""
                         stream.ack("resend", message_id)
                         if message_fields.setdefault("source", "") != "cron":
                             wxwork.send_text(text, [message_fields["source"]])
                         mysql.disconnect()
+            elif stream_entries[0] == "maintain":
+                for message_id, message_fields in stream_entries[1]:
+                    logger.debug(
+                        'new item in "%s": (%s) %s',
+                        stream_entries[0],
+                        message_id,
+                        message_fields,
+                    )
+                    try:
+                        do_maintain()
+                    except Exception as err:
+                        logger.error(err, exc_info=True)
+                    finally:
+                        stream.ack("maintain", message_id)
+                        mysql.disconnect()
             else:
                 logger.debug("invalid stream_entries: %s", stream_entries)